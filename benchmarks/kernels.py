@@ -0,0 +1,100 @@
+"""Corpus of representative kernels for the runtime benchmarks.
+
+Every entry of KERNELS is an undecorated python function and a tuple of
+arguments it is timed with. The benchmarks compile the function themselves so
+that the same source is measured both interpreted and compiled.
+"""
+
+
+def return_const() -> float:
+    return 10.0
+
+
+def return_var(x: float) -> float:
+    return x
+
+
+def return_mult(x: float) -> float:
+    return 2.0 * x * x
+
+
+def return_normalized(low: float, high: float, z: float) -> float:
+    x1 = low
+    y1 = 0.0
+
+    x2 = high
+    y2 = 1.0
+
+    m = (y2 - y1) / (x2 - x1)
+    b = y1 - (m * x1)
+
+    return m * z + b
+
+
+def lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+
+def horner5(x: float) -> float:
+    return ((((0.5 * x + 1.5) * x - 2.0) * x + 0.25) * x - 3.0) * x + 1.0
+
+
+def rational(x: float, y: float) -> float:
+    return (x * x + 2.0 * y) / (1.0 + x * y) - (x - y) / (x + y)
+
+
+def slope_sum(x1: float, x2: float, y1: float, y2: float) -> float:
+    return (y2 - y1) / (x2 - x1) + (y2 - y1) * (x2 - x1)
+
+
+def kinetic(m1: float, v1: float, m2: float, v2: float) -> float:
+    return 0.5 * m1 * v1 * v1 + 0.5 * m2 * v2 * v2
+
+
+def clamp(x: float, lo: float, hi: float) -> float:
+    if x < lo:
+        x = lo
+    elif x > hi:
+        x = hi
+    return x
+
+
+def safe_div(a: float, b: float) -> float:
+    if b == 0.0:
+        return 0.0
+    return a / b
+
+
+def spring(k: float, x: float) -> float:
+    return 0.5 * k * x**2
+
+
+def inverse_square(m: float, r: float) -> float:
+    return m * r**-1 * r**-1
+
+
+def root_sum_square(x: float, y: float) -> float:
+    return (x**2 + y**2) ** 0.5
+
+
+def cube(x: float) -> float:
+    return x**3 - x**5 / 20.0
+
+
+KERNELS = {
+    "return_const": (return_const, ()),
+    "return_var": (return_var, (3.0,)),
+    "return_mult": (return_mult, (3.0,)),
+    "return_normalized": (return_normalized, (-1.0, 1.0, 0.25)),
+    "lerp": (lerp, (1.0, 3.0, 0.25)),
+    "horner5": (horner5, (0.75,)),
+    "rational": (rational, (1.5, 0.5)),
+    "slope_sum": (slope_sum, (1.0, 3.0, 2.0, 6.0)),
+    "kinetic": (kinetic, (1.0, 2.0, 3.0, 4.0)),
+    "clamp": (clamp, (1.5, -1.0, 1.0)),
+    "safe_div": (safe_div, (1.0, 4.0)),
+    "spring": (spring, (2.0, 0.75)),
+    "inverse_square": (inverse_square, (3.0, 1.5)),
+    "root_sum_square": (root_sum_square, (3.0, 4.0)),
+    "cube": (cube, (0.5,)),
+}
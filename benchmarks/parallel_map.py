@@ -0,0 +1,62 @@
+"""Scaling benchmark for `PyObject_ExecMem.parallel_map`.
+
+Maps a compiled kernel over buffers of doubles with 1 to N worker threads and
+reports the throughput and speedup relative to a single worker.
+
+    python benchmarks/parallel_map.py --elements 4000000 --max-workers 8
+"""
+
+from pycc import pycc
+
+import os
+import time
+import array
+import argparse
+import statistics
+
+
+@pycc.compile
+def normalized(low: float, high: float, z: float) -> float:
+    m = (1.0 - 0.0) / (high - low)
+    b = 0.0 - (m * low)
+    return m * z + b
+
+
+def time_map(n_workers: int, out, low, high, z, repeat: int):
+    # Warm up the thread pool and the map stub
+    normalized.parallel_map(out, low, high, z, workers=n_workers)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        normalized.parallel_map(out, low, high, z, workers=n_workers)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=2_000_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    n = args.elements
+    low = array.array("d", [-1.0]) * n
+    high = array.array("d", [1.0]) * n
+    z = array.array("d", [i / n for i in range(n)])
+    out = array.array("d", [0.0]) * n
+
+    print(f"{'workers':>8} {'seconds':>10} {'Melem/s':>10} {'speedup':>8}")
+    baseline = None
+    for n_workers in range(1, args.max_workers + 1):
+        seconds = time_map(n_workers, out, low, high, z, args.repeat)
+        baseline = baseline or seconds
+        print(
+            f"{n_workers:>8} {seconds:>10.4f} {n / seconds / 1e6:>10.1f} "
+            f"{baseline / seconds:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
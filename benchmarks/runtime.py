@@ -0,0 +1,250 @@
+"""Runtime benchmark suite comparing compiled kernels with CPython.
+
+For every kernel of benchmarks/kernels.py the plain python function and its
+pycc compiled counterpart are timed:
+
+  call    per call latency of calling the function from python, and the
+          overhead of a compiled call over its bare ctypes function
+  batch   throughput over buffers, a python loop against the native map loop
+  native  the compiled kernel alone, called from a native loop, in cycles and
+          nanoseconds per call, see pycc.latency
+
+Each measurement is warmed up and repeated, the samples are summarized by
+their min, median, mean and standard deviation. The report is JSON with a
+fixed layout and sorted keys so that reports of two commits can be diffed or
+compared with --compare.
+
+    python benchmarks/runtime.py --output head.json
+    python benchmarks/runtime.py --compare base.json --threshold 1.10
+
+With --fast-math the kernels are compiled with pycc.compile(fast_math=True),
+matches_python then only holds when the rounding did not change. With
+--dependent the native calls are chained through their first argument and
+measure the latency of the kernel rather than its throughput.
+
+The run fails when the median overhead of a compiled call over its ctypes
+function exceeds --max-overhead nanoseconds, the bookkeeping of a call must
+stay cheap next to the call itself.
+"""
+
+from kernels import KERNELS
+from pycc import pycc
+from pycc import latency
+
+import sys
+import json
+import array
+import timeit
+import argparse
+import platform
+import contextlib
+import statistics
+
+"""Version of the report layout, bumped when the layout changes"""
+REPORT_VERSION = 4
+
+
+def summarize(samples):
+    """Statistical summary of timing samples in nanoseconds"""
+    return {
+        "min": round(min(samples), 3),
+        "median": round(statistics.median(samples), 3),
+        "mean": round(statistics.fmean(samples), 3),
+        "stdev": round(statistics.stdev(samples) if len(samples) > 1 else 0.0, 3),
+        "samples": len(samples),
+    }
+
+
+def time_call(func, args, number: int, repeat: int, warmup: int):
+    """Nanoseconds per call of func(*args)"""
+    timer = timeit.Timer("func(*args)", globals={"func": func, "args": args})
+    timer.timeit(warmup)
+    return [seconds * 1e9 / number for seconds in timer.repeat(repeat, number)]
+
+
+def time_batch(run, elements: int, repeat: int, warmup: int):
+    """Nanoseconds per element of run(), which processes `elements` items"""
+    timer = timeit.Timer(run)
+    timer.timeit(warmup)
+    return [seconds * 1e9 / elements for seconds in timer.repeat(repeat, 1)]
+
+
+def benchmark_kernel(func, args, options):
+    compiled = pycc.compile(func, fast_math=options.fast_math)
+
+    expected = func(*args)
+    result = {
+        "arguments": list(args),
+        "matches_python": compiled(*args) == expected,
+        "call": {},
+        "batch": {},
+    }
+
+    targets = [("python", func), ("pycc", compiled)]
+    # Dispatchers have no single ctypes function
+    if hasattr(compiled, "to_call"):
+        targets.append(("ctypes", compiled.to_call))
+    for name, target in targets:
+        samples = time_call(
+            target, args, options.number, options.repeat, options.warmup
+        )
+        result["call"][name] = {"ns_per_call": summarize(samples)}
+        result["call"][name]["calls_per_second"] = round(
+            1e9 / statistics.median(samples), 1
+        )
+
+    n = options.elements
+    buffers = [array.array("d", [float(arg)]) * n for arg in args]
+    out = array.array("d", [0.0]) * n
+
+    def run_python():
+        out[:] = array.array("d", map(func, *buffers) if buffers else [func()] * n)
+
+    def run_pycc():
+        compiled.parallel_map(out, *buffers, workers=1)
+
+    for name, run in (("python", run_python), ("pycc", run_pycc)):
+        samples = time_batch(run, n, options.repeat, 1)
+        result["batch"][name] = {"ns_per_element": summarize(samples)}
+        result["batch"][name]["elements_per_second"] = round(
+            1e9 / statistics.median(samples), 1
+        )
+
+    for section, unit in (("call", "ns_per_call"), ("batch", "ns_per_element")):
+        python = result[section]["python"][unit]["median"]
+        native = result[section]["pycc"][unit]["median"]
+        result[section]["speedup"] = round(python / native, 3)
+    if "ctypes" in result["call"]:
+        result["call"]["overhead_ns"] = round(
+            result["call"]["pycc"]["ns_per_call"]["median"]
+            - result["call"]["ctypes"]["ns_per_call"]["median"],
+            3,
+        )
+
+    # Kernels without arguments have nothing to chain
+    native = latency.measure(
+        compiled,
+        *args,
+        calls=options.number,
+        repeat=options.repeat,
+        dependent=options.dependent and len(args) > 0,
+    )
+    result["native"] = {
+        name: round(value, 3) if isinstance(value, float) else value
+        for name, value in native.items()
+    }
+
+    return result
+
+
+def compare(report, baseline, threshold: float) -> bool:
+    """Print the ratio of each compiled median to the baseline. Returns True
+    when no kernel became slower than `threshold` times the baseline."""
+    ok = True
+    print(f"{'kernel':<20} {'call':>8} {'batch':>8} {'cycles':>16}")
+    for name, result in report["kernels"].items():
+        if not name in baseline["kernels"]:
+            continue
+        base = baseline["kernels"][name]
+        ratios = []
+        for section, unit in (("call", "ns_per_call"), ("batch", "ns_per_element")):
+            ratio = (
+                result[section]["pycc"][unit]["median"]
+                / base[section]["pycc"][unit]["median"]
+            )
+            ratios.append(ratio)
+            ok = ok and ratio <= threshold
+        # Cycles of short kernels are close to zero, they are not compared
+        # as a ratio but shown side by side
+        cycles = ""
+        if "native" in base:
+            cycles = (
+                f"{base['native']['cycles_per_call']:.1f} -> "
+                f"{result['native']['cycles_per_call']:.1f}"
+            )
+        print(f"{name:<20} {ratios[0]:>8.3f} {ratios[1]:>8.3f} {cycles:>16}")
+    return ok
+
+
+def check_overhead(report, max_overhead: float) -> bool:
+    """Print the kernels whose compiled calls add more than `max_overhead`
+    nanoseconds to their ctypes function. Returns True when there are none."""
+    ok = True
+    for name, result in report["kernels"].items():
+        overhead = result["call"].get("overhead_ns")
+        if overhead is not None and overhead > max_overhead:
+            print(
+                f"{name}: a compiled call adds {overhead:.1f} ns to its ctypes "
+                f"function, more than {max_overhead:.1f} ns",
+                file=sys.stderr,
+            )
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kernels", help="comma separated subset of the corpus")
+    parser.add_argument("--number", type=int, default=20_000, help="calls per sample")
+    parser.add_argument("--repeat", type=int, default=7, help="samples per measurement")
+    parser.add_argument("--warmup", type=int, default=2_000, help="warmup calls")
+    parser.add_argument("--elements", type=int, default=100_000, help="batch size")
+    parser.add_argument("--output", help="write the report to this file")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.10)
+    parser.add_argument(
+        "--max-overhead",
+        type=float,
+        default=1000.0,
+        help="nanoseconds a compiled call may add to its ctypes function",
+    )
+    parser.add_argument("--fast-math", action="store_true", help="compile with fast math")
+    parser.add_argument(
+        "--dependent", action="store_true", help="chain the native calls to measure latency"
+    )
+    options = parser.parse_args()
+
+    names = options.kernels.split(",") if options.kernels else list(KERNELS)
+
+    # Compiler output goes to stderr so that the JSON report may be piped
+    with contextlib.redirect_stdout(sys.stderr):
+        kernels = {name: benchmark_kernel(*KERNELS[name], options) for name in names}
+
+    report = {
+        "version": REPORT_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "parameters": {
+            "number": options.number,
+            "repeat": options.repeat,
+            "warmup": options.warmup,
+            "elements": options.elements,
+            "fast_math": options.fast_math,
+            "dependent": options.dependent,
+            "max_overhead": options.max_overhead,
+        },
+        "kernels": kernels,
+    }
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as fp:
+            fp.write(text + "\n")
+    elif not options.compare:
+        print(text)
+
+    ok = check_overhead(report, options.max_overhead)
+    if options.compare:
+        with open(options.compare) as fp:
+            baseline = json.load(fp)
+        ok = compare(report, baseline, options.threshold) and ok
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
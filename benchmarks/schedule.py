@@ -0,0 +1,107 @@
+"""Micro-benchmark of the x86-64 list scheduler.
+
+Compiles each kernel with and without IRSchedulerX64 and reports the cycles
+estimated by the latency tables for every cpu along with the measured time per
+element when the kernel is mapped over a buffer by the native map loop.
+
+    python benchmarks/schedule.py --elements 2000000
+"""
+
+from pycc import execmem
+from pycc.pycc import assemble
+from pycc.py2ir import Py2IR
+from pycc.ssair.iroptimizer import IROptimizer
+from pycc.ssair.irassembler_x64 import IRAssemblerX64
+from pycc.ssair.irscheduler_x64 import IRSchedulerX64
+from pathlib import Path
+
+import ast
+import time
+import array
+import inspect
+import argparse
+import tempfile
+import textwrap
+import statistics
+
+
+def return_normalized(low: float, high: float, z: float) -> float:
+    m = (1.0 - 0.0) / (high - low)
+    b = 0.0 - (m * low)
+    return m * z + b
+
+
+def mul_chain_then_divide(a: float, b: float, c: float) -> float:
+    return c * c * c * c * c * a + a / b
+
+
+def two_divisions(a: float, b: float, c: float) -> float:
+    x = a * b * c * a * b
+    return x + (a / b) / c
+
+
+KERNELS = [return_normalized, mul_chain_then_divide, two_divisions]
+
+
+def lower(func):
+    py2ir = Py2IR(inspect.getfile(func))
+    ir = py2ir.visit(ast.parse(textwrap.dedent(inspect.getsource(func))))
+    return IROptimizer(ir).ir, py2ir.cdef
+
+
+def build(func, schedule: bool) -> execmem.PyObject_ExecMem:
+    ir, cdef = lower(func)
+    ir_assembler = IRAssemblerX64(ir, schedule=schedule)
+    ir_assembler.assemble()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        base_name = Path(tmp_dir) / func.__name__
+        code = assemble(ir_assembler.asmx64.gen_gnu_as(), base_name)
+    obj = execmem.PyObject_ExecMem()
+    obj.inject(code, cdef)
+    return obj
+
+
+def time_per_element(kernel, buffers, out, repeat: int) -> float:
+    kernel.parallel_map(out, *buffers, workers=1)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        kernel.parallel_map(out, *buffers, workers=1)
+        timings.append(time.perf_counter_ns() - start)
+    return statistics.median(timings) / len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    n = args.elements
+    buffers = [
+        array.array("d", [-1.0]) * n,
+        array.array("d", [1.0 + i / n for i in range(n)]),
+        array.array("d", [i / n for i in range(n)]),
+    ]
+    out = array.array("d", [0.0]) * n
+
+    cpus = sorted(IRSchedulerX64.LATENCY_TABLES)
+    header = f"{'kernel':<24}" + "".join(f"{cpu:>16}" for cpu in cpus)
+    print(header + f"{'ns/elem':>18}")
+    for func in KERNELS:
+        ir, _ = lower(func)
+        row = f"{func.__name__:<24}"
+        for cpu in cpus:
+            scheduler = IRSchedulerX64(ir, cpu)
+            before = scheduler.estimate_cycles()
+            after = scheduler.estimate_cycles(scheduler.schedule())
+            row += f"{before:>7.1f} -> {after:>5.1f}"
+
+        unscheduled = time_per_element(build(func, False), buffers, out, args.repeat)
+        scheduled = time_per_element(build(func, True), buffers, out, args.repeat)
+        row += f"{unscheduled:>8.2f} -> {scheduled:>5.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Micro-benchmark of the superword level parallelism pass.
+
+Compiles each kernel with and without IRVectorizerX64 and reports the packs,
+shuffles and the measured time per element when the kernel is mapped over
+buffers by the native map loop.
+
+    python benchmarks/vectorize.py --elements 2000000
+"""
+
+from pycc import execmem
+from pycc.pycc import assemble
+from pycc.py2ir import Py2IR
+from pycc.ssair.iroptimizer import IROptimizer
+from pycc.ssair.irassembler_x64 import IRAssemblerX64
+from pathlib import Path
+
+import ast
+import time
+import array
+import random
+import inspect
+import argparse
+import tempfile
+import textwrap
+import statistics
+
+
+def slopes(x1: float, x2: float, y1: float, y2: float, z1: float, z2: float) -> float:
+    return (y2 - y1) / (x2 - x1) + (z2 - z1) / (x2 - x1)
+
+
+def wide(a: float, b: float, c: float, d: float) -> float:
+    return (a * 1.5 + 2.0) / (b * 0.5 + 1.0) + (c * 2.5 + 3.0) / (d * 1.5 + 2.0)
+
+
+def rational(x: float, y: float) -> float:
+    return (x * x + 2.0 * y) / (1.0 + x * y) - (x - y) / (x + y)
+
+
+def kinetic(m1: float, v1: float, m2: float, v2: float) -> float:
+    return 0.5 * m1 * v1 * v1 + 0.5 * m2 * v2 * v2
+
+
+KERNELS = [slopes, wide, rational, kinetic]
+
+
+def build(func, vectorize: bool):
+    py2ir = Py2IR(inspect.getfile(func))
+    ir = py2ir.visit(ast.parse(textwrap.dedent(inspect.getsource(func))))
+    ir_assembler = IRAssemblerX64(IROptimizer(ir).ir, vectorize=vectorize)
+    ir_assembler.assemble()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        base_name = Path(tmp_dir) / func.__name__
+        code = assemble(ir_assembler.asmx64.gen_gnu_as(), base_name)
+    obj = execmem.PyObject_ExecMem()
+    obj.inject(code, py2ir.cdef)
+    return obj, ir_assembler.vectorizer.stats
+
+
+def time_per_element(kernel, buffers, out, repeat: int) -> float:
+    kernel.parallel_map(out, *buffers, workers=1)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        kernel.parallel_map(out, *buffers, workers=1)
+        timings.append(time.perf_counter_ns() - start)
+    return statistics.median(timings) / len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    n = args.elements
+    random.seed(45)
+    out = array.array("d", [0.0]) * n
+
+    print(f"{'kernel':<12}{'packs':>8}{'gathers':>10}{'extracts':>10}{'ns/elem':>20}")
+    for func in KERNELS:
+        n_args = len(inspect.signature(func).parameters)
+        buffers = [
+            array.array("d", [random.uniform(1.0, 2.0) for _ in range(n)])
+            for _ in range(n_args)
+        ]
+        scalar, _ = build(func, False)
+        packed, stats = build(func, True)
+        before = time_per_element(scalar, buffers, out, args.repeat)
+        after = time_per_element(packed, buffers, out, args.repeat)
+        print(
+            f"{func.__name__:<12}{stats['packs']:>8}{stats['gathers']:>10}"
+            f"{stats['extracts']:>10}{before:>11.2f} -> {after:>5.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,137 @@
+from pycc.libm import GOT_PLACEHOLDER
+
+import math
+import struct
+
+
 class AsmX64:
 
     def __init__(self):
         self.double_consts = {}
+        self.float_consts = {}
+        # Pairs of doubles loaded into both lanes by packed instructions
+        self.double_pair_consts = {}
         self.instrs = []
+        # Packed code reads constants as 16 byte aligned pairs of equal lanes
+        self.packed_consts = False
+        # Symbols called through the import table, see pycc.libm
+        self.imports = []
 
     def gen_gnu_as(self):
         """Compiles the generated assembly into a gnu assembler file"""
 
         s_file = "# pycc compiled for x86_64\n\n"
         s_file += ".section .rodata\n"
+        lanes = 2 if self.packed_consts else 1
         for key, value in self.double_consts.items():
-            s_file += "\t" + value + ":" + " .double " + str(key) + "\n"
+            (double,) = struct.unpack("<d", key)
+            if self.packed_consts:
+                s_file += "\t.balign 16\n"
+            if math.isfinite(double):
+                s_file += "\t" + value + ":" + " .double " + ", ".join([repr(double)] * lanes) + "\n"
+            else:
+                # Emit the exact bit pattern of infinities and nans
+                (bits,) = struct.unpack("<Q", key)
+                s_file += "\t" + value + ":" + " .quad " + ", ".join([hex(bits)] * lanes) + "\n"
+        for key, value in self.double_pair_consts.items():
+            # Emitted by bit pattern, packed operands are 16 byte aligned
+            low, high = struct.unpack("<QQ", key)
+            s_file += "\t.balign 16\n"
+            s_file += "\t" + value + ":" + " .quad " + hex(low) + ", " + hex(high) + "\n"
+        for key, value in self.float_consts.items():
+            # Keyed by the bit pattern of the rounded value
+            (bits,) = struct.unpack("<I", key)
+            s_file += "\t" + value + ":" + " .long " + hex(bits) + "\n"
         s_file += "\n"
 
+        if self.imports:
+            s_file += '.section .pycc_got,"aw"\n'
+            s_file += "\t.balign 8\n"
+            for import_idx, symbol in enumerate(self.imports):
+                placeholder = hex(GOT_PLACEHOLDER + import_idx)
+                s_file += f"\t__PYCC_GOT_{symbol}: .quad {placeholder}\n"
+            s_file += "\n"
+
         s_file += ".section .text\n"
         s_file += ".global _start\n"
         s_file += "_start:\n"
         for instruction in self.instrs:
+            if instruction[0].endswith(":"):
+                s_file += instruction[0] + "\n"
+                continue
             s_file += "\t" + instruction[0] + " " + ",".join(instruction[1:]) + "\n"
         return s_file
 
     def double_const(self, value):
-        if value in self.double_consts:
-            return self.double_consts[value] + "(%rip)"
+        # Constants are keyed by their bit pattern, 0.0 and -0.0 compare equal
+        # as python floats but are different constants
+        key = struct.pack("<d", float(value))
+        if key in self.double_consts:
+            return self.double_consts[key] + "(%rip)"
         else:
             asm_const_name = f"__PYCC_INTERNAL_DOUBLE_C{len(self.double_consts)}"
-            self.double_consts[value] = asm_const_name
+            self.double_consts[key] = asm_const_name
             return asm_const_name + "(%rip)"
 
+    def double_pair_const(self, low, high):
+        """A 16 byte constant holding `low` in the low lane and `high` in the
+        high lane"""
+        key = struct.pack("<dd", float(low), float(high))
+        if not key in self.double_pair_consts:
+            self.double_pair_consts[key] = f"__PYCC_INTERNAL_DOUBLE_PAIR_C{len(self.double_pair_consts)}"
+        return self.double_pair_consts[key] + "(%rip)"
+
+    def float_const(self, value):
+        """A single precision constant, `value` rounded to nearest. Emitted
+        by bit pattern like the infinities and nans of the doubles."""
+        try:
+            key = struct.pack("<f", float(value))
+        except OverflowError:
+            # struct refuses to round finite doubles out of range to infinity
+            key = struct.pack("<f", math.copysign(math.inf, value))
+        if not key in self.float_consts:
+            self.float_consts[key] = f"__PYCC_INTERNAL_FLOAT_C{len(self.float_consts)}"
+        return self.float_consts[key] + "(%rip)"
+
+    def got_entry(self, symbol):
+        """The import table entry holding the address of `symbol`"""
+        if not symbol in self.imports:
+            self.imports.append(symbol)
+        return f"__PYCC_GOT_{symbol}(%rip)"
+
+    def movss(self, src, dst):
+        self.instrs.append(("movss", src, dst))
+
+    def addss(self, src, dst):
+        self.instrs.append(("addss", src, dst))
+
+    def subss(self, src, dst):
+        self.instrs.append(("subss", src, dst))
+
+    def mulss(self, src, dst):
+        self.instrs.append(("mulss", src, dst))
+
+    def divss(self, src, dst):
+        self.instrs.append(("divss", src, dst))
+
+    def sqrtss(self, src, dst):
+        self.instrs.append(("sqrtss", src, dst))
+
+    def cvtss2sd(self, src, dst):
+        self.instrs.append(("cvtss2sd", src, dst))
+
+    def cvtsd2ss(self, src, dst):
+        self.instrs.append(("cvtsd2ss", src, dst))
+
     def movsd(self, src, dst):
         self.instrs.append(("movsd", src, dst))
 
+    def movapd(self, src, dst):
+        self.instrs.append(("movapd", src, dst))
+
+    def movupd(self, src, dst):
+        self.instrs.append(("movupd", src, dst))
+
     def mulsd(self, src, dst):
         self.instrs.append(("mulsd", src, dst))
 
@@ -43,5 +144,115 @@ class AsmX64:
     def addsd(self, src, dst):
         self.instrs.append(("addsd", src, dst))
 
+    def sqrtsd(self, src, dst):
+        self.instrs.append(("sqrtsd", src, dst))
+
+    def minsd(self, src, dst):
+        self.instrs.append(("minsd", src, dst))
+
+    def maxsd(self, src, dst):
+        self.instrs.append(("maxsd", src, dst))
+
+    def addpd(self, src, dst):
+        self.instrs.append(("addpd", src, dst))
+
+    def subpd(self, src, dst):
+        self.instrs.append(("subpd", src, dst))
+
+    def mulpd(self, src, dst):
+        self.instrs.append(("mulpd", src, dst))
+
+    def divpd(self, src, dst):
+        self.instrs.append(("divpd", src, dst))
+
+    def minpd(self, src, dst):
+        self.instrs.append(("minpd", src, dst))
+
+    def maxpd(self, src, dst):
+        self.instrs.append(("maxpd", src, dst))
+
+    def unpckhpd(self, src, dst):
+        self.instrs.append(("unpckhpd", src, dst))
+
+    def unpcklpd(self, src, dst):
+        self.instrs.append(("unpcklpd", src, dst))
+
+    def movhpd(self, src, dst):
+        self.instrs.append(("movhpd", src, dst))
+
+    def cmpsd(self, predicate, src, dst):
+        # The predicates eq, lt, le, unord, neq, nlt, nle and ord are written
+        # as cmpltsd and so on
+        self.instrs.append((f"cmp{predicate}sd", src, dst))
+
+    def andpd(self, src, dst):
+        self.instrs.append(("andpd", src, dst))
+
+    def andnpd(self, src, dst):
+        self.instrs.append(("andnpd", src, dst))
+
+    def orpd(self, src, dst):
+        self.instrs.append(("orpd", src, dst))
+
+    def vblendvpd(self, mask, src_true, src_false, dst):
+        self.instrs.append(("vblendvpd", mask, src_true, src_false, dst))
+
+    def movmskpd(self, src, dst):
+        self.instrs.append(("movmskpd", src, dst))
+
     def ret(self):
         self.instrs.append(("ret",))
+
+    def label(self, name):
+        self.instrs.append((name + ":",))
+
+    def push(self, src):
+        self.instrs.append(("push", src))
+
+    def pop(self, dst):
+        self.instrs.append(("pop", dst))
+
+    def mov(self, src, dst):
+        self.instrs.append(("mov", src, dst))
+
+    def xor(self, src, dst):
+        self.instrs.append(("xor", src, dst))
+
+    def add(self, src, dst):
+        self.instrs.append(("add", src, dst))
+
+    def shr(self, src, dst):
+        self.instrs.append(("shr", src, dst))
+
+    def shl(self, src, dst):
+        self.instrs.append(("shl", src, dst))
+
+    def sub(self, src, dst):
+        self.instrs.append(("sub", src, dst))
+
+    def inc(self, dst):
+        self.instrs.append(("inc", dst))
+
+    def cmp(self, src, dst):
+        self.instrs.append(("cmp", src, dst))
+
+    def test(self, src, dst):
+        self.instrs.append(("test", src, dst))
+
+    def jge(self, label):
+        self.instrs.append(("jge", label))
+
+    def jz(self, label):
+        self.instrs.append(("jz", label))
+
+    def jmp(self, label):
+        self.instrs.append(("jmp", label))
+
+    def call(self, target):
+        self.instrs.append(("call", target))
+
+    def rdtsc(self):
+        self.instrs.append(("rdtsc",))
+
+    def lfence(self):
+        self.instrs.append(("lfence",))
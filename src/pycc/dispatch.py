@@ -0,0 +1,162 @@
+"""Signature specializing dispatch for polymorphic functions.
+
+A function with unannotated or union annotated arguments can not be compiled
+ahead of its first call since its argument types are unknown. PyObject_Dispatcher
+compiles one specialization per signature observed at call time and keeps them
+in a small cache keyed by the tuple of python argument types.
+
+Dispatchers are pickled with their compiled specializations, the python
+function is referred to by its module and qualified name. The name of a
+decorated function is bound to the dispatcher, which is why the function can
+not be pickled as it is.
+"""
+
+from pycc.py2ir import CompilableTypes
+from types import FunctionType
+from typing import Callable, Dict
+
+import importlib
+import inspect
+import threading
+
+
+def bind_arguments(func: FunctionType, bound: Dict[str, float]) -> FunctionType:
+    """The python function `func` with the arguments in `bound` fixed, it
+    takes the remaining arguments in their order"""
+    signature = inspect.signature(func)
+    free = [arg for arg in signature.parameters if not arg in bound]
+
+    def specialized(*args):
+        return func(**bound, **dict(zip(free, args)))
+
+    specialized.__module__ = func.__module__
+    specialized.__name__ = func.__name__
+    specialized.__qualname__ = func.__qualname__
+    specialized.__doc__ = func.__doc__
+    specialized.__wrapped__ = func
+    specialized.bound = dict(bound)
+    specialized.__signature__ = signature.replace(
+        parameters=[
+            parameter
+            for parameter in signature.parameters.values()
+            if not parameter.name in bound
+        ]
+    )
+    return specialized
+
+
+def function_reference(func: FunctionType) -> tuple:
+    """The module, qualified name and bound arguments that resolve_function
+    finds `func` again by, in this or another process"""
+    wrapped = inspect.unwrap(func)
+    if "<locals>" in wrapped.__qualname__:
+        raise TypeError(
+            f"unable to pickle {wrapped.__qualname__}, only module level functions "
+            "are found by their name"
+        )
+    return wrapped.__module__, wrapped.__qualname__, getattr(func, "bound", None)
+
+
+def resolve_function(module: str, qualname: str, bound: Dict[str, float] = None) -> FunctionType:
+    """Import the python function `qualname` of `module`. A name that is
+    bound to what pycc.compile returned resolves to the function it was
+    compiled from."""
+    obj = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    func = inspect.unwrap(getattr(obj, "py_func", obj))
+    return bind_arguments(func, bound) if bound else func
+
+
+def rebuild_dispatcher(
+    reference: tuple,
+    compile_specialization: Callable,
+    max_specializations: int,
+    specializations: dict,
+) -> "PyObject_Dispatcher":
+    """Unpickle a dispatcher, its specializations are mapped without
+    compiling them again"""
+    dispatcher = PyObject_Dispatcher(
+        resolve_function(*reference), compile_specialization, max_specializations
+    )
+    dispatcher.specializations.update(specializations)
+    return dispatcher
+
+
+class PyObject_Dispatcher:
+    """Callable returned by pycc.compile for polymorphic functions.
+
+    The call path looks up the tuple of argument types in `dispatch` and calls
+    the native specialization directly. Python types that map to the same
+    ctypes signature share a specialization. Once `max_specializations`
+    signatures have been compiled, calls with new signatures run the original
+    python function and are counted in `fallback_calls`.
+    """
+
+    def __init__(
+        self,
+        func: FunctionType,
+        compile_specialization: Callable,
+        max_specializations: int = 8,
+    ):
+        self.py_func = func
+        self.name = func.__qualname__
+        self.compile_specialization = compile_specialization
+        self.max_specializations = max_specializations
+
+        # Python argument types to the compiled specialization
+        self.dispatch = {}
+
+        # ctypes signatures to the compiled specialization
+        self.specializations = {}
+        self.fallback_calls = 0
+        self.lock = threading.Lock()
+
+    def __reduce__(self):
+        # The compiled specializations are pickled by their machine code,
+        # see PyObject_ExecMem.__reduce__
+        with self.lock:
+            specializations = dict(self.specializations)
+        return (
+            rebuild_dispatcher,
+            (
+                function_reference(self.py_func),
+                self.compile_specialization,
+                self.max_specializations,
+                specializations,
+            ),
+        )
+
+    def __call__(self, *args):
+        compiled = self.dispatch.get(tuple(map(type, args)))
+        if compiled is None:
+            compiled = self.specialize(args)
+        return compiled(*args)
+
+    def specialize(self, args: tuple) -> Callable:
+        """Find or compile the specialization for the types of `args`"""
+
+        arg_types = tuple(map(type, args))
+        with self.lock:
+            if arg_types in self.dispatch:
+                return self.dispatch[arg_types]
+
+            signature = []
+            for arg_type in arg_types:
+                if not arg_type in CompilableTypes.PYTHON_TYPE_MAP:
+                    raise TypeError(
+                        f"{self.name}: unable to specialize for argument type {arg_type.__name__}"
+                    )
+                signature.append(CompilableTypes.PYTHON_TYPE_MAP[arg_type])
+            signature = tuple(signature)
+
+            compiled = self.specializations.get(signature)
+            if compiled is None:
+                if len(self.specializations) >= self.max_specializations:
+                    self.fallback_calls += 1
+                    return self.py_func
+                compiled = self.compile_specialization(self.py_func, list(signature))
+                self.specializations[signature] = compiled
+
+            self.dispatch[arg_types] = compiled
+            return compiled
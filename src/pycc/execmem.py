@@ -1,12 +1,20 @@
 """A set of helper functions to abstract away creating executable memory locations"""
 
 from pycc import ctypes_mp
+from pycc import libm
 
 import platform
+import re
 import ctypes
 import ctypes.util
 import resource
 import inspect
+import hashlib
+import time
+import threading
+import weakref
+import contextlib
+import collections
 
 
 def print_sorry():
@@ -63,6 +71,9 @@ if platform.system() == "Linux":
     ctypes.pythonapi.mprotect.restype = ctypes.c_int
     ctypes.pythonapi.mprotect.argtypes = (ctypes.c_voidp, ctypes.c_size_t, ctypes.c_int)
 
+    ctypes.pythonapi.munmap.restype = ctypes.c_int
+    ctypes.pythonapi.munmap.argtypes = (ctypes.c_voidp, ctypes.c_size_t)
+
     MMAP_PROT_READ = ctypes.c_int(0x1)
     MMAP_PROT_WRITE = ctypes.c_int(0x2)
     MMAP_PROT_EXEC = ctypes.c_int(0x4)
@@ -96,7 +107,160 @@ if platform.system() == "Linux":
             exit(1)
         return ctypes.c_voidp(mmap_ret)
 
+    def munmap_exit_on_failure(addr: ctypes.c_voidp, length: ctypes.c_size_t):
+        munmap_ret = ctypes.pythonapi.munmap(addr, length)
+        if munmap_ret == -1:
+            c_str_error = "munmap".encode("ascii")
+            ctypes.pythonapi.perror(ctypes.c_char_p(c_str_error))
+            exit(1)
+
+    class ExecMemManager:
+        """Accounting of the executable memory mapped by PyObject_ExecMem.
+
+        Mapped functions are kept in least recently used order. When a memory
+        budget is set, mapping a function evicts the coldest functions until
+        the resident executable bytes fit in the budget again. Evicted
+        functions keep their machine code and are mapped again on their next
+        call. Functions with calls in flight are never evicted.
+
+        The manager only holds weak references, a compiled function that goes
+        out of scope is unmapped by the garbage collector. Pinned functions
+        are the exception, they are held in `pinned` and never evicted.
+
+        `listeners` are called with every function once it is mapped, they are
+        used by pycc.profiling to describe the code to perf. While
+        `count_calls` is set calls are counted per function.
+        """
+
+        def __init__(self):
+            self.lock = threading.RLock()
+            self.budget = None
+            self.functions = weakref.WeakSet()
+            self.resident = collections.OrderedDict()
+            self.resident_bytes = 0
+            self.loads = 0
+            self.unloads = 0
+            self.evictions = 0
+            self.listeners = []
+            self.count_calls = False
+            # Strong references to the pinned functions by their id
+            self.pinned = {}
+
+        def mapped(self, obj: "PyObject_ExecMem"):
+            with self.lock:
+                self.functions.add(obj)
+                self.resident[id(obj)] = weakref.ref(obj)
+                self.resident_bytes += obj.size.value
+                self.loads += 1
+                for listener in self.listeners:
+                    listener(obj)
+                self.evict_over_budget(keep=obj)
+
+        def unmapped(self, obj: "PyObject_ExecMem", evicted: bool):
+            with self.lock:
+                if self.resident.pop(id(obj), None) is None:
+                    return
+                self.resident_bytes -= obj.size.value
+                if evicted:
+                    self.evictions += 1
+                else:
+                    self.unloads += 1
+
+        def evict_over_budget(self, keep: "PyObject_ExecMem" = None):
+            with self.lock:
+                if self.budget is None:
+                    return
+                for key, ref in list(self.resident.items()):
+                    if self.resident_bytes <= self.budget:
+                        break
+                    obj = ref()
+                    if obj is None or obj is keep or obj.pins or not obj.detach():
+                        continue
+                    obj.unmap(evicted=True)
+
+        @contextlib.contextmanager
+        def active(self, obj: "PyObject_ExecMem"):
+            """Keep the code of `obj` mapped for the duration of the context,
+            mapping it again if it was unloaded or evicted."""
+            with self.lock:
+                if obj.to_call is None:
+                    obj.reload()
+                obj.in_flight.append(None)
+                self.resident.move_to_end(id(obj))
+            try:
+                yield obj
+            finally:
+                obj.in_flight.pop()
+
+        def set_budget(self, budget: int | None):
+            with self.lock:
+                self.budget = budget
+                self.evict_over_budget()
+
+        def stats(self) -> dict:
+            with self.lock:
+                return {
+                    "budget": self.budget,
+                    "resident_bytes": self.resident_bytes,
+                    "resident_functions": len(self.resident),
+                    "pinned_functions": len(self.pinned),
+                    "functions": len(self.functions),
+                    "loads": self.loads,
+                    "unloads": self.unloads,
+                    "evictions": self.evictions,
+                }
+
+    manager = ExecMemManager()
+
+    def set_memory_budget(budget: int | None):
+        """Limit the executable memory resident in this process to `budget`
+        bytes, evicting the least recently called functions. None removes the
+        limit."""
+        manager.set_budget(budget)
+
+    def memory_stats() -> dict:
+        """Report the resident executable bytes, function counts and the number
+        of loads, explicit unloads and evictions."""
+        return manager.stats()
+
+    """C names of the argument and return types of compiled functions"""
+    C_TYPE_NAMES = {"c_double": "double", "c_float": "float"}
+
+    def c_type_name(ctype) -> str:
+        """The C type of a ctypes type. Tuples of doubles are returned as
+        structures, see py2ir.DoubleTuple."""
+        if hasattr(ctype, "_fields_"):
+            fields = " ".join(
+                f"{C_TYPE_NAMES[field_type.__name__]} {field};"
+                for field, field_type in ctype._fields_
+            )
+            return f"struct {ctype.__name__} {{ {fields} }}"
+        return C_TYPE_NAMES[ctype.__name__]
+
+    def c_prototype(cdef: ctypes.CFUNCTYPE, name: str = None, py_func=None) -> str:
+        """The C prototype of a function called through `cdef`, for example
+        `double lerp(double a, double b, double t);`. The name is made a C
+        identifier, without a name the prototype holds a `{}` placeholder.
+        Arguments are named after those of `py_func` when it is given."""
+        identifier = "{}" if name is None else re.sub(r"\W", "_", name)
+        names = list(inspect.signature(py_func).parameters) if py_func is not None else []
+        arguments = [
+            c_type_name(argtype) + (f" {names[arg_idx]}" if arg_idx < len(names) else "")
+            for arg_idx, argtype in enumerate(cdef.argtypes)
+        ]
+        return f"{c_type_name(cdef.restype)} {identifier}({', '.join(arguments) or 'void'});"
+
     class PyObject_ExecMem:
+        """Machine code mapped into executable memory, callable from python.
+
+        The code is a plain C function of the SysV ABI. `address` and
+        `c_signature` describe it to native code, which may call it without
+        going through python. The address is valid while the code is mapped:
+        until the function is unloaded, evicted by the memory budget or
+        garbage collected, after which it may be mapped again elsewhere.
+        Pinning the function keeps its code mapped at the same address until
+        it is unpinned, even when python drops every reference to it.
+        """
 
         def __init__(self):
             self.addr = mmap_exit_on_failure(
@@ -107,10 +271,172 @@ if platform.system() == "Linux":
             )
             self.size = ctypes.c_size_t(resource.getpagesize())
             self.prot = MMAP_PROT_WRITE
+            self.name = None
+            # The python function this was compiled from, unknown for loaded code
+            self.py_func = None
+            self.code = None
+            # libm symbols of the import table at the end of the code
+            self.imports = ()
+            self.cdef = None
             self.to_call = None
+            # One entry per call in flight. Appending and popping are atomic,
+            # calls are tracked without taking the manager lock.
+            self.in_flight = collections.deque()
+            self.pins = 0
+            self.calls = 0
+            self.call_time_ns = 0
+
+        def __del__(self):
+            if getattr(self, "addr", None) is not None:
+                self.unmap(evicted=False)
 
         def __call__(self, *args):
-            return self.to_call(*args)
+            # The injected code is a pure function, calls may be made from any
+            # number of threads at once. ctypes releases the GIL for the call.
+            # Every call is tracked in in_flight, so that neither unload() nor
+            # a budget set by another thread unmaps the code it runs: a call
+            # is entered before to_call is read and detach() clears to_call
+            # before it looks for calls in flight.
+            #
+            # Without a budget the order of least recently used functions is
+            # never consulted and calls take no lock.
+            if manager.budget is None and not manager.count_calls:
+                in_flight = self.in_flight
+                in_flight.append(None)
+                try:
+                    to_call = self.to_call
+                    if to_call is not None:
+                        return to_call(*args)
+                finally:
+                    in_flight.pop()
+
+            with manager.active(self):
+                if not manager.count_calls:
+                    return self.to_call(*args)
+                start = time.perf_counter_ns()
+                try:
+                    return self.to_call(*args)
+                finally:
+                    elapsed = time.perf_counter_ns() - start
+                    with manager.lock:
+                        self.calls += 1
+                        self.call_time_ns += elapsed
+
+        @property
+        def active_calls(self) -> int:
+            return len(self.in_flight)
+
+        def detach(self) -> bool:
+            """Stop new calls from entering the code, called with the manager
+            lock held before the code is unmapped. Returns False and leaves
+            the function as it was when calls are in flight."""
+            to_call, self.to_call = self.to_call, None
+            if self.in_flight:
+                self.to_call = to_call
+                return False
+            return True
+
+        @property
+        def loaded(self) -> bool:
+            return self.to_call is not None
+
+        @property
+        def address(self) -> int:
+            """The address of the machine code, a C function with the
+            prototype c_signature. Unloaded or evicted code is mapped first.
+            Pin the function while native code holds the address."""
+            with manager.lock:
+                if self.to_call is None:
+                    self.reload()
+                return self.addr.value
+
+        @property
+        def c_signature(self) -> str:
+            """The C prototype of the function at `address`"""
+            return c_prototype(self.cdef, self.name, self.py_func)
+
+        def pin(self) -> int:
+            """Keep the code mapped at its address until unpin is called as
+            often as pin was. Pinned functions are not evicted, may not be
+            unloaded and stay alive without python references. Returns the
+            address of the code."""
+            with manager.lock:
+                if self.to_call is None:
+                    self.reload()
+                self.pins += 1
+                manager.pinned[id(self)] = self
+                return self.addr.value
+
+        def unpin(self):
+            with manager.lock:
+                if not self.pins:
+                    raise RuntimeError(f"{self.name} is not pinned")
+                self.pins -= 1
+                if not self.pins:
+                    del manager.pinned[id(self)]
+
+        @contextlib.contextmanager
+        def pinned(self):
+            """Pin the function for the duration of the context, which is
+            given the address of the code"""
+            address = self.pin()
+            try:
+                yield address
+            finally:
+                self.unpin()
+
+        def unmap(self, evicted: bool):
+            """Release the executable memory of this function. The machine code
+            is kept so that the function may be mapped again."""
+            if self.addr is None:
+                return
+            manager.unmapped(self, evicted)
+            munmap_exit_on_failure(self.addr, self.size)
+            self.addr = None
+            self.prot = MMAP_PROT_NONE
+            self.to_call = None
+
+        def unload(self):
+            """Explicitly release the executable memory of this function. The
+            next call maps the retained machine code again."""
+            with manager.lock:
+                if self.pins:
+                    raise RuntimeError(f"unable to unload {self.name} while it is pinned")
+                if not self.detach():
+                    raise RuntimeError(f"unable to unload {self.name} while it is called")
+                self.unmap(evicted=False)
+
+        def reload(self):
+            """Map the retained machine code of an unloaded or evicted function"""
+            if self.code is None:
+                raise RuntimeError("unable to reload a PyObject_ExecMem without code")
+            self.inject(self.code, self.cdef, self.imports)
+
+        def __reduce__(self):
+            # Compiled functions are pickled by their machine code and
+            # signature. The code only uses rip relative addressing so it may
+            # be mapped at any address of the unpickling process.
+            if self.code is None:
+                raise TypeError("unable to pickle a PyObject_ExecMem without code")
+            return (
+                load,
+                (
+                    self.code,
+                    self.cdef.restype,
+                    tuple(self.cdef.argtypes),
+                    self.name,
+                    self.imports,
+                ),
+            )
+
+        def parallel_map(self, out, *inputs, workers: int = None, chunk_size: int = None):
+            """Apply this function elementwise over buffers of doubles on a
+            thread pool, writing the results to `out`. See pycc.parallel"""
+            from pycc import parallel
+
+            return parallel.parallel_map(
+                self, out, *inputs, workers=workers, chunk_size=chunk_size
+            )
 
         def __buffer__(self, flags: int):
 
@@ -124,22 +450,78 @@ if platform.system() == "Linux":
 
             return memview.cast("B")
 
-        def inject(self, code: bytes, cdef: ctypes.CFUNCTYPE):
+        def inject(self, code: bytes, cdef: ctypes.CFUNCTYPE, imports: tuple = ()):
+            """Map `code` and make it callable through `cdef`. The addresses
+            of the libm `imports` are filled in while mapping, `code` is kept
+            unlinked."""
+
+            # Map enough pages to hold the machine code
+            page_size = resource.getpagesize()
+            size = max(-(-len(code) // page_size), 1) * page_size
+            if self.addr is None or self.prot.value != MMAP_PROT_WRITE.value or (
+                self.size.value < size
+            ):
+                if self.addr is not None:
+                    self.unmap(evicted=False)
+                self.addr = mmap_exit_on_failure(
+                    ctypes.c_voidp(0),
+                    ctypes.c_size_t(size),
+                    MMAP_PROT_WRITE,
+                    MMAP_MAP_PRIVATE | MMAP_MAP_ANONYMOUS,
+                )
+                self.size = ctypes.c_size_t(size)
+                self.prot = MMAP_PROT_WRITE
 
             # Obtain the memory view of this object and write the machine code to
             # it
-            memoryview(self)[: len(code)] = code
+            memoryview(self)[: len(code)] = libm.link(code, imports)
             mprotect_exit_on_failure(
                 self.addr, self.size, MMAP_PROT_READ | MMAP_PROT_EXEC
             )
             self.prot = MMAP_PROT_READ | MMAP_PROT_EXEC
 
             # Create a ctypes function
+            self.code = bytes(code)
+            self.imports = tuple(imports)
+            self.cdef = cdef
             self.to_call = cdef(self.addr.value)
+            if hasattr(cdef.restype, "astuple"):
+                # Tuples of doubles are returned as structures, see
+                # py2ir.DoubleTuple
+                to_call = self.to_call
+                self.to_call = lambda *args: to_call(*args).astuple()
+            manager.mapped(self)
 
             # TODO Call msync() here to sync this buffers information with
             # possibly other readers
 
+    """Functions rebuilt by load() keyed by their machine code and signature.
+    Unpickling the same compiled function many times, for example once per
+    task sent to a process pool, maps its code only once per process. The
+    references are weak, loaded functions are collected like compiled ones."""
+    __loaded = weakref.WeakValueDictionary()
+    __loaded_lock = threading.Lock()
+
+    def load(
+        code: bytes, restype, argtypes, name: str = None, imports: tuple = ()
+    ) -> PyObject_ExecMem:
+        """Map machine code produced by pycc.compile without running the
+        compiler. This is the unpickling entry point of PyObject_ExecMem."""
+
+        key = (hashlib.sha256(code).digest(), restype, tuple(argtypes), tuple(imports))
+        with __loaded_lock:
+            obj = __loaded.get(key)
+            if obj is None:
+                cdef = ctypes.CFUNCTYPE(restype, *argtypes)
+                cdef.argtypes = list(argtypes)
+                cdef.restype = restype
+
+                obj = PyObject_ExecMem()
+                obj.name = name
+                obj.inject(code, cdef, imports)
+                __loaded[key] = obj
+            return obj
+
 else:
     print_sorry()
     exit(1)
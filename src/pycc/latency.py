@@ -0,0 +1,272 @@
+"""Time compiled kernels in a native loop.
+
+Timing a compiled function from python mostly measures the ctypes call, a
+kernel of a few instructions is lost in the noise of `__call__`. `measure`
+instead calls the kernel from a generated native loop, the latency stub,
+which loads the supplied arguments and calls the kernel `calls` times between
+two reads of the time stamp counter. The stub is also timed calling an empty
+function, a single `ret`, to subtract the cost of the loop and the call
+itself. What remains is the time spent in the machine code of the kernel.
+
+The time stamp counter ticks at a constant rate that is not the core clock
+when the cpu boosts or throttles, cycles are reference cycles. Nanoseconds are
+measured around the stub with clock_gettime, the single ctypes call is spread
+over every call of the loop.
+
+By default the calls are independent and overlap in the pipeline, the cycles
+per call are the reciprocal throughput of the kernel. With `dependent` every
+call waits for the result of the previous one: the result is masked to zero
+and or-ed with the first argument, which keeps the supplied value. The calls
+form a dependency chain and the cycles per call are the latency of the kernel.
+Either way the loop itself runs in parallel with the kernel, a kernel shorter
+than the loop measures close to zero cycles.
+
+The kernel and the empty function are timed alternately and the loop is
+subtracted from the kernel sample it was paired with, noise that hits one
+pair cancels in the median of the differences. A difference below zero is
+noise as well, the time of the kernel is clamped at zero and the spread of
+the differences shows how far the samples disagree.
+"""
+
+from pycc import execmem
+from pycc.assembler.asm_x64 import AsmX64
+from pycc.dispatch import PyObject_Dispatcher
+from pycc.parallel import ELEMENT_MOVES, MAX_MAP_ARGUMENTS
+from pycc.py2ir import DoubleTuple
+from pycc.pycc import assemble
+from pathlib import Path
+
+import time
+import ctypes
+import struct
+import tempfile
+import threading
+import statistics
+
+# uint64_t stub(void *arguments, int64_t calls, void *kernel);
+LATENCY_STUB_CFUNCTYPE = ctypes.CFUNCTYPE(
+    ctypes.c_uint64, ctypes.c_void_p, ctypes.c_int64, ctypes.c_void_p
+)
+
+"""Registers holding the loop state across calls into the kernel, callee
+saved in the SysV ABI. Five pushes on top of the return address leave %rsp
+16 byte aligned for the call."""
+CALLEE_SAVED_REGISTERS = ["%rbx", "%r12", "%r13", "%r14", "%r15"]
+
+"""Bytes of each argument in the argument block of the stub"""
+ARGUMENT_SLOT = 8
+
+__lock = threading.Lock()
+__stubs = {}
+__empty = None
+
+
+def read_tsc(asmx64: AsmX64, dst: str):
+    """Read the time stamp counter into `dst`, the fences keep the loop from
+    being reordered around the read. Clobbers %rax and %rdx."""
+    asmx64.lfence()
+    asmx64.rdtsc()
+    asmx64.lfence()
+    asmx64.shl("$32", "%rdx")
+    asmx64.add("%rdx", "%rax")
+    if dst != "%rax":
+        asmx64.mov("%rax", dst)
+
+
+def generate_latency_stub(argtypes: tuple, dependent: bool = False) -> AsmX64:
+    """Generate the loop calling a kernel over `argtypes`, returning the time
+    stamp counter ticks of the loop.
+
+    The arguments are loaded from the argument block before every call since
+    the kernel clobbers every xmm register. With `dependent` the first
+    argument is made to depend on the result of the previous call in %xmm0.
+    """
+
+    asmx64 = AsmX64()
+    for register in CALLEE_SAVED_REGISTERS:
+        asmx64.push(register)
+
+    asmx64.mov("%rdi", "%r12")
+    asmx64.mov("%rsi", "%r13")
+    asmx64.mov("%rdx", "%rbx")
+
+    read_tsc(asmx64, "%r14")
+    asmx64.xor("%r15", "%r15")
+
+    asmx64.label(".Lpycc_latency_loop")
+    asmx64.cmp("%r13", "%r15")
+    asmx64.jge(".Lpycc_latency_done")
+    for arg_idx, argtype in enumerate(argtypes):
+        move = getattr(asmx64, ELEMENT_MOVES[argtype])
+        if dependent and arg_idx == 0:
+            # %xmm0 = (~result & result) | argument
+            asmx64.andnpd("%xmm0", "%xmm0")
+            move("(%r12)", "%xmm1")
+            asmx64.orpd("%xmm1", "%xmm0")
+            continue
+        move(f"{arg_idx * ARGUMENT_SLOT}(%r12)", f"%xmm{arg_idx}")
+    asmx64.call("*%rbx")
+    asmx64.inc("%r15")
+    asmx64.jmp(".Lpycc_latency_loop")
+
+    asmx64.label(".Lpycc_latency_done")
+    read_tsc(asmx64, "%rax")
+    asmx64.sub("%r14", "%rax")
+    for register in reversed(CALLEE_SAVED_REGISTERS):
+        asmx64.pop(register)
+    asmx64.ret()
+
+    return asmx64
+
+
+def __inject(asmx64: AsmX64, name: str, cdef) -> execmem.PyObject_ExecMem:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        code = assemble(asmx64.gen_gnu_as(), Path(tmp_dir) / name)
+    stub = execmem.PyObject_ExecMem()
+    stub.name = name.replace("-", "_")
+    stub.inject(code, cdef)
+    return stub
+
+
+def get_latency_stub(argtypes: tuple, dependent: bool = False) -> execmem.PyObject_ExecMem:
+    """Obtain the latency stub for kernels over `argtypes`, assembling it on
+    first use"""
+
+    argtypes = tuple(argtypes)
+    name = "pycc-latency-stub-" + "".join(
+        "f" if argtype is ctypes.c_float else "d" for argtype in argtypes
+    )
+    if dependent:
+        name += "-dependent"
+    with __lock:
+        if not (argtypes, dependent) in __stubs:
+            __stubs[argtypes, dependent] = __inject(
+                generate_latency_stub(argtypes, dependent), name, LATENCY_STUB_CFUNCTYPE
+            )
+        return __stubs[argtypes, dependent]
+
+
+def get_empty_function() -> execmem.PyObject_ExecMem:
+    """A function returning at once, its arguments are left as they are"""
+    global __empty
+    with __lock:
+        if __empty is None:
+            asmx64 = AsmX64()
+            asmx64.ret()
+            __empty = __inject(asmx64, "pycc-latency-empty", ctypes.CFUNCTYPE(None))
+        return __empty
+
+
+def argument_block(argtypes: tuple, args: tuple) -> ctypes.Array:
+    block = ctypes.create_string_buffer(max(1, len(argtypes)) * ARGUMENT_SLOT)
+    for arg_idx, (argtype, arg) in enumerate(zip(argtypes, args)):
+        fmt = "<f" if argtype is ctypes.c_float else "<d"
+        struct.pack_into(fmt, block, arg_idx * ARGUMENT_SLOT, float(arg))
+    return block
+
+
+def time_stub(stub, block, calls: int, address: int) -> tuple:
+    """Time stamp counter ticks and nanoseconds of one run of the stub"""
+    start = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+    cycles = stub(ctypes.addressof(block), calls, address)
+    return cycles, time.clock_gettime_ns(time.CLOCK_MONOTONIC) - start
+
+
+def measure(
+    kernel,
+    *args,
+    calls: int = 100_000,
+    repeat: int = 5,
+    dependent: bool = False,
+) -> dict:
+    """Time `kernel(*args)` called from a native loop.
+
+    `kernel` is a function returned by pycc.compile, polymorphic functions
+    are measured in their specialization for `args`. Every sample runs
+    `calls` calls, the medians of `repeat` samples are reported per call:
+
+      cycles_per_call       reference cycles spent in the kernel, never
+                            negative
+      ns_per_call           nanoseconds spent in the kernel, never negative
+      cycles_spread         the largest minus the smallest difference of
+      ns_spread             a kernel and its loop sample, per call
+      loop_cycles_per_call  the loop and the call of an empty function,
+      loop_ns_per_call      subtracted from the above
+      python_ns_per_call    nanoseconds of kernel(*args) called from python
+      dispatch_ns_per_call  what python adds to the kernel, the difference
+                            of python_ns_per_call and ns_per_call
+    """
+
+    if isinstance(kernel, PyObject_Dispatcher):
+        kernel = kernel.specialize(args)
+    if not isinstance(kernel, execmem.PyObject_ExecMem):
+        raise TypeError("measure requires a function compiled by pycc")
+
+    cdef = kernel.cdef
+    restype = cdef.restype
+    if any(not argtype in ELEMENT_MOVES for argtype in cdef.argtypes) or not (
+        restype in ELEMENT_MOVES
+        or (issubclass(restype, DoubleTuple) and len(restype._fields_) <= 2)
+    ):
+        raise TypeError(
+            "measure requires a kernel over c_double or c_float values returning "
+            "a value or a pair in registers"
+        )
+    if len(cdef.argtypes) != len(args):
+        raise TypeError(
+            f"kernel takes {len(cdef.argtypes)} arguments but {len(args)} were given"
+        )
+    if len(args) > MAX_MAP_ARGUMENTS:
+        raise NotImplementedError(
+            f"measure supports kernels with at most {MAX_MAP_ARGUMENTS} arguments"
+        )
+    if dependent and not args:
+        raise TypeError("dependent calls are chained through the first argument")
+    if calls < 1 or repeat < 1:
+        raise ValueError("calls and repeat must be at least 1")
+
+    stub = get_latency_stub(cdef.argtypes, dependent)
+    empty = get_empty_function()
+    block = argument_block(cdef.argtypes, args)
+
+    samples = {"kernel": [], "loop": []}
+    with kernel.pinned() as kernel_address:
+        time_stub(stub, block, max(1, calls // 10), kernel_address)
+        # Interleaved so that frequency changes affect both alike
+        for _ in range(repeat):
+            samples["kernel"].append(time_stub(stub, block, calls, kernel_address))
+            samples["loop"].append(time_stub(stub, block, calls, empty.address))
+
+        python = []
+        for _ in range(repeat):
+            start = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+            for _ in range(calls):
+                kernel(*args)
+            python.append(time.clock_gettime_ns(time.CLOCK_MONOTONIC) - start)
+
+    def per_call(name: str, column: int) -> float:
+        return statistics.median(sample[column] for sample in samples[name]) / calls
+
+    def differences(column: int) -> list:
+        # Each kernel sample less the loop sample taken right after it
+        return [
+            (kernel_sample[column] - loop_sample[column]) / calls
+            for kernel_sample, loop_sample in zip(samples["kernel"], samples["loop"])
+        ]
+
+    cycles = differences(0)
+    ns = differences(1)
+    ns_per_call = max(0.0, statistics.median(ns))
+    python_ns = statistics.median(python) / calls
+    return {
+        "calls": calls,
+        "dependent": dependent,
+        "cycles_per_call": max(0.0, statistics.median(cycles)),
+        "ns_per_call": ns_per_call,
+        "cycles_spread": max(cycles) - min(cycles),
+        "ns_spread": max(ns) - min(ns),
+        "loop_cycles_per_call": per_call("loop", 0),
+        "loop_ns_per_call": per_call("loop", 1),
+        "python_ns_per_call": python_ns,
+        "dispatch_ns_per_call": python_ns - ns_per_call,
+    }
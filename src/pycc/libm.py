@@ -0,0 +1,96 @@
+"""Calls from compiled code into the C math library.
+
+Functions of the `math` module used by a compiled function are called in the
+libm of the running process. The machine code calls them indirectly through a
+table of absolute addresses, the `.pycc_got` section, which the linker script
+places at the very end of the flat binary. The table is assembled with
+placeholder entries and filled in by `link` whenever the code is mapped, so
+the code itself stays independent of where libm was loaded and may be pickled
+into another process.
+
+The C functions return nan or an infinity where the python functions raise a
+ValueError or an OverflowError, as compiled division by zero already does.
+"""
+
+import ctypes
+import ctypes.util
+import struct
+import threading
+
+"""Python name of the math function, the libm symbol and the number of
+arguments"""
+MATH_FUNCTIONS = {
+    "exp": ("exp", 1),
+    "exp2": ("exp2", 1),
+    "expm1": ("expm1", 1),
+    "log": ("log", 1),
+    "log2": ("log2", 1),
+    "log10": ("log10", 1),
+    "log1p": ("log1p", 1),
+    "sqrt": ("sqrt", 1),
+    "cbrt": ("cbrt", 1),
+    "sin": ("sin", 1),
+    "cos": ("cos", 1),
+    "tan": ("tan", 1),
+    "asin": ("asin", 1),
+    "acos": ("acos", 1),
+    "atan": ("atan", 1),
+    "sinh": ("sinh", 1),
+    "cosh": ("cosh", 1),
+    "tanh": ("tanh", 1),
+    "asinh": ("asinh", 1),
+    "acosh": ("acosh", 1),
+    "atanh": ("atanh", 1),
+    "erf": ("erf", 1),
+    "erfc": ("erfc", 1),
+    "gamma": ("tgamma", 1),
+    "lgamma": ("lgamma", 1),
+    "atan2": ("atan2", 2),
+    "pow": ("pow", 2),
+    "hypot": ("hypot", 2),
+    "fmod": ("fmod", 2),
+}
+
+"""libm functions computed by a single instruction instead of a call, the
+instructions are correctly rounded as are the libm functions"""
+INLINE_FUNCTIONS = {"sqrt": "sqrtsd"}
+
+"""Entry `idx` of the table is assembled as GOT_PLACEHOLDER + idx, link checks
+the placeholders before replacing them"""
+GOT_PLACEHOLDER = 0x5059434347540000
+GOT_ENTRY = struct.Struct("<Q")
+
+__lock = threading.Lock()
+__libm = None
+
+
+def get_libm() -> ctypes.CDLL:
+    global __libm
+    with __lock:
+        if __libm is None:
+            name = ctypes.util.find_library("m")
+            if name is None:
+                raise OSError("pycc is unable to find the C math library")
+            __libm = ctypes.CDLL(name)
+        return __libm
+
+
+def resolve(symbol: str) -> int:
+    """The address of `symbol` in libm, looked up with dlsym"""
+    return ctypes.cast(getattr(get_libm(), symbol), ctypes.c_void_p).value
+
+
+def link(code: bytes, imports: tuple) -> bytes:
+    """Fill the table at the end of `code` with the addresses of `imports`"""
+    if not imports:
+        return code
+
+    table_offset = len(code) - GOT_ENTRY.size * len(imports)
+    table = bytearray(code[table_offset:])
+    for import_idx, symbol in enumerate(imports):
+        offset = import_idx * GOT_ENTRY.size
+        (placeholder,) = GOT_ENTRY.unpack_from(table, offset)
+        if placeholder != GOT_PLACEHOLDER + import_idx:
+            raise RuntimeError(f"pycc: the import table of {symbol} is not at the end of the code")
+        GOT_ENTRY.pack_into(table, offset, resolve(symbol))
+    return code[:table_offset] + bytes(table)
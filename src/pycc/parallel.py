@@ -0,0 +1,234 @@
+"""Run compiled kernels elementwise over buffers on a pool of threads.
+
+Compiled kernels are pure functions over doubles or single precision floats,
+each buffer holds the type of its argument. Rather than calling the
+kernel once per element from python, `parallel_map` uses a small native loop,
+the map stub, that applies the kernel to a contiguous range of elements. The
+stub is called through a ctypes CFUNCTYPE which releases the GIL for the
+duration of the call, so every chunk of the buffers runs natively on its own
+thread.
+"""
+
+from pycc import execmem
+from pycc.assembler.asm_x64 import AsmX64
+from pycc.pycc import assemble
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import os
+import ctypes
+import tempfile
+import threading
+
+# void stub(T *out, T **inputs, int64_t n, void *kernel);
+MAP_STUB_CFUNCTYPE = ctypes.CFUNCTYPE(
+    None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int64, ctypes.c_void_p
+)
+
+"""Registers used by the map stub to hold the loop state across calls into the
+kernel. These are callee saved in the SysV ABI so the kernel may not clobber
+them, and the stub must restore them before returning."""
+CALLEE_SAVED_REGISTERS = ["%rbx", "%r12", "%r13", "%r14", "%r15"]
+
+"""The maximum number of kernel arguments the map stub can load. Arguments are
+passed in %xmm0-%xmm7, further arguments would have to be passed on the
+stack."""
+MAX_MAP_ARGUMENTS = 8
+
+"""Buffer formats accepted for each argument type, and the scalar move
+loading or storing an element"""
+BUFFER_FORMATS = {
+    ctypes.c_double: ("d", "@d", "=d", "<d"),
+    ctypes.c_float: ("f", "@f", "=f", "<f"),
+}
+ELEMENT_MOVES = {ctypes.c_double: "movsd", ctypes.c_float: "movss"}
+
+__lock = threading.Lock()
+__stubs = {}
+__pools = {}
+
+
+def generate_map_stub(argtypes: tuple, restype=ctypes.c_double) -> AsmX64:
+    """Generate the native loop that maps a kernel over `argtypes` returning
+    `restype`.
+
+    The stub does not depend on the kernel itself, the kernel address is
+    passed as an argument. This way a single stub is shared by every kernel
+    of the same signature.
+    """
+
+    asmx64 = AsmX64()
+
+    # Five pushes on top of the return address leave %rsp 16 byte aligned
+    # for the call into the kernel
+    for register in CALLEE_SAVED_REGISTERS:
+        asmx64.push(register)
+
+    asmx64.mov("%rdi", "%r12")
+    asmx64.mov("%rsi", "%r13")
+    asmx64.mov("%rdx", "%r14")
+    asmx64.mov("%rcx", "%rbx")
+    asmx64.xor("%r15", "%r15")
+
+    asmx64.label(".Lpycc_map_loop")
+    asmx64.cmp("%r14", "%r15")
+    asmx64.jge(".Lpycc_map_done")
+
+    # The kernel clobbers every xmm register, reload the arguments each pass
+    for arg_idx, argtype in enumerate(argtypes):
+        asmx64.mov(f"{arg_idx * 8}(%r13)", "%rax")
+        move = getattr(asmx64, ELEMENT_MOVES[argtype])
+        move(f"(%rax,%r15,{ctypes.sizeof(argtype)})", f"%xmm{arg_idx}")
+
+    asmx64.call("*%rbx")
+    move = getattr(asmx64, ELEMENT_MOVES[restype])
+    move("%xmm0", f"(%r12,%r15,{ctypes.sizeof(restype)})")
+    asmx64.inc("%r15")
+    asmx64.jmp(".Lpycc_map_loop")
+
+    asmx64.label(".Lpycc_map_done")
+    for register in reversed(CALLEE_SAVED_REGISTERS):
+        asmx64.pop(register)
+    asmx64.ret()
+
+    return asmx64
+
+
+def get_map_stub(argtypes: tuple, restype=ctypes.c_double) -> execmem.PyObject_ExecMem:
+    """Obtain the map stub for kernels over `argtypes` returning `restype`,
+    assembling it on first use."""
+
+    argtypes = tuple(argtypes)
+    if len(argtypes) > MAX_MAP_ARGUMENTS:
+        raise NotImplementedError(
+            f"parallel_map supports kernels with at most {MAX_MAP_ARGUMENTS} arguments"
+        )
+
+    # Stubs are named after the buffer formats, pycc_map_stub_d_ff
+    signature = (restype,) + argtypes
+    name = BUFFER_FORMATS[restype][0] + "_" + "".join(
+        BUFFER_FORMATS[argtype][0] for argtype in argtypes
+    )
+    with __lock:
+        if signature not in __stubs:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                base_name = Path(tmp_dir) / f"pycc-map-stub-{name}"
+                code = assemble(
+                    generate_map_stub(argtypes, restype).gen_gnu_as(), base_name
+                )
+
+            stub = execmem.PyObject_ExecMem()
+            stub.name = f"pycc_map_stub_{name}"
+            stub.inject(code, MAP_STUB_CFUNCTYPE)
+            __stubs[signature] = stub
+        return __stubs[signature]
+
+
+def get_thread_pool(workers: int) -> ThreadPoolExecutor:
+    """Thread pools are kept alive between calls to avoid paying for thread
+    creation on every map."""
+
+    with __lock:
+        if workers not in __pools:
+            __pools[workers] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="pycc-parallel"
+            )
+        return __pools[workers]
+
+
+def as_array(buffer, ctype, writable: bool):
+    """Obtain a ctypes array of `ctype` sharing memory with `buffer`.
+
+    Read only input buffers (for example `bytes`) are copied since ctypes is
+    unable to take the address of read only memory.
+    """
+
+    view = memoryview(buffer)
+    formats = BUFFER_FORMATS[ctype]
+    if view.format not in formats or not view.c_contiguous:
+        kind = "doubles" if ctype is ctypes.c_double else "single precision floats"
+        raise TypeError(f"parallel_map requires C contiguous buffers of {kind}")
+    view = view.cast("B").cast(formats[0])
+
+    if view.readonly:
+        if writable:
+            raise TypeError("parallel_map requires a writable output buffer")
+        return (ctype * len(view)).from_buffer_copy(view)
+    return (ctype * len(view)).from_buffer(view)
+
+
+def as_double_array(buffer, writable: bool):
+    """Obtain a ctypes double array sharing memory with `buffer`"""
+    return as_array(buffer, ctypes.c_double, writable)
+
+
+def parallel_map(
+    kernel: execmem.PyObject_ExecMem,
+    out,
+    *inputs,
+    workers: int = None,
+    chunk_size: int = None,
+):
+    """Compute `out[i] = kernel(inputs[0][i], inputs[1][i], ...)`.
+
+    The buffers are split into chunks of `chunk_size` elements, by default one
+    chunk per worker, and each chunk is run natively on a thread pool of
+    `workers` threads with the GIL released. `out` is returned. Buffers of
+    c_float arguments and results hold single precision floats, `array("f")`.
+    """
+
+    cdef = kernel.cdef
+    if not cdef.restype in BUFFER_FORMATS or any(
+        not argtype in BUFFER_FORMATS for argtype in cdef.argtypes
+    ):
+        raise TypeError("parallel_map requires a kernel over c_double or c_float values")
+    if len(cdef.argtypes) != len(inputs):
+        raise TypeError(
+            f"kernel takes {len(cdef.argtypes)} arguments but {len(inputs)} buffers were given"
+        )
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+
+    out_array = as_array(out, cdef.restype, writable=True)
+    in_arrays = [
+        as_array(buffer, argtype, writable=False)
+        for buffer, argtype in zip(inputs, cdef.argtypes)
+    ]
+
+    n = len(out_array)
+    for in_array in in_arrays:
+        if len(in_array) < n:
+            raise ValueError("input buffers must be at least as long as the output")
+
+    stub = get_map_stub(cdef.argtypes, cdef.restype)
+    out_addr = ctypes.addressof(out_array)
+    out_size = ctypes.sizeof(cdef.restype)
+    in_addrs = [ctypes.addressof(in_array) for in_array in in_arrays]
+    in_sizes = [ctypes.sizeof(argtype) for argtype in cdef.argtypes]
+
+    def run_chunk(start: int, count: int):
+        in_ptrs = (ctypes.c_void_p * len(in_addrs))(
+            *[addr + start * size for addr, size in zip(in_addrs, in_sizes)]
+        )
+        stub(out_addr + start * out_size, in_ptrs, count, kernel_address)
+
+    if chunk_size is None:
+        chunk_size = -(-n // workers)
+    chunk_size = max(chunk_size, 1)
+    chunks = [(start, min(chunk_size, n - start)) for start in range(0, n, chunk_size)]
+
+    # The kernel address is handed to native code, keep it from being evicted
+    with kernel.pinned() as kernel_address:
+        if workers == 1 or len(chunks) <= 1:
+            for start, count in chunks:
+                run_chunk(start, count)
+        else:
+            pool = get_thread_pool(workers)
+            futures = [pool.submit(run_chunk, start, count) for start, count in chunks]
+            for future in futures:
+                future.result()
+
+    return out
@@ -0,0 +1,228 @@
+"""Profiler support for compiled functions.
+
+Code injected by PyObject_ExecMem lives in anonymous executable mappings, to
+perf it is a range of addresses without symbols. Two opt-in writers describe
+each mapping as it is made:
+
+  perf map  /tmp/perf-<pid>.map, one "start size name" line per function,
+            read by `perf report` directly.
+  jitdump   jit-<pid>.dump in the given directory, the records also hold the
+            machine code so that `perf inject --jit` can annotate it.
+
+Independently of perf, per function call counters and cumulative call times
+may be enabled to find the hottest kernels of a running process.
+
+The writers and counters are enabled by their functions below or at import by
+the environment variables PYCC_PERF_MAP=1, PYCC_JITDUMP=<directory> and
+PYCC_COUNTERS=1.
+"""
+
+from pycc import execmem
+from pathlib import Path
+
+import os
+import time
+import mmap
+import atexit
+import struct
+import threading
+
+"""jitdump file header and record layouts, see tools/perf/Documentation/
+jitdump-specification.txt of the linux sources"""
+JITDUMP_MAGIC = 0x4A695444
+JITDUMP_VERSION = 1
+JITDUMP_ELF_MACH_X86_64 = 62
+JITDUMP_HEADER = struct.Struct("<IIIIIIQQ")
+JITDUMP_RECORD_HEADER = struct.Struct("<IIQ")
+JITDUMP_CODE_LOAD = struct.Struct("<IIQQQQ")
+JIT_CODE_LOAD = 0
+JIT_CODE_CLOSE = 3
+
+
+def timestamp() -> int:
+    # perf must be run with `-k mono` to correlate the records with samples
+    return time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+
+class PerfMapWriter:
+    """Appends a line per mapped function to a perf map file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.fp = open(self.path, "a", buffering=1)
+
+    def __call__(self, obj: execmem.PyObject_ExecMem):
+        with self.lock:
+            self.fp.write(f"{obj.addr.value:x} {len(obj.code):x} {obj.name}\n")
+
+    def close(self):
+        with self.lock:
+            self.fp.close()
+
+
+class JitDumpWriter:
+    """Writes a JIT_CODE_LOAD record per mapped function to a jitdump file.
+
+    perf record notices the dump file through an executable mapping of it,
+    the mapping is kept for the lifetime of the writer.
+    """
+
+    def __init__(self, directory: Path):
+        self.path = Path(directory) / f"jit-{os.getpid()}.dump"
+        self.lock = threading.Lock()
+        self.code_index = 0
+        self.fp = open(self.path, "w+b")
+        self.fp.write(
+            JITDUMP_HEADER.pack(
+                JITDUMP_MAGIC,
+                JITDUMP_VERSION,
+                JITDUMP_HEADER.size,
+                JITDUMP_ELF_MACH_X86_64,
+                0,
+                os.getpid(),
+                timestamp(),
+                0,
+            )
+        )
+        self.fp.flush()
+        self.marker = mmap.mmap(
+            self.fp.fileno(),
+            JITDUMP_HEADER.size,
+            flags=mmap.MAP_PRIVATE,
+            prot=mmap.PROT_READ | mmap.PROT_EXEC,
+        )
+
+    def __call__(self, obj: execmem.PyObject_ExecMem):
+        name = (obj.name or "pycc").encode() + b"\0"
+        with self.lock:
+            size = (
+                JITDUMP_RECORD_HEADER.size
+                + JITDUMP_CODE_LOAD.size
+                + len(name)
+                + len(obj.code)
+            )
+            self.fp.write(JITDUMP_RECORD_HEADER.pack(JIT_CODE_LOAD, size, timestamp()))
+            self.fp.write(
+                JITDUMP_CODE_LOAD.pack(
+                    os.getpid(),
+                    threading.get_native_id(),
+                    obj.addr.value,
+                    obj.addr.value,
+                    len(obj.code),
+                    self.code_index,
+                )
+            )
+            self.fp.write(name)
+            self.fp.write(obj.code)
+            self.fp.flush()
+            self.code_index += 1
+
+    def close(self):
+        with self.lock:
+            if self.fp.closed:
+                return
+            self.fp.write(
+                JITDUMP_RECORD_HEADER.pack(
+                    JIT_CODE_CLOSE, JITDUMP_RECORD_HEADER.size, timestamp()
+                )
+            )
+            self.fp.close()
+            self.marker.close()
+
+
+__lock = threading.Lock()
+__writers = {}
+
+
+def __enable_writer(kind: str, writer):
+    with __lock:
+        __disable_writer(kind)
+        __writers[kind] = writer
+        with execmem.manager.lock:
+            execmem.manager.listeners.append(writer)
+            # Describe the functions that were mapped before the writer
+            for ref in execmem.manager.resident.values():
+                obj = ref()
+                if obj is not None:
+                    writer(obj)
+    return writer.path
+
+
+def __disable_writer(kind: str):
+    writer = __writers.pop(kind, None)
+    if writer is not None:
+        with execmem.manager.lock:
+            execmem.manager.listeners.remove(writer)
+        writer.close()
+
+
+def enable_perf_map(path: Path = None) -> Path:
+    """Write the address range of every mapped function to a perf map,
+    /tmp/perf-<pid>.map by default. Returns the path of the map."""
+    if path is None:
+        path = Path(f"/tmp/perf-{os.getpid()}.map")
+    return __enable_writer("perf_map", PerfMapWriter(path))
+
+
+def disable_perf_map():
+    with __lock:
+        __disable_writer("perf_map")
+
+
+def enable_jitdump(directory: Path = None) -> Path:
+    """Write a jitdump of every mapped function to `directory`, the working
+    directory by default. Returns the path of the dump."""
+    if directory is None:
+        directory = Path.cwd()
+    return __enable_writer("jitdump", JitDumpWriter(directory))
+
+
+def disable_jitdump():
+    with __lock:
+        __disable_writer("jitdump")
+
+
+def enable_counters():
+    """Count the calls and the cumulative call time of every compiled function.
+    Counted calls take the locked call path of PyObject_ExecMem."""
+    execmem.manager.count_calls = True
+
+
+def disable_counters():
+    execmem.manager.count_calls = False
+
+
+def reset_counters():
+    with execmem.manager.lock:
+        for obj in list(execmem.manager.functions):
+            obj.calls = 0
+            obj.call_time_ns = 0
+
+
+def counter_stats() -> list:
+    """The counters of every compiled function that was called, hottest
+    first by cumulative call time. Calls made by parallel_map are not
+    counted."""
+    with execmem.manager.lock:
+        stats = [
+            {
+                "name": obj.name,
+                "calls": obj.calls,
+                "time_ns": obj.call_time_ns,
+                "mean_ns": obj.call_time_ns / obj.calls,
+            }
+            for obj in list(execmem.manager.functions)
+            if obj.calls
+        ]
+    return sorted(stats, key=lambda stat: (-stat["time_ns"], stat["name"] or ""))
+
+
+atexit.register(disable_jitdump)
+
+if os.environ.get("PYCC_PERF_MAP"):
+    enable_perf_map()
+if os.environ.get("PYCC_JITDUMP"):
+    enable_jitdump(Path(os.environ["PYCC_JITDUMP"]))
+if os.environ.get("PYCC_COUNTERS"):
+    enable_counters()
@@ -1,5 +1,6 @@
 from pycc.ssair.irgrammar import IRGrammar
-from typing import Dict
+from pycc.libm import MATH_FUNCTIONS
+from typing import Dict, List
 from pprint import pprint
 
 import ast
@@ -12,9 +13,65 @@ class CompilableTypes:
     TYPE_MAP = {
         "ctypes.c_double": ctypes.c_double,
         "c_double": ctypes.c_double,
+        # Single precision values are widened to doubles where they are read
+        # and rounded where they are returned, as python computes with them
+        "ctypes.c_float": ctypes.c_float,
+        "c_float": ctypes.c_float,
         "float": ctypes.c_double,
+        # There is no integer arithmetic, integers are passed as doubles
+        "int": ctypes.c_double,
     }
 
+    # The argument type that a specialization is compiled for when a python
+    # value of this type is passed to a polymorphic function
+    PYTHON_TYPE_MAP = {
+        float: ctypes.c_double,
+        int: ctypes.c_double,
+        ctypes.c_double: ctypes.c_double,
+        ctypes.c_float: ctypes.c_float,
+    }
+
+    # Types only accepted for arguments. Integers are widened to doubles, a
+    # function annotated to return one would return a float instead.
+    ARGUMENT_ONLY_TYPES = ("int",)
+
+
+class DoubleTuple(ctypes.Structure):
+    """Base of the structures that functions returning a tuple of doubles
+    return. The SysV ABI returns pairs in %xmm0 and %xmm1 and larger tuples
+    through memory provided by the caller, ctypes takes care of either."""
+
+    def astuple(self) -> tuple:
+        return tuple(getattr(self, name) for name, _ in self._fields_)
+
+
+__double_tuples = {}
+
+
+def double_tuple_type(n: int) -> type:
+    """The structure of `n` doubles. The structures are created once and are
+    found by name in this module so that their signatures can be pickled."""
+    if not n in __double_tuples:
+        name = f"c_double_tuple{n}"
+        __double_tuples[n] = type(
+            name,
+            (DoubleTuple,),
+            {
+                "_fields_": [(f"v{idx}", ctypes.c_double) for idx in range(n)],
+                "__module__": __name__,
+                "__qualname__": name,
+            },
+        )
+        globals()[name] = __double_tuples[n]
+    return __double_tuples[n]
+
+
+def __getattr__(name: str):
+    # Unpickling a signature may reference a structure not yet created
+    if name.startswith("c_double_tuple") and name[len("c_double_tuple") :].isdigit():
+        return double_tuple_type(int(name[len("c_double_tuple") :]))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class CompilerException(BaseException):
 
@@ -25,14 +82,37 @@ class CompilerException(BaseException):
 
 class Py2IR(ast.NodeVisitor):
 
-    def __init__(self, file_name: str):
+    """Doubles passed in %xmm0-%xmm7 by the SysV ABI, later arguments are
+    passed on the stack"""
+    XMM_ARGUMENTS = 8
+
+    def __init__(
+        self,
+        file_name: str,
+        signature: List[type] | None = None,
+        bound: Dict[str, float] | None = None,
+    ):
         self.file_name = file_name
+        self.signature = signature
         self.cdef = None
 
+        # Arguments bound to constants, they are not arguments of the
+        # compiled function. See pycc.specialize.
+        self.bound = bound or {}
+        self.argtypes = None
+
         # Variable dictionary used to keep track of variables and their versions
         self.variable_db: {str: int} = {}
         self.global_ir = []
 
+        # Highest version given to each variable. Branches restore the
+        # versions of variable_db so the next version is taken from here.
+        self.max_versions: {str: int} = {}
+        self.n_branches = 0
+
+        # Number of values of each return statement, None for a single value
+        self.return_arities = set()
+
     def __create_no_name_variable(self):
         # Create the variable
         n_variables = len(self.variable_db)
@@ -49,6 +129,32 @@ class Py2IR(ast.NodeVisitor):
             self.variable_db[name] = 0
             return IRGrammar.versioned_variable_tuple(name, self.variable_db[name])
 
+    def __bump_variable(self, name):
+        """Create the next version of a named variable"""
+        version = max(self.max_versions.get(name, 0), self.variable_db[name]) + 1
+        self.variable_db[name] = version
+        self.max_versions[name] = version
+
+    def __create_labels(self):
+        self.n_branches += 1
+        return (
+            f"then{self.n_branches}",
+            f"else{self.n_branches}",
+            f"join{self.n_branches}",
+        )
+
+    @staticmethod
+    def __result_variable(ir):
+        """The variable holding the value of an expression visited to `ir`"""
+        if type(ir).__name__ == "list":
+            return ir[-1].Left
+        return ir
+
+    @staticmethod
+    def __terminates(ir) -> bool:
+        """Whether the statements `ir` end in a return"""
+        return len(ir) > 0 and type(ir[-1]).__name__ in ("Return", "ReturnValues")
+
     def __create_const_variable(self, value):
         # Create the variable
         n_variables = len(self.variable_db)
@@ -64,39 +170,157 @@ class Py2IR(ast.NodeVisitor):
         # Return this assignment as the syntax that has been created
         return [assignment]
 
+    @staticmethod
+    def annotation_names(annotation: ast.expr) -> List[str] | None:
+        """The type names allowed by an annotation. Unions, either written as
+        `float | int` or `Union[float, int]`, allow each of their members.
+        None is returned for a missing annotation which allows any type."""
+
+        if annotation is None:
+            return None
+        if isinstance(annotation, ast.BinOp) and isinstance(annotation.op, ast.BitOr):
+            return Py2IR.annotation_names(annotation.left) + Py2IR.annotation_names(
+                annotation.right
+            )
+        if isinstance(annotation, ast.Subscript) and ast.unparse(
+            annotation.value
+        ) in ("Union", "typing.Union"):
+            members = annotation.slice
+            if isinstance(members, ast.Tuple):
+                members = members.elts
+            else:
+                members = [members]
+            return [name for member in members for name in Py2IR.annotation_names(member)]
+        return [ast.unparse(annotation)]
+
+    @staticmethod
+    def tuple_annotation_names(annotation: ast.expr) -> List[str] | None:
+        """The type names of a `tuple[float, float]` annotation, None if the
+        annotation is not a tuple"""
+
+        if not isinstance(annotation, ast.Subscript) or not ast.unparse(
+            annotation.value
+        ) in ("tuple", "Tuple", "typing.Tuple"):
+            return None
+        members = annotation.slice
+        if isinstance(members, ast.Tuple):
+            members = members.elts
+        else:
+            members = [members]
+        return [ast.unparse(member) for member in members]
+
+    @staticmethod
+    def is_polymorphic(node: ast.FunctionDef) -> bool:
+        """A function is polymorphic when any of its arguments is unannotated
+        or annotated with a union. These are compiled once per signature."""
+
+        for argument in node.args.args:
+            names = Py2IR.annotation_names(argument.annotation)
+            if names is None or len(names) > 1:
+                return True
+        return False
+
     def generate_cfunctype(self, node: ast.FunctionDef) -> ctypes.CFUNCTYPE:
-        """Use the python function to create a CFUNCTYPE that represents it"""
+        """Use the python function to create a CFUNCTYPE that represents it
+
+        When the Py2IR was created with a signature the argument types are
+        taken from the signature instead, checked against the annotations.
+        Bound arguments are left out, the types of every argument are kept in
+        `argtypes`.
+        """
 
         cfunctype_returns = None
         cfunctype_args = []
         if not node.returns is None:
             # Obtain the "name" which in this case is the return type
-            name: ast.Name = node.returns
-            if name.id in CompilableTypes.TYPE_MAP:
-                cfunctype_returns = CompilableTypes.TYPE_MAP[name.id]
+            name = ast.unparse(node.returns)
+            values = self.tuple_annotation_names(node.returns)
+            if values is not None:
+                if not all(
+                    CompilableTypes.TYPE_MAP.get(value) is ctypes.c_double
+                    and not value in CompilableTypes.ARGUMENT_ONLY_TYPES
+                    for value in values
+                ):
+                    raise CompilerException(
+                        f"Unable to generate compile type for return type {name}",
+                        self.file_name,
+                        node,
+                    )
+                cfunctype_returns = double_tuple_type(len(values))
+            elif (
+                name in CompilableTypes.TYPE_MAP
+                and not name in CompilableTypes.ARGUMENT_ONLY_TYPES
+            ):
+                cfunctype_returns = CompilableTypes.TYPE_MAP[name]
             else:
                 raise CompilerException(
-                    f"Unable to generate compile type for return type {name.id}",
+                    f"Unable to generate compile type for return type {name}",
                     self.file_name,
                     node,
                 )
+        elif self.signature is not None:
+            # Specializations of unannotated functions return doubles
+            cfunctype_returns = ctypes.c_double
 
         arguments: ast.arguments = node.args
+        if self.signature is not None and len(self.signature) != len(arguments.args):
+            raise CompilerException(
+                f"Signature has {len(self.signature)} types for "
+                f"{len(arguments.args)} arguments",
+                self.file_name,
+                node,
+            )
+
         for arg_idx, argument in enumerate(arguments.args):
-            if argument.annotation is None:
+            names = self.annotation_names(argument.annotation)
+            if names is None and self.signature is None:
                 raise CompilerException(
                     f"Missing annotation argument arumgnet #{arg_idx}",
                     self.file_name,
                     argument,
                 )
-            arg_name: ast.Name = argument.annotation
-            if not arg_name.id in CompilableTypes.TYPE_MAP:
+            for name in names or []:
+                if not name in CompilableTypes.TYPE_MAP:
+                    raise CompilerException(
+                        f"Unable to generate compile type for argument {name}",
+                        self.file_name,
+                        argument,
+                    )
+
+            if self.signature is None:
+                if len(names) > 1:
+                    raise CompilerException(
+                        f"Union annotation of argument #{arg_idx} requires a signature",
+                        self.file_name,
+                        argument,
+                    )
+                cfunctype_args.append(CompilableTypes.TYPE_MAP[names[0]])
+                continue
+
+            argtype = self.signature[arg_idx]
+            if names is not None and not argtype in [
+                CompilableTypes.TYPE_MAP[name] for name in names
+            ]:
                 raise CompilerException(
-                    f"Unable to generate compile type for argument {arg_name.id}",
+                    f"Argument #{arg_idx} can not be specialized to {argtype.__name__}",
                     self.file_name,
                     argument,
                 )
-            cfunctype_args.append(CompilableTypes.TYPE_MAP[arg_name.id])
+            cfunctype_args.append(argtype)
+
+        unknown = set(self.bound) - {argument.arg for argument in arguments.args}
+        if unknown:
+            raise CompilerException(
+                f"Unable to bind {', '.join(sorted(unknown))}, not an argument",
+                self.file_name,
+                node,
+            )
+        self.argtypes = cfunctype_args
+        cfunctype_args = [
+            argtype
+            for argument, argtype in zip(arguments.args, cfunctype_args)
+            if not argument.arg in self.bound
+        ]
 
         # The CFUNCTYPE that is used to call the JITed function
         cdef = ctypes.CFUNCTYPE(cfunctype_returns, *cfunctype_args)
@@ -129,7 +353,7 @@ class Py2IR(ast.NodeVisitor):
 
         # Check if the assignment needs a version bump
         if node.targets[0].id in self.variable_db:
-            self.variable_db[node.targets[0].id] += 1
+            self.__bump_variable(node.targets[0].id)
             target_name = self.visit(target_name)
         else:
             target_name = self.visit(target_name)
@@ -152,6 +376,41 @@ class Py2IR(ast.NodeVisitor):
 
         return assign_ir + [assign_stmt]
 
+    def visit_Call(self, node: ast.Call):
+        """Calls of `math` functions are calls of their libm counterparts"""
+        if not (
+            isinstance(node.func, ast.Attribute)
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "math"
+            and node.func.attr in MATH_FUNCTIONS
+        ):
+            raise CompilerException(
+                f"Unable to call {ast.unparse(node.func)}, only functions of the "
+                "math module may be called",
+                self.file_name,
+                node,
+            )
+
+        symbol, n_args = MATH_FUNCTIONS[node.func.attr]
+        if node.keywords or len(node.args) != n_args:
+            raise CompilerException(
+                f"math.{node.func.attr} takes {n_args} positional arguments",
+                self.file_name,
+                node,
+            )
+
+        call_ir = []
+        arguments = []
+        for argument in node.args:
+            argument_ir = self.visit(argument)
+            if type(argument_ir).__name__ == "list":
+                call_ir += argument_ir
+            arguments.append(self.__result_variable(argument_ir))
+
+        result = self.__create_no_name_variable()
+        call = IRGrammar.call_tuple(symbol, tuple(arguments))
+        return call_ir + [IRGrammar.assignment_tuple(result, call)]
+
     def visit_Constant(self, node: ast.Constant):
         const_type = type(node.value).__name__
         match const_type:
@@ -161,7 +420,44 @@ class Py2IR(ast.NodeVisitor):
             case _:
                 raise NotImplementedError(type(node.value))
 
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        match type(node.op).__name__:
+            case "UAdd":
+                return self.visit(node.operand)
+            case "USub":
+                if isinstance(node.operand, ast.Constant):
+                    negated = ast.Constant(-node.operand.value)
+                    return self.visit(ast.copy_location(negated, node))
+
+                # -x is computed as x * -1.0 which is exact for every value,
+                # including signed zeros
+                negation = ast.BinOp(node.operand, ast.Mult(), ast.Constant(-1.0))
+                return self.visit(ast.copy_location(negation, node))
+            case _:
+                raise NotImplementedError(node.op)
+
+    def __power(self, node: ast.BinOp):
+        """`x ** y` is a call of libm pow, as in python. Integer exponents are
+        converted to doubles, IROptimizer reduces constant exponents to
+        multiplications."""
+        exponent = node.right
+        if (
+            isinstance(exponent, ast.UnaryOp)
+            and isinstance(exponent.op, ast.USub)
+            and isinstance(exponent.operand, ast.Constant)
+        ):
+            exponent = ast.copy_location(ast.Constant(-exponent.operand.value), exponent)
+        if isinstance(exponent, ast.Constant) and type(exponent.value) is int:
+            exponent = ast.copy_location(ast.Constant(float(exponent.value)), exponent)
+
+        pow_function = ast.Attribute(ast.Name("math", ast.Load()), "pow", ast.Load())
+        call = ast.Call(pow_function, [node.left, exponent], [])
+        return self.visit_Call(ast.copy_location(call, node))
+
     def visit_BinOp(self, node: ast.BinOp):
+        if isinstance(node.op, ast.Pow):
+            return self.__power(node)
+
         left_eval = self.visit(node.left)
         right_eval = self.visit(node.right)
 
@@ -226,20 +522,251 @@ class Py2IR(ast.NodeVisitor):
         # Keep track of the initial register values that coorespond to the
         # function arguments
         function_ir = []
-        for arg_idx, argument in enumerate(cdef.argtypes):
-            match argument.__name__:
+        arg_idx = 0
+        for argument, argtype in zip(node.args.args, self.argtypes):
+            if argument.arg in self.bound:
+                # The value is a constant of the function, it is rounded to
+                # the precision of the argument as passing it would
+                value = self.bound[argument.arg]
+                if argtype is ctypes.c_float:
+                    value = ctypes.c_float(value).value
+                arg_vv = self.__get_named_variable(argument.arg)
+                function_ir += [
+                    IRGrammar.assignment_tuple(
+                        arg_vv, IRGrammar.const_statement_tuple(float(value))
+                    )
+                ]
+                continue
+
+            if arg_idx < self.XMM_ARGUMENTS:
+                arg_location = IRGrammar.xmm_registers_tuple(f"%xmm{arg_idx}")
+            else:
+                arg_location = IRGrammar.stack_argument_tuple(arg_idx - self.XMM_ARGUMENTS)
+            arg_idx += 1
+            match argtype.__name__:
                 case "c_double":
-                    arg_vv = self.__get_named_variable(node.args.args[arg_idx].arg)
-                    arg_location = IRGrammar.xmm_registers_tuple(f"%xmm{arg_idx}")
+                    arg_vv = self.__get_named_variable(argument.arg)
                     arg_assignment = IRGrammar.assignment_tuple(arg_vv, arg_location)
                     function_ir += [arg_assignment]
+                case "c_float":
+                    single = self.__create_no_name_variable()
+                    arg_vv = self.__get_named_variable(argument.arg)
+                    function_ir += [
+                        IRGrammar.assignment_tuple(
+                            single, IRGrammar.convert_tuple("single", arg_location)
+                        ),
+                        IRGrammar.assignment_tuple(
+                            arg_vv, IRGrammar.convert_tuple("double", single)
+                        ),
+                    ]
                 case _:
                     raise CompilerException("TODO 2", self.file_location, node)
 
         # Loop through all the statements in this function body
-        for stmt in node.body:
-            function_ir += self.visit(stmt)
-        return function_ir
+        body_ir = self.visit_body(node.body)
+        if not self.__terminates(body_ir):
+            raise CompilerException(
+                "Every path of a compiled function must return a value",
+                self.file_name,
+                node,
+            )
+
+        if len(self.return_arities) > 1:
+            raise CompilerException(
+                "Every return of a compiled function must return as many values",
+                self.file_name,
+                node,
+            )
+        (arity,) = self.return_arities
+        if node.returns is None and self.signature is not None and arity is not None:
+            # Specializations of unannotated functions return what they return
+            cdef = ctypes.CFUNCTYPE(double_tuple_type(arity), *cdef.argtypes)
+            cdef.argtypes = self.cdef.argtypes
+            cdef.restype = double_tuple_type(arity)
+            self.cdef = cdef
+        returns_tuple = isinstance(self.cdef.restype, type) and issubclass(
+            self.cdef.restype, DoubleTuple
+        )
+        if (arity is None and returns_tuple) or (
+            arity is not None
+            and (not returns_tuple or len(self.cdef.restype._fields_) != arity)
+        ):
+            raise CompilerException(
+                "The returned values do not match the return annotation",
+                self.file_name,
+                node,
+            )
+        return function_ir + body_ir
+
+    def visit_body(self, body: List[ast.stmt]):
+        """Visit a list of statements, statements following a return are
+        unreachable and dropped"""
+        body_ir = []
+        for stmt in body:
+            body_ir += self.visit(stmt)
+            if self.__terminates(body_ir):
+                break
+        return body_ir
+
+    def visit_condition(self, node: ast.expr):
+        """Visit the test of a conditional to a mask, returns the statements
+        and the variable holding the mask. Comparisons may be chained and
+        combined with `and` and `or`, the operands have no side effects so
+        both sides are always evaluated. Any other expression is true when it
+        is not equal to zero, as in python."""
+
+        match type(node).__name__:
+            case "Compare":
+                condition_ir = []
+                masks = []
+                left = self.visit(node.left)
+                if type(left).__name__ == "list":
+                    condition_ir += left
+                for op, comparator in zip(node.ops, node.comparators):
+                    right = self.visit(comparator)
+                    if type(right).__name__ == "list":
+                        condition_ir += right
+                    match type(op).__name__:
+                        case "Lt":
+                            compare_op = "<"
+                        case "LtE":
+                            compare_op = "<="
+                        case "Gt":
+                            compare_op = ">"
+                        case "GtE":
+                            compare_op = ">="
+                        case "Eq":
+                            compare_op = "=="
+                        case "NotEq":
+                            compare_op = "!="
+                        case _:
+                            raise NotImplementedError(op)
+                    mask = self.__create_no_name_variable()
+                    condition_ir.append(
+                        IRGrammar.assignment_tuple(
+                            mask,
+                            IRGrammar.compare_tuple(
+                                self.__result_variable(left),
+                                compare_op,
+                                self.__result_variable(right),
+                            ),
+                        )
+                    )
+                    masks.append(mask)
+                    left = right
+                return self.__combine_masks(condition_ir, masks, "&")
+            case "BoolOp":
+                condition_ir = []
+                masks = []
+                for value in node.values:
+                    value_ir, mask = self.visit_condition(value)
+                    condition_ir += value_ir
+                    masks.append(mask)
+                op = "&" if type(node.op).__name__ == "And" else "|"
+                return self.__combine_masks(condition_ir, masks, op)
+            case _:
+                zero = ast.copy_location(ast.Constant(0.0), node)
+                compare = ast.Compare(node, [ast.NotEq()], [zero])
+                return self.visit_condition(ast.copy_location(compare, node))
+
+    def __combine_masks(self, condition_ir, masks, op):
+        mask = masks[0]
+        for other in masks[1:]:
+            combined = self.__create_no_name_variable()
+            condition_ir.append(
+                IRGrammar.assignment_tuple(
+                    combined, IRGrammar.binop_tuple(mask, op, other)
+                )
+            )
+            mask = combined
+        return condition_ir, mask
+
+    def visit_branches(self, test: ast.expr, visit_then, visit_else):
+        """Lower a conditional to a branch and the two arms. `visit_then` and
+        `visit_else` visit an arm and return its statements along with the
+        variable holding the value of the arm, if any.
+
+        Variables assigned differently by the arms are merged by phi nodes at
+        the join, in the order then, else. An arm ending in a return does not
+        reach the join."""
+
+        condition_ir, mask = self.visit_condition(test)
+        then_label, else_label, join_label = self.__create_labels()
+
+        ir = condition_ir + [
+            IRGrammar.branch_statement_tuple(mask, then_label, else_label),
+            IRGrammar.label_statement_tuple(then_label),
+        ]
+        versions = dict(self.variable_db)
+
+        then_ir, then_value = visit_then()
+        then_versions = dict(self.variable_db)
+        ir += then_ir
+        if not self.__terminates(then_ir):
+            ir.append(IRGrammar.goto_statement_tuple(join_label))
+
+        # The else arm starts from the versions before the branch. Variables
+        # first defined by the then arm stay known so their names stay unique
+        self.variable_db.update(versions)
+        ir.append(IRGrammar.label_statement_tuple(else_label))
+        else_ir, else_value = visit_else()
+        else_versions = dict(self.variable_db)
+        ir += else_ir
+        if not self.__terminates(else_ir):
+            ir.append(IRGrammar.goto_statement_tuple(join_label))
+
+        if self.__terminates(then_ir) and self.__terminates(else_ir):
+            return ir, None
+        ir.append(IRGrammar.label_statement_tuple(join_label))
+        if self.__terminates(then_ir):
+            self.variable_db.update(else_versions)
+            return ir, else_value
+        if self.__terminates(else_ir):
+            self.variable_db.update(then_versions)
+            return ir, then_value
+
+        for name in then_versions:
+            if then_versions[name] == else_versions[name]:
+                self.variable_db[name] = then_versions[name]
+                continue
+            self.__bump_variable(name)
+            ir.append(
+                IRGrammar.assignment_tuple(
+                    self.__get_named_variable(name),
+                    IRGrammar.phi_tuple(
+                        IRGrammar.versioned_variable_tuple(name, then_versions[name]),
+                        IRGrammar.versioned_variable_tuple(name, else_versions[name]),
+                    ),
+                )
+            )
+
+        if then_value is None:
+            return ir, None
+        value = self.__create_no_name_variable()
+        ir.append(
+            IRGrammar.assignment_tuple(value, IRGrammar.phi_tuple(then_value, else_value))
+        )
+        return ir, value
+
+    def visit_If(self, node: ast.If):
+        if_ir, _ = self.visit_branches(
+            node.test,
+            lambda: (self.visit_body(node.body), None),
+            lambda: (self.visit_body(node.orelse), None),
+        )
+        return if_ir
+
+    def visit_IfExp(self, node: ast.IfExp):
+        def visit_arm(arm: ast.expr):
+            arm_ir = self.visit(arm)
+            if type(arm_ir).__name__ == "list":
+                return arm_ir, self.__result_variable(arm_ir)
+            return [], arm_ir
+
+        ifexp_ir, value = self.visit_branches(
+            node.test, lambda: visit_arm(node.body), lambda: visit_arm(node.orelse)
+        )
+        return ifexp_ir
 
     def visit_Name(self, node: ast.Name):
         return self.__get_named_variable(node.id)
@@ -251,8 +778,28 @@ class Py2IR(ast.NodeVisitor):
         return module_ir
 
     def visit_Return(self, node: ast.Return):
+        if isinstance(node.value, ast.Tuple):
+            return_ir = []
+            values = []
+            for element in node.value.elts:
+                element_ir = self.visit(element)
+                if type(element_ir).__name__ == "list":
+                    return_ir += element_ir
+                values.append(self.__result_variable(element_ir))
+            self.return_arities.add(len(values))
+            return return_ir + [IRGrammar.returns_values_tuple(tuple(values))]
+
+        self.return_arities.add(None)
         ir = self.visit(node.value)
 
+        if self.cdef.restype is ctypes.c_float:
+            # Round the double result to single precision
+            result = self.__create_no_name_variable()
+            single = IRGrammar.convert_tuple("single", self.__result_variable(ir))
+            ir = (ir if type(ir).__name__ == "list" else []) + [
+                IRGrammar.assignment_tuple(result, single)
+            ]
+
         if type(ir).__name__ == "list":
             last_assignment = ir[-1]
             versioned_var: IRGrammar.versioned_variable_tuple = last_assignment.Left
@@ -3,8 +3,23 @@ from pycc.ssair.irassembler_x64 import IRAssemblerX64
 from pycc.ssair.irparser import IRParser
 from pycc.ssair.iroptimizer import IROptimizer
 from pycc import execmem
+from pycc.execmem import memory_stats, set_memory_budget
+from pycc.profiling import (
+    enable_perf_map,
+    disable_perf_map,
+    enable_jitdump,
+    disable_jitdump,
+    enable_counters,
+    disable_counters,
+    reset_counters,
+    counter_stats,
+)
+from pycc.dispatch import PyObject_Dispatcher, bind_arguments
+from pycc.tiered import PyObject_Tiered, set_default_threshold, tiering_stats
+from concurrent.futures import ThreadPoolExecutor
 from types import FunctionType
 from pathlib import Path
+from typing import Dict, List
 
 import os
 import sys
@@ -12,11 +27,16 @@ import tempfile
 import mmap
 import ctypes
 import ctypes.util
+import functools
 import ast
+import asyncio
 import inspect
 import subprocess
 import logging
 import shutil
+import textwrap
+import threading
+import weakref
 import resource
 
 """Ensure proper dependencies on file import. The dependencies required for
@@ -43,124 +63,799 @@ if not __checked:
 
 logger = logging.getLogger(__name__)
 
-"""Memory mapped objects will go out of reference and be garbage collected.
-These memory mapped objects will reside in this function map to keep a global
-reference alive of the mmaped memory. Without this pycc will segfault when
-the user calls a function who's memory has been free'ed.
+"""Every live compiled function keyed by its module and qualified name. The
+references are weak: the executable memory of a compiled function is released
+once the function goes out of scope, is unloaded or is evicted by the memory
+budget. See execmem.ExecMemManager.
 """
-func_map = {}
+func_map = weakref.WeakValueDictionary()
 
+"""Serializes compilation and registration into func_map. The lock is
+reentrant so that helpers which assemble code may be called while compiling."""
+__compile_lock = threading.RLock()
 
-def __get_pycache_location(func: FunctionType):
+"""Compilations of compile_async that run at once in an event loop"""
+ASYNC_COMPILE_CONCURRENCY = os.cpu_count() or 1
+
+"""The state of compile_async in each event loop. Loops of several threads
+share the dictionary, its lock is never held for longer than a lookup so that
+no event loop waits for a compilation in another thread."""
+__async_states = weakref.WeakKeyDictionary()
+__async_states_lock = threading.Lock()
+
+"""Socket of the compile server that compilations are handed to, None to
+compile in-process. See pycc.server, enabled by enable_compile_server or at
+import by the environment variable PYCC_COMPILE_SERVER=<socket> or =1 for the
+default socket."""
+__compile_server = None
+__spawn_compile_server = True
+
+
+def enable_compile_server(socket_path: str = None, spawn: bool = True):
+    """Hand compilations to the compile server listening on `socket_path`,
+    by default the per user socket of pycc.server. With `spawn` the server
+    is started when it does not run yet. Functions are compiled in-process
+    whenever the server is unavailable."""
+    global __compile_server, __spawn_compile_server
+    from pycc import server
+
+    __compile_server = str(socket_path or server.default_socket_path())
+    __spawn_compile_server = spawn
+
+
+def disable_compile_server():
+    """Compile in-process again"""
+    global __compile_server
+    __compile_server = None
+
+
+if os.environ.get("PYCC_COMPILE_SERVER"):
+    enable_compile_server(
+        None
+        if os.environ["PYCC_COMPILE_SERVER"] == "1"
+        else os.environ["PYCC_COMPILE_SERVER"]
+    )
+
+
+def __get_pycache_location(file_name: str):
     """Obtain the __pycache__ directory to store debug and temporary files"""
-    file_location = Path(inspect.getfile(func))
+    file_location = Path(file_name)
     pycache_dir = file_location.parent / Path(sys.implementation.cache_tag)
     return pycache_dir.parent / "__pycache__"
 
 
-def __cfunctype_to_c_prototype(func: ctypes.CFUNCTYPE) -> str:
-    """Helper function to convert cfunctype to a c like function def string"""
-    c_str = ""
-    match func.restype.__qualname__:
-        case "c_double":
-            c_str += "double {}("
+def __cfunctype_to_c_prototype(func: ctypes.CFUNCTYPE, name: str = None) -> str:
+    """Helper function to convert cfunctype to a c like function def string,
+    see execmem.c_prototype"""
+    return execmem.c_prototype(func, name)
 
-    for arg_idx, argument in enumerate(func.argtypes):
-        match argument.__qualname__:
-            case "c_double":
-                c_str += "double"
-        if arg_idx + 1 != len(func.argtypes):
-            c_str += ", "
-    c_str += ");"
-    return c_str
 
+def __toolchain_commands(base_name: Path) -> list:
+    """The `as` and `ld` command lines turning `base_name`.s into the flat
+    binary `base_name`.bin"""
+    return [
+        ["as", "--64", "-o", str(base_name.with_suffix(".o")), str(base_name.with_suffix(".s"))],
+        [
+            "ld",
+            "-T",
+            str(Path(__file__).parent / "ld/jit.ld"),
+            "--oformat",
+            "binary",
+            "-o",
+            str(base_name.with_suffix(".bin")),
+            str(base_name.with_suffix(".o")),
+        ],
+    ]
 
-def compile(func: FunctionType):
-    """Compile the python code.
 
-    On success this function returns a function that when called will execute
-    the just in time compiled code.
+def __print_command(command: list):
+    """Print a toolchain command with the artifacts relative to their
+    directory"""
+    package = str(Path(__file__).parent) + os.sep
+    print(
+        "\t",
+        " ".join(
+            argument[len(package) :]
+            if argument.startswith(package)
+            else Path(argument).name
+            if os.sep in argument
+            else argument
+            for argument in command
+        ),
+    )
+
+
+def assemble(assembly_code: str, base_name: Path) -> bytes:
+    """Run gnu `as` and `ld` over the assembly code and return the flat binary.
+
+    The `.s`, `.o` and `.bin` artifacts are written next to `base_name`. The
+    caller is responsible for serializing calls that share a `base_name`.
     """
 
-    func_name = func.__name__
-    print(f"pycc: compiling function '{func_name}'")
+    with open(base_name.with_suffix(".s"), mode="w+t") as fp:
+        fp.write(assembly_code)
 
-    artifacts = __get_pycache_location(func)
-    artifacts.mkdir(parents=True, exist_ok=True)
+    for command in __toolchain_commands(base_name):
+        __print_command(command)
+        subprocess.call(command)
 
-    safe_name = Path(inspect.getfile(func)).name.split(".")[0]
-    safe_name += "-" + func.__qualname__
-    safe_name += "-" + func.__name__
+    with open(base_name.with_suffix(".bin"), "r+b") as fp:
+        return fp.read()
+
+
+async def assemble_async(assembly_code: str, base_name: Path) -> bytes:
+    """assemble without blocking the event loop, `as` and `ld` run as
+    asyncio subprocesses. Cancelling the assembly kills the running tool, a
+    tool that fails raises a RuntimeError."""
+
+    with open(base_name.with_suffix(".s"), mode="w+t") as fp:
+        fp.write(assembly_code)
+
+    for command in __toolchain_commands(base_name):
+        __print_command(command)
+        process = await asyncio.create_subprocess_exec(*command)
+        try:
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                # The tool exited on its own
+                pass
+            await process.wait()
+            raise
+        if returncode != 0:
+            raise RuntimeError(f"pycc: {command[0]} exited with status {returncode}")
+
+    with open(base_name.with_suffix(".bin"), "r+b") as fp:
+        return fp.read()
 
-    base_name = artifacts / safe_name
+
+def __publish_artifacts(tmp_name: Path, base_name: Path):
+    """Copy the artifacts assembled at `tmp_name` to the debug artifacts at
+    `base_name`. Each file is replaced atomically, concurrent compilations of
+    a function leave the complete artifacts of one of them."""
+    for suffix in (".s", ".o", ".bin"):
+        target = base_name.with_suffix(suffix)
+        fd, staged = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}-")
+        try:
+            with os.fdopen(fd, "wb") as fp, open(tmp_name.with_suffix(suffix), "rb") as src:
+                shutil.copyfileobj(src, fp)
+            os.replace(staged, target)
+        except BaseException:
+            os.unlink(staged)
+            raise
+
+
+def __lower_source(
+    source: str,
+    file_name: str,
+    qualname: str,
+    signature: List[type] | None = None,
+    fast_math: bool = False,
+    vectorize: bool = True,
+    bound: Dict[str, float] | None = None,
+):
+    """Lower the dedented `source` of a function to x86-64 assembly, the
+    caller holds the compile lock. Arguments named in `bound` are replaced by
+    their constant values.
+
+    Returns the front end, which holds the C signature of the function, the
+    IR assembler and the base name of the debug artifacts.
+    """
+
+    artifacts = __get_pycache_location(file_name)
+    artifacts.mkdir(parents=True, exist_ok=True)
 
     # Try to compile the function body of the decorated function
-    syntax: ast.AST = ast.parse(inspect.getsource(func))
-    py2ir = Py2IR(inspect.getfile(func))
-    ir = py2ir.visit(syntax)
+    syntax: ast.AST = ast.parse(source)
+    name = syntax.body[0].name
 
-    ir = IROptimizer(ir).ir
-    with open(base_name.with_suffix(".ir"), mode="w+t") as fp:
-        fp.write(IRParser.unparse(ir))
+    safe_name = Path(file_name).name.split(".")[0]
+    safe_name += "-" + qualname
+    safe_name += "-" + name
+    if signature is not None:
+        safe_name += "".join("-" + argtype.__name__ for argtype in signature)
+    if fast_math:
+        safe_name += "-fastmath"
+    if bound:
+        # Dots would be taken for the suffix of the artifacts
+        safe_name += "".join(
+            f"-{arg}={value!r}".replace(".", "_") for arg, value in sorted(bound.items())
+        )
 
-    ir_assembler = IRAssemblerX64(ir)
-    ir_assembler.assemble()
+    base_name = artifacts / safe_name
 
-    with open(base_name.with_suffix(".s"), mode="w+t") as fp:
-        assembly_code = ir_assembler.asmx64.gen_gnu_as()
+    py2ir = Py2IR(file_name, signature, bound)
+    ir_assembler = __lower_ir(py2ir.visit(syntax), fast_math, vectorize, base_name)
+    return py2ir, ir_assembler, base_name
 
-        fp.write(assembly_code)
-        fp.flush()
 
+def __lower_ir(
+    ir: List,
+    fast_math: bool = False,
+    vectorize: bool = True,
+    base_name: Path | None = None,
+) -> IRAssemblerX64:
+    """Optimize the IR of a function and lower it to x86-64 assembly, the
+    caller holds the compile lock. The optimized IR is written next to
+    `base_name` when one is given."""
+
+    optimizer = IROptimizer(ir, fast_math=fast_math)
+    ir = optimizer.ir
+    print(
+        "\t",
+        "iroptimizer",
+        " ".join(f"{name}={count}" for name, count in optimizer.stats.items()),
+    )
+    if base_name is not None:
+        with open(base_name.with_suffix(".ir"), mode="w+t") as fp:
+            fp.write(IRParser.unparse(ir))
+
+    ir_assembler = IRAssemblerX64(ir, vectorize=vectorize)
+    ir_assembler.assemble()
+    if vectorize:
         print(
             "\t",
+            "irvectorizer",
             " ".join(
-                [
-                    "as",
-                    "--64",
-                    "-o",
-                    str(base_name.with_suffix(".o").name),
-                    base_name.with_suffix(".s").name,
-                ]
+                f"{name}={count}" for name, count in ir_assembler.vectorizer.stats.items()
             ),
         )
-        subprocess.call(["as", "--64", "-o", str(base_name.with_suffix(".o")), fp.name])
 
-        fp_bin = tempfile.NamedTemporaryFile(delete=False, suffix=".bin")
-        fp_bin.close()
+    return ir_assembler
 
-        # Call linker
-        print(
-            "\t",
-            " ".join(
-                [
-                    "ld",
-                    "-T",
-                    str("ld/jit.ld"),
-                    "--oformat",
-                    "binary",
-                    "-o",
-                    base_name.with_suffix(".bin").name,
-                    base_name.with_suffix(".o").name,
-                ]
-            ),
+
+def __lower_function(
+    func: FunctionType,
+    signature: List[type] | None = None,
+    fast_math: bool = False,
+    vectorize: bool = True,
+):
+    """Lower `func` to x86-64 assembly, the caller holds the compile lock"""
+    return __lower_source(
+        textwrap.dedent(inspect.getsource(func)),
+        inspect.getfile(func),
+        func.__qualname__,
+        signature,
+        fast_math,
+        vectorize,
+    )
+
+
+def build(
+    source: str,
+    file_name: str,
+    qualname: str,
+    signature: List[type] | None = None,
+    fast_math: bool = False,
+    bound: Dict[str, float] | None = None,
+):
+    """Compile the dedented `source` of a function to machine code without
+    mapping it.
+
+    Returns the machine code, the CFUNCTYPE of the function and the libm
+    imports of the code, the arguments of PyObject_ExecMem.inject. This is
+    the part of compilation that the compile server runs for its clients.
+    """
+
+    with __compile_lock:
+        py2ir, ir_assembler, base_name = __lower_source(
+            source, file_name, qualname, signature, fast_math, bound=bound
         )
-        subprocess.call(
-            [
-                "ld",
-                "-T",
-                Path(__file__).parent / "ld/jit.ld",
-                "--oformat",
-                "binary",
-                "-o",
-                base_name.with_suffix(".bin"),
-                base_name.with_suffix(".o"),
-            ]
+    # Compilations of the same function in other threads, event loops or
+    # processes share the artifacts in __pycache__, they are assembled in a
+    # private directory and copied there afterwards
+    with tempfile.TemporaryDirectory(prefix="pycc-") as tmp_dir:
+        tmp_name = Path(tmp_dir) / base_name.name
+        code = assemble(ir_assembler.asmx64.gen_gnu_as(), tmp_name)
+        __publish_artifacts(tmp_name, base_name)
+    return code, py2ir.cdef, tuple(ir_assembler.asmx64.imports)
+
+
+def __compile_function(
+    func: FunctionType,
+    signature: List[type] | None = None,
+    fast_math: bool = False,
+    bound: Dict[str, float] | None = None,
+):
+    """Compile `func`, for the given argument types when a signature is given
+    and with the arguments in `bound` replaced by constants"""
+
+    func_name = func.__name__
+    print(f"pycc: compiling function '{func_name}'")
+
+    source = textwrap.dedent(inspect.getsource(func))
+    file_name = inspect.getfile(func)
+    built = None
+    # The compiler lock is not held while waiting for the server, other
+    # threads keep compiling in-process meanwhile
+    if __compile_server is not None:
+        from pycc import server
+
+        built = server.request_build(
+            __compile_server,
+            source,
+            file_name,
+            func.__qualname__,
+            signature,
+            fast_math,
+            bound,
+            spawn=__spawn_compile_server,
         )
+    # Without a server, or when it failed, compile in-process. Errors in
+    # the function are then raised as usual.
+    if built is None:
+        built = build(source, file_name, func.__qualname__, signature, fast_math, bound)
+    return __register(func, *built, fast_math, bound)
 
-    with open(base_name.with_suffix(".bin"), "r+b") as fp:
+
+def __func_map_key(
+    func: FunctionType, fast_math: bool = False, bound: Dict[str, float] | None = None
+) -> str:
+    key = f"{func.__module__}.{func.__qualname__}"
+    if bound:
+        key += "[" + ",".join(f"{arg}={value!r}" for arg, value in sorted(bound.items())) + "]"
+    # Fast math code rounds differently, it never replaces the strict code
+    if fast_math:
+        key += "[fast_math]"
+    return key
+
+
+def __register(
+    func: FunctionType,
+    code: bytes,
+    cdef,
+    imports: tuple,
+    fast_math: bool = False,
+    bound: Dict[str, float] | None = None,
+) -> execmem.PyObject_ExecMem:
+    """Map the machine code compiled from `func` and register it in
+    func_map"""
+
+    with __compile_lock:
         obj = execmem.PyObject_ExecMem()
-        code = fp.read()
-        obj.inject(code, py2ir.cdef)
+        obj.name = func.__qualname__
+        obj.py_func = bind_arguments(func, bound) if bound else func
+        obj.inject(code, cdef, imports)
+        func_map[__func_map_key(func, fast_math, bound)] = obj
 
     return obj
+
+
+def __lower_source_locked(*args):
+    with __compile_lock:
+        return __lower_source(*args)
+
+
+def set_compile_concurrency(limit: int):
+    """Change the number of compile_async compilations that run at once in
+    each event loop, for the loops that start compiling from now on"""
+    global ASYNC_COMPILE_CONCURRENCY
+    if limit < 1:
+        raise ValueError("the compile concurrency must be at least 1")
+    ASYNC_COMPILE_CONCURRENCY = limit
+
+
+def __async_state(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    """The semaphore limiting the compilations of `loop`"""
+    with __async_states_lock:
+        state = __async_states.get(loop)
+        if state is None:
+            state = asyncio.Semaphore(ASYNC_COMPILE_CONCURRENCY)
+            __async_states[loop] = state
+        return state
+
+
+async def compile_async(
+    func: FunctionType,
+    *,
+    fast_math: bool = False,
+    semaphore: asyncio.Semaphore = None,
+):
+    """Compile the python code without blocking the running event loop.
+
+    The front end, the optimizer and the register allocation run in the
+    default executor of the loop, `as` and `ld` run as asyncio subprocesses.
+    The result is the callable the synchronous pycc.compile returns, it is
+    registered in func_map the same way.
+
+    At most ASYNC_COMPILE_CONCURRENCY compilations of a loop run at once, see
+    set_compile_concurrency, unless a `semaphore` of the caller limits them
+    instead. Cancelling the returned coroutine kills a running `as` or `ld`
+    and nothing is registered. A lowering already running in the executor
+    finishes in the background, its result is discarded.
+
+    Polymorphic functions return their dispatcher at once, the dispatcher
+    compiles each signature synchronously on its first call.
+    """
+
+    syntax: ast.AST = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    if Py2IR.is_polymorphic(syntax.body[0]):
+        return PyObject_Dispatcher(
+            func, functools.partial(__compile_function, fast_math=fast_math)
+        )
+
+    loop = asyncio.get_running_loop()
+    default_semaphore = __async_state(loop)
+    async with semaphore or default_semaphore:
+        print(f"pycc: compiling function '{func.__name__}'")
+        source = textwrap.dedent(inspect.getsource(func))
+        file_name = inspect.getfile(func)
+
+        built = None
+        if __compile_server is not None:
+            from pycc import server
+
+            built = await loop.run_in_executor(
+                None,
+                functools.partial(
+                    server.request_build,
+                    __compile_server,
+                    source,
+                    file_name,
+                    func.__qualname__,
+                    None,
+                    fast_math,
+                    spawn=__spawn_compile_server,
+                ),
+            )
+
+        if built is None:
+            py2ir, ir_assembler, base_name = await loop.run_in_executor(
+                None,
+                __lower_source_locked,
+                source,
+                file_name,
+                func.__qualname__,
+                None,
+                fast_math,
+            )
+            # Assembled in a private directory as build does, compilations of
+            # the function elsewhere may write the same artifacts meanwhile
+            with tempfile.TemporaryDirectory(prefix="pycc-") as tmp_dir:
+                tmp_name = Path(tmp_dir) / base_name.name
+                code = await assemble_async(ir_assembler.asmx64.gen_gnu_as(), tmp_name)
+                __publish_artifacts(tmp_name, base_name)
+            built = (code, py2ir.cdef, tuple(ir_assembler.asmx64.imports))
+
+        return await loop.run_in_executor(
+            None, functools.partial(__register, func, *built, fast_math)
+        )
+
+
+def compile(
+    func: FunctionType = None,
+    *,
+    tiered: bool = False,
+    threshold: int = None,
+    fast_math: bool = False,
+):
+    """Compile the python code.
+
+    On success this function returns a function that when called will execute
+    the just in time compiled code. Compilation is serialized by a module lock
+    so that decorated functions may be compiled from several threads at once.
+
+    Functions with unannotated or union annotated arguments are compiled
+    lazily, once for every signature they are called with. See
+    pycc.dispatch.PyObject_Dispatcher.
+
+    There is no integer arithmetic. Arguments annotated or called with `int`
+    are widened to doubles, integers beyond 2**53 are rounded, and int and
+    float arguments share a specialization. Return annotations of `int` are
+    rejected since the result would be a float.
+
+    With `tiered` the function runs interpreted until it was called `threshold`
+    times and is then compiled on a background thread. See
+    pycc.tiered.PyObject_Tiered. The options are given to the decorator as
+    `@compile(tiered=True, threshold=100)`.
+
+    By default the compiled code rounds every operation as python does. With
+    `fast_math` the optimizer may reassociate sums and products into balanced
+    trees, evaluate polynomials in Estrin form and multiply by reciprocals
+    instead of dividing. This shortens the dependency chains of long
+    expressions but the results may differ from python in the last bits.
+    """
+
+    if func is None:
+        return lambda func: compile(
+            func, tiered=tiered, threshold=threshold, fast_math=fast_math
+        )
+
+    compile_now = functools.partial(__compile_now, fast_math=fast_math)
+    if tiered:
+        return PyObject_Tiered(func, compile_now, threshold)
+    return compile_now(func)
+
+
+def __compile_now(func: FunctionType, fast_math: bool = False):
+    syntax: ast.AST = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    if Py2IR.is_polymorphic(syntax.body[0]):
+        return PyObject_Dispatcher(
+            func, functools.partial(__compile_function, fast_math=fast_math)
+        )
+
+    return __compile_function(func, fast_math=fast_math)
+
+
+"""File name that the front end reports errors of generated kernels in"""
+GENERATED_FILE_NAME = "<pycc-generated>"
+
+
+def __function_def(syntax: ast.AST, name: str = None) -> ast.Module:
+    """The module holding only the function `name` of `syntax`, by default
+    its first function"""
+    if isinstance(syntax, ast.FunctionDef):
+        node = syntax
+    else:
+        functions = [node for node in syntax.body if isinstance(node, ast.FunctionDef)]
+        node = next(
+            (node for node in functions if name is None or node.name == name), None
+        )
+        if node is None:
+            raise ValueError(
+                "no function to compile" if name is None else f"no function named '{name}'"
+            )
+    # Trees built by hand may lack the locations the errors are reported at
+    return ast.fix_missing_locations(ast.Module(body=[node], type_ignores=[]))
+
+
+def __generated_kernel(
+    kernel, signature: List[type] | None = None, fast_math: bool = False
+):
+    """The key of a kernel given to compile_many and a function lowering it.
+    Kernels with the same key compile to the same code.
+
+    The lowering returns the name, the CFUNCTYPE and the IR assembler of the
+    kernel, it is called with the compile lock held.
+    """
+
+    if isinstance(kernel, tuple):
+        ir, argtypes, *restype = kernel
+        restype = restype[0] if restype else ctypes.c_double
+        if isinstance(ir, str):
+            ir = list(IRParser.parse(ir))
+        ir = list(ir)
+        key = ("ir", IRParser.unparse(ir), tuple(argtypes), restype, fast_math)
+
+        def lower():
+            cdef = ctypes.CFUNCTYPE(restype, *argtypes)
+            cdef.argtypes = list(argtypes)
+            cdef.restype = restype
+            return "kernel", cdef, __lower_ir(ir, fast_math)
+
+        return key, lower
+
+    if isinstance(kernel, str):
+        kernel = ast.parse(textwrap.dedent(kernel))
+    if not isinstance(kernel, ast.AST):
+        raise TypeError(
+            "a kernel is a source string, an ast.FunctionDef or ast.Module, or a "
+            "tuple of IR and its argument types"
+        )
+    syntax = __function_def(kernel)
+    function = syntax.body[0]
+    if signature is None and Py2IR.is_polymorphic(function):
+        raise TypeError(
+            f"{function.name}: generated kernels need annotated arguments or a signature"
+        )
+    key = (
+        "ast",
+        ast.dump(syntax),
+        None if signature is None else tuple(signature),
+        fast_math,
+    )
+
+    def lower():
+        print(f"pycc: compiling function '{function.name}'")
+        py2ir = Py2IR(GENERATED_FILE_NAME, signature)
+        ir_assembler = __lower_ir(py2ir.visit(syntax), fast_math)
+        return function.name, py2ir.cdef, ir_assembler
+
+    return key, lower
+
+
+def compile_many(
+    kernels, *, fast_math: bool = False, workers: int = None
+) -> List[execmem.PyObject_ExecMem]:
+    """Compile generated kernels in bulk, without source files.
+
+    Each kernel is the source of a function, an ast.FunctionDef or an
+    ast.Module of which the first function is compiled, or a tuple
+    `(ir, argtypes)` or `(ir, argtypes, restype)` of SSA IR as IRParser
+    parses or unparses it. IR is compiled as it is: it binds its arguments to
+    their registers and returns values of `restype`, c_double by default.
+
+    Nothing is inspected and no artifacts are kept, `as` and `ld` run in a
+    temporary directory. The front end and the optimizer run one kernel after
+    the other while up to `workers` kernels are assembled at once. Identical
+    kernels are compiled once and share their result. The compiled functions
+    are returned in the order of `kernels`, they are not registered in
+    func_map. `fast_math` is the option of pycc.compile.
+    """
+
+    generated = [__generated_kernel(kernel, fast_math=fast_math) for kernel in kernels]
+    return __compile_generated(generated, workers)
+
+
+def __compile_generated(generated: list, workers: int = None) -> list:
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+
+    pending = {}
+    with tempfile.TemporaryDirectory(prefix="pycc-") as tmp_dir, ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="pycc-assemble"
+    ) as executor:
+        for key, lower in generated:
+            if key in pending:
+                continue
+            with __compile_lock:
+                name, cdef, ir_assembler = lower()
+            future = executor.submit(
+                assemble,
+                ir_assembler.asmx64.gen_gnu_as(),
+                Path(tmp_dir) / f"kernel{len(pending)}",
+            )
+            pending[key] = (name, cdef, tuple(ir_assembler.asmx64.imports), future)
+
+        compiled = {}
+        for key, (name, cdef, imports, future) in pending.items():
+            obj = execmem.PyObject_ExecMem()
+            obj.name = name
+            obj.inject(future.result(), cdef, imports)
+            compiled[key] = obj
+    return [compiled[key] for key, _ in generated]
+
+
+def compile_source(
+    source: str,
+    name: str = None,
+    *,
+    signature: List[type] = None,
+    fast_math: bool = False,
+):
+    """Compile the function `name` defined by `source`, by default its first
+    function, see compile_many. Unannotated arguments take their types from
+    `signature`."""
+    syntax = __function_def(ast.parse(textwrap.dedent(source)), name)
+    return __compile_generated([__generated_kernel(syntax, signature, fast_math)])[0]
+
+
+def compile_ast(node: ast.AST, *, signature: List[type] = None, fast_math: bool = False):
+    """Compile an ast.FunctionDef, or the first function of an ast.Module,
+    see compile_many"""
+    return __compile_generated([__generated_kernel(node, signature, fast_math)])[0]
+
+
+def compile_ir(ir, argtypes: List[type], restype=ctypes.c_double, *, fast_math: bool = False):
+    """Compile SSA IR, the text or the statements IRParser parses, of a
+    function over `argtypes` returning `restype`. See compile_many."""
+    return __compile_generated(
+        [__generated_kernel((ir, argtypes, restype), fast_math=fast_math)]
+    )[0]
+
+
+def __compile_bound_specialization(
+    specialized: FunctionType, signature: List[type], fast_math: bool = False
+):
+    """Compile a signature of the remaining arguments of `specialized`, a
+    polymorphic function with bound arguments. Bound values are passed as
+    doubles."""
+    func = inspect.unwrap(specialized)
+    signature = iter(signature)
+    return __compile_function(
+        func,
+        [
+            ctypes.c_double if arg in specialized.bound else next(signature)
+            for arg in inspect.signature(func).parameters
+        ],
+        fast_math,
+        specialized.bound,
+    )
+
+
+def specialize(func, /, *, fast_math: bool = False, **bound: float):
+    """Compile `func` with some of its arguments fixed to constants.
+
+    `pycc.specialize(normalize, low=-1.0, high=1.0)` returns a function of
+    the remaining arguments of `normalize`, in their order. The bound values
+    are substituted as constants before the optimizer runs, so that the work
+    depending on them alone is folded at compile time. `func` is a python
+    function or a function returned by pycc.compile.
+
+    Specializations are kept in func_map by their bound values, binding the
+    same values again returns the function compiled before while it is alive.
+    Polymorphic functions return a dispatcher over the remaining arguments.
+    """
+
+    func = getattr(func, "py_func", func)
+    if not isinstance(func, FunctionType):
+        raise TypeError("specialize requires a python function or a function compiled by pycc")
+    parameters = inspect.signature(func).parameters
+    for arg, value in bound.items():
+        if not arg in parameters:
+            raise TypeError(f"{func.__qualname__}() has no argument '{arg}'")
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError(f"{func.__qualname__}(): argument '{arg}' must be bound to a number")
+    bound = {arg: float(value) for arg, value in bound.items()}
+
+    syntax: ast.AST = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    if Py2IR.is_polymorphic(syntax.body[0]):
+        return PyObject_Dispatcher(
+            bind_arguments(func, bound),
+            functools.partial(__compile_bound_specialization, fast_math=fast_math),
+        )
+
+    with __compile_lock:
+        compiled = func_map.get(__func_map_key(func, fast_math, bound))
+    if compiled is None:
+        compiled = __compile_function(func, fast_math=fast_math, bound=bound)
+    return compiled
+
+
+def reduce(
+    kernel,
+    init: float = 0.0,
+    *,
+    op: str = "+",
+    accumulators: int = 4,
+    deterministic: bool = False,
+):
+    """Compile a reduction of `kernel` over buffers of doubles.
+
+    The returned pycc.reduction.PyObject_Reduction is called with one buffer
+    per kernel argument and returns `init op kernel(...) op kernel(...) ...`,
+    `op` is one of "+", "*", "min" or "max". `kernel` is a python function
+    over floats or a function returned by pycc.compile.
+
+    The native loop folds unrolled copies of the kernel into `accumulators`
+    independent accumulators which are combined when the loop is done. This
+    reorders the operations: sums and products may round differently than a
+    python loop would, although the result only depends on the data and the
+    options. With `deterministic` the values are combined one after the other
+    in the order of the buffers and the result is bit for bit that of a
+    python loop, at the cost of a serial dependency between iterations.
+    """
+
+    from pycc.reduction import (
+        REDUCTION_CFUNCTYPE,
+        PyObject_Reduction,
+        generate_reduction,
+    )
+
+    func = getattr(kernel, "py_func", kernel)
+    if not isinstance(func, FunctionType):
+        raise TypeError("reduce requires a python function or a function compiled by pycc")
+
+    # Polymorphic kernels are reduced over doubles
+    syntax: ast.AST = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    n_args = len(syntax.body[0].args.args)
+    signature = [ctypes.c_double] * n_args if Py2IR.is_polymorphic(syntax.body[0]) else None
+    if n_args == 0:
+        raise TypeError("reduce requires a kernel with at least one argument")
+
+    with __compile_lock:
+        print(f"pycc: compiling reduction of '{func.__name__}'")
+
+        # The reduction packs two elements into the lanes of every register
+        py2ir, ir_assembler, base_name = __lower_function(func, signature, vectorize=False)
+        cdef = py2ir.cdef
+        if cdef.restype is not ctypes.c_double or any(
+            argtype is not ctypes.c_double for argtype in cdef.argtypes
+        ):
+            raise TypeError("reduce requires a kernel over c_double values")
+
+        asmx64, layout = generate_reduction(
+            ir_assembler.asmx64, n_args, op, accumulators, deterministic
+        )
+        code = assemble(
+            asmx64.gen_gnu_as(), base_name.with_name(base_name.name + "-reduce")
+        )
+
+    stub = execmem.PyObject_ExecMem()
+    stub.name = f"{func.__qualname__}.reduce"
+    stub.inject(code, REDUCTION_CFUNCTYPE)
+    return PyObject_Reduction(stub, n_args, init, op, deterministic, layout)
@@ -0,0 +1,338 @@
+"""Reductions of compiled kernels over buffers.
+
+`pycc.reduce(kernel, init)` folds the values of a kernel over buffers of
+doubles, `init op kernel(x[0], ...) op kernel(x[1], ...) op ...`, in a single
+native loop. Calling the kernel per element would serialize the loop on the
+latency of `op`. Instead the reduction loop inlines the assembled kernel body
+several times per pass and folds each copy into its own accumulator register.
+The accumulators are independent so the copies overlap in the pipeline, and
+they are combined pairwise once the loop is done.
+
+Kernels without branches are packed: each copy of the body computes two
+elements at once with the packed forms of its instructions, and every
+accumulator register holds two lanes.
+
+Using several accumulators changes the order in which the values are combined,
+and so the rounding of a sum or a product. The order only depends on the
+options of the reduction, repeated runs over the same data give the same
+result. With `deterministic=True` a single accumulator combines the values in
+the order of the buffers, exactly like a python loop over the kernel.
+"""
+
+from pycc import execmem
+from pycc.assembler.asm_x64 import AsmX64
+from pycc.parallel import as_double_array
+
+import ctypes
+import functools
+
+# double reduce(double **inputs, int64_t n, double init);
+REDUCTION_CFUNCTYPE = ctypes.CFUNCTYPE(
+    ctypes.c_double, ctypes.c_void_p, ctypes.c_int64, ctypes.c_double
+)
+
+"""The reductions, with the value every accumulator lane starts from. min and
+max follow the builtins, a value replaces the accumulator only if it is
+strictly smaller (greater), so nans in the data are skipped."""
+REDUCTION_IDENTITIES = {
+    "+": -0.0,
+    "*": 1.0,
+    "min": float("inf"),
+    "max": float("-inf"),
+}
+
+"""Registers holding the buffer pointers, the last one overwrites the pointer
+to the buffer table once every other pointer was loaded. %rax is left to the
+kernel body which tests comparison masks in %eax, %rcx is the element index,
+%rsi the element count and %r11 the end of the unrolled loop."""
+POINTER_REGISTERS = ["%r8", "%r9", "%r10", "%rdx", "%rbx", "%r12", "%r13", "%rdi"]
+CALLEE_SAVED_REGISTERS = ["%rbx", "%r12", "%r13"]
+
+"""Copies of the kernel body per pass of the deterministic loop"""
+DETERMINISTIC_UNROLL = 4
+
+"""Scalar kernel instructions and their packed counterparts. Loads from
+memory are constant loads, packed constants are aligned."""
+PACKED_INSTRUCTIONS = {
+    "movsd": "movapd",
+    "movapd": "movapd",
+    "addsd": "addpd",
+    "subsd": "subpd",
+    "mulsd": "mulpd",
+    "divsd": "divpd",
+    "minsd": "minpd",
+    "maxsd": "maxpd",
+    "andpd": "andpd",
+    "andnpd": "andnpd",
+    "orpd": "orpd",
+    "vblendvpd": "vblendvpd",
+}
+
+
+def xmm_registers_of(instrs: list) -> set:
+    return {
+        operand
+        for instruction in instrs
+        for operand in instruction[1:]
+        if operand.startswith("%xmm")
+    }
+
+
+def kernel_body(kernel: AsmX64) -> list:
+    """The kernel instructions, without the final return"""
+    instrs = list(kernel.instrs)
+    if instrs and instrs[-1] == ("ret",):
+        instrs.pop()
+    return instrs
+
+
+def pack_body(instrs: list) -> list | None:
+    """The packed form of a kernel body or None if the body can not be packed,
+    for example because it branches"""
+    packed = []
+    for mnemonic, *operands in instrs:
+        if mnemonic.startswith("cmp") and mnemonic.endswith("sd"):
+            packed.append((mnemonic[:-2] + "pd", *operands))
+        elif mnemonic in PACKED_INSTRUCTIONS:
+            packed.append((PACKED_INSTRUCTIONS[mnemonic], *operands))
+        else:
+            return None
+    return packed
+
+
+def inline_body(asmx64: AsmX64, instrs: list, copy: str):
+    """Append a copy of a kernel body, labels are renamed to be unique per
+    copy and returns jump to the end of the copy"""
+    labels = {mnemonic[:-1] for mnemonic, *_ in instrs if mnemonic.endswith(":")}
+    end_label = f".Lpycc_reduce_{copy}_end"
+    for mnemonic, *operands in instrs:
+        if mnemonic.endswith(":"):
+            asmx64.label(f"{mnemonic[:-1]}_{copy}")
+        elif mnemonic == "ret":
+            asmx64.jmp(end_label)
+        else:
+            operands = [f"{op}_{copy}" if op in labels else op for op in operands]
+            asmx64.instrs.append((mnemonic, *operands))
+    if ("ret",) in instrs:
+        asmx64.label(end_label)
+
+
+def combine(asmx64: AsmX64, op: str, value: str, acc: str, packed: bool):
+    """acc = acc op value, may clobber value"""
+    suffix = "pd" if packed else "sd"
+    match op:
+        case "+":
+            getattr(asmx64, "add" + suffix)(value, acc)
+        case "*":
+            getattr(asmx64, "mul" + suffix)(value, acc)
+        case "min" | "max":
+            # minsd returns its source operand unless the destination is
+            # strictly smaller, that is `value if value < acc else acc`
+            getattr(asmx64, op + suffix)(acc, value)
+            if packed:
+                asmx64.movapd(value, acc)
+            else:
+                # Only the low lane, the upper lane of acc is kept
+                asmx64.movsd(value, acc)
+
+
+def generate_reduction(
+    kernel: AsmX64,
+    n_args: int,
+    op: str = "+",
+    accumulators: int = 4,
+    deterministic: bool = False,
+) -> tuple[AsmX64, dict]:
+    """Generate the reduction loop of the assembled `kernel`.
+
+    Returns the assembly and a description of the loop: whether it is packed,
+    the number of accumulator registers and the elements per pass.
+    """
+
+    if op not in REDUCTION_IDENTITIES:
+        raise ValueError(f"unsupported reduction {op!r}")
+    if accumulators < 1:
+        raise ValueError("a reduction needs at least one accumulator")
+    if n_args > len(POINTER_REGISTERS):
+        raise NotImplementedError(
+            f"reduce supports kernels with at most {len(POINTER_REGISTERS)} arguments"
+        )
+
+    if kernel.imports:
+        # The loop state lives in registers that calls do not preserve
+        raise NotImplementedError("reduce does not support kernels calling libm")
+
+    scalar = kernel_body(kernel)
+    packed = pack_body(scalar)
+    body = packed if packed is not None else scalar
+    lanes = 2 if packed is not None else 1
+
+    used = xmm_registers_of(scalar) | {f"%xmm{arg_idx}" for arg_idx in range(n_args)}
+    used.add("%xmm0")
+    free = [f"%xmm{idx}" for idx in range(16) if f"%xmm{idx}" not in used]
+    if not free:
+        raise NotImplementedError("the kernel leaves no register for an accumulator")
+
+    # The unroll is a power of two so that the end of the unrolled loop is
+    # found by clearing the low bits of the element count
+    if deterministic:
+        n_accumulators = 1
+        unroll = DETERMINISTIC_UNROLL
+    else:
+        n_accumulators = 1
+        while n_accumulators * 2 <= min(accumulators, len(free)):
+            n_accumulators *= 2
+        unroll = n_accumulators
+    step = unroll * lanes
+    acc_registers = free[:n_accumulators]
+
+    asmx64 = AsmX64()
+    asmx64.double_consts = dict(kernel.double_consts)
+    asmx64.packed_consts = packed is not None
+
+    pointers = POINTER_REGISTERS[:n_args]
+    saved = [register for register in CALLEE_SAVED_REGISTERS if register in pointers]
+    for register in saved:
+        asmx64.push(register)
+    # %rdi is loaded last, it holds the table of pointers until then
+    for arg_idx, register in enumerate(pointers):
+        asmx64.mov(f"{arg_idx * 8}(%rdi)", register)
+
+    # init arrives in %xmm0. The accumulators start from the identity of op,
+    # apart from the first lane of the first one which starts from init
+    if deterministic:
+        asmx64.movapd("%xmm0", acc_registers[0])
+    else:
+        identity = asmx64.double_const(REDUCTION_IDENTITIES[op])
+        for register in acc_registers:
+            if packed is not None:
+                asmx64.movapd(identity, register)
+            else:
+                asmx64.movsd(identity, register)
+        asmx64.movsd("%xmm0", acc_registers[0])
+
+    asmx64.xor("%rcx", "%rcx")
+    asmx64.mov("%rsi", "%r11")
+    asmx64.shr(f"${step.bit_length() - 1}", "%r11")
+    asmx64.shl(f"${step.bit_length() - 1}", "%r11")
+
+    asmx64.label(".Lpycc_reduce_loop")
+    asmx64.cmp("%r11", "%rcx")
+    asmx64.jge(".Lpycc_reduce_tail")
+    for copy in range(unroll):
+        for arg_idx, register in enumerate(pointers):
+            if packed is not None:
+                asmx64.movupd(f"{copy * 16}({register},%rcx,8)", f"%xmm{arg_idx}")
+            else:
+                asmx64.movsd(f"{copy * 8}({register},%rcx,8)", f"%xmm{arg_idx}")
+        inline_body(asmx64, body, f"c{copy}")
+
+        acc = acc_registers[copy % n_accumulators]
+        if deterministic and packed is not None:
+            # The lanes are folded in order, the upper lane is moved down
+            combine(asmx64, op, "%xmm0", acc, packed=False)
+            asmx64.unpckhpd("%xmm0", "%xmm0")
+            combine(asmx64, op, "%xmm0", acc, packed=False)
+        else:
+            combine(asmx64, op, "%xmm0", acc, packed is not None)
+    asmx64.add(f"${step}", "%rcx")
+    asmx64.jmp(".Lpycc_reduce_loop")
+
+    # The remaining elements go one by one into the first lane
+    asmx64.label(".Lpycc_reduce_tail")
+    asmx64.cmp("%rsi", "%rcx")
+    asmx64.jge(".Lpycc_reduce_done")
+    for arg_idx, register in enumerate(pointers):
+        asmx64.movsd(f"({register},%rcx,8)", f"%xmm{arg_idx}")
+    inline_body(asmx64, scalar, "tail")
+    combine(asmx64, op, "%xmm0", acc_registers[0], packed=False)
+    asmx64.inc("%rcx")
+    asmx64.jmp(".Lpycc_reduce_tail")
+
+    # Pairwise combination of the accumulators, then of the two lanes
+    asmx64.label(".Lpycc_reduce_done")
+    width = 1
+    while width < n_accumulators:
+        for idx in range(0, n_accumulators, 2 * width):
+            combine(
+                asmx64,
+                op,
+                acc_registers[idx + width],
+                acc_registers[idx],
+                packed is not None,
+            )
+        width *= 2
+    if packed is not None and not deterministic:
+        asmx64.movapd(acc_registers[0], "%xmm0")
+        asmx64.unpckhpd("%xmm0", "%xmm0")
+        combine(asmx64, op, "%xmm0", acc_registers[0], packed=False)
+    asmx64.movapd(acc_registers[0], "%xmm0")
+
+    for register in reversed(saved):
+        asmx64.pop(register)
+    asmx64.ret()
+
+    layout = {
+        "packed": packed is not None,
+        "accumulators": n_accumulators,
+        "elements_per_pass": step,
+    }
+    return asmx64, layout
+
+
+class PyObject_Reduction:
+    """Callable returned by pycc.reduce.
+
+    Calling it with one buffer of doubles per kernel argument returns the
+    reduction of the kernel values over the buffers. The buffers must have the
+    same length, `init` may be overridden per call.
+    """
+
+    def __init__(
+        self,
+        stub: execmem.PyObject_ExecMem,
+        n_args: int,
+        init: float,
+        op: str,
+        deterministic: bool,
+        layout: dict,
+    ):
+        self.stub = stub
+        self.name = stub.name
+        self.n_args = n_args
+        self.init = float(init)
+        self.op = op
+        self.deterministic = deterministic
+        self.packed = layout["packed"]
+        self.accumulators = layout["accumulators"]
+        self.elements_per_pass = layout["elements_per_pass"]
+
+    def __call__(self, *buffers, init: float = None) -> float:
+        if len(buffers) != self.n_args:
+            raise TypeError(
+                f"kernel takes {self.n_args} arguments but {len(buffers)} buffers were given"
+            )
+        arrays = [as_double_array(buffer, writable=False) for buffer in buffers]
+        lengths = {len(array) for array in arrays}
+        if len(lengths) > 1:
+            raise ValueError("reduce requires buffers of the same length")
+
+        n = lengths.pop() if lengths else 0
+        pointers = (ctypes.c_void_p * max(self.n_args, 1))(
+            *[ctypes.addressof(array) for array in arrays]
+        )
+        return self.stub(pointers, n, self.init if init is None else float(init))
+
+
+def reduce_python(func, op: str, init: float, *buffers) -> float:
+    """The reference semantics of a deterministic reduction"""
+    match op:
+        case "+":
+            step = lambda acc, value: acc + value
+        case "*":
+            step = lambda acc, value: acc * value
+        case "min":
+            step = lambda acc, value: value if value < acc else acc
+        case "max":
+            step = lambda acc, value: value if value > acc else acc
+    return functools.reduce(step, map(func, *buffers), float(init))
@@ -0,0 +1,426 @@
+"""Local compile server shared by the processes of a host.
+
+Every process that imports a module of kernels runs the front end, the
+optimizer and `as`/`ld` for each of them. With many worker processes starting
+at once the same kernels are compiled once per process. The compile server is
+a daemon listening on a unix socket that compiles for all of them:
+
+  - identical requests, in flight or already answered, are compiled once,
+  - at most `jobs` compilations run at the same time, each in a process of
+    its own since compilation holds the compiler lock of its process,
+  - the answer is the machine code, its signature and its libm imports, which
+    the client maps itself with PyObject_ExecMem.inject.
+
+A client that finds no server starts one, `python -m pycc.server`, which exits
+again once it was idle for a while. A file lock next to the socket makes sure
+that a single server listens on it. Clients that are unable to reach a server
+return None and compile in-process, so the server is only ever an
+optimization.
+
+Messages are framed by their length as an unsigned 64 bit integer. Requests
+are json, answers are pickles holding machine code the client runs, so both
+ends make sure that they talk to their own user: the socket lives in a
+directory that is refused unless it is owned by the user and private to it,
+and either end checks the credentials of its peer with SO_PEERCRED before
+reading a message.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+import argparse
+import collections
+import ctypes
+import fcntl
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+"""Length prefix of every message"""
+MESSAGE_HEADER = struct.Struct("<Q")
+
+"""Compilations the server runs at the same time unless given --jobs"""
+DEFAULT_JOBS = max(1, min(4, os.cpu_count() or 1))
+
+"""Seconds without connections after which the server exits"""
+DEFAULT_IDLE_TIMEOUT = 600.0
+
+"""Answers the server keeps for requests that are repeated later"""
+RESULT_CACHE_SIZE = 1024
+
+"""Seconds a client waits for a spawned server to listen, and for an answer"""
+SPAWN_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 300.0
+
+
+def default_socket_path() -> Path:
+    """The per user socket, in a directory private to the user. The
+    directory is checked by private_directory wherever it is used."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_dir) / f"pycc-{os.getuid()}" / "compile.sock"
+
+
+def private_directory(directory: Path) -> Path:
+    """Create `directory` with mode 0o700 unless it exists. Raises
+    PermissionError when it is a symlink, is owned by another user or is
+    accessible to other users: anyone able to place the socket there could
+    answer with code of their choosing."""
+    directory = Path(directory)
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    status = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(status.st_mode)
+        or status.st_uid != os.getuid()
+        or stat.S_IMODE(status.st_mode) != 0o700
+    ):
+        raise PermissionError(
+            f"pycc: {directory} must be a directory of mode 0o700 owned by uid {os.getuid()}"
+        )
+    return directory
+
+
+def check_peer(connection: socket.socket):
+    """Raises PermissionError unless the process at the other end of
+    `connection` runs as the same user"""
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    if uid != os.getuid():
+        raise PermissionError(f"pycc: compile server peer runs as uid {uid}")
+
+
+def send_message(connection: socket.socket, payload: bytes):
+    connection.sendall(MESSAGE_HEADER.pack(len(payload)) + payload)
+
+
+def receive_message(connection: socket.socket) -> bytes:
+    """Read one message, raises ConnectionError when the peer went away"""
+    (length,) = MESSAGE_HEADER.unpack(receive_exactly(connection, MESSAGE_HEADER.size))
+    return receive_exactly(connection, length)
+
+
+def receive_exactly(connection: socket.socket, length: int) -> bytes:
+    data = bytearray()
+    while len(data) < length:
+        chunk = connection.recv(min(length - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("pycc: the compile server connection was closed")
+        data += chunk
+    return bytes(data)
+
+
+def request_key(request: dict) -> str:
+    """Requests with the same key compile to the same code"""
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def build_request(request: dict) -> dict:
+    """Compile a request, runs in a worker process of the server"""
+    from pycc import pycc
+    from pycc.py2ir import CompilableTypes, CompilerException
+
+    signature = request["signature"]
+    if signature is not None:
+        signature = [CompilableTypes.TYPE_MAP[name] for name in signature]
+    try:
+        code, cdef, imports = pycc.build(
+            request["source"],
+            request["file_name"],
+            request["qualname"],
+            signature,
+            request["fast_math"],
+            request["bound"],
+        )
+    except (Exception, CompilerException) as error:
+        # The client compiles in-process to raise the error itself
+        return {"error": f"{type(error).__name__}: {error}"}
+    return {
+        "code": code,
+        "restype": cdef.restype,
+        "argtypes": tuple(cdef.argtypes),
+        "imports": imports,
+    }
+
+
+class CompileServer:
+    """Answers compile requests on a unix socket until it was idle for
+    `idle_timeout` seconds.
+
+    Requests are keyed by request_key. The future of a key is shared by every
+    connection asking for it while it is compiled and kept afterwards for the
+    last RESULT_CACHE_SIZE keys, failed compilations are not kept.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        jobs: int = DEFAULT_JOBS,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    ):
+        self.socket_path = Path(socket_path)
+        self.jobs = jobs
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.futures = collections.OrderedDict()
+        self.executor = None
+        self.listener = None
+        self.lock_file = None
+        self.connections = 0
+        self.last_activity = time.monotonic()
+        self.stopped = threading.Event()
+        self.requests = 0
+        self.compiled = 0
+        self.deduplicated = 0
+
+    def bind(self) -> bool:
+        """Take the server lock and listen on the socket. Returns False when
+        another server holds the lock."""
+        private_directory(self.socket_path.parent)
+        self.lock_file = open(self.socket_path.with_name(self.socket_path.name + ".lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+
+        # A socket left behind by a server that died is stale, the lock is ours
+        self.socket_path.unlink(missing_ok=True)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(str(self.socket_path))
+        self.listener.listen(64)
+        self.listener.settimeout(0.5)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.jobs, mp_context=multiprocessing.get_context("spawn")
+        )
+        return True
+
+    def serve_forever(self):
+        logger.info("pycc: compile server listening on %s", self.socket_path)
+        try:
+            while not self.stopped.is_set():
+                try:
+                    connection, _ = self.listener.accept()
+                except socket.timeout:
+                    with self.lock:
+                        idle = self.connections == 0 and (
+                            time.monotonic() - self.last_activity > self.idle_timeout
+                        )
+                    if idle:
+                        break
+                    continue
+                with self.lock:
+                    self.connections += 1
+                threading.Thread(
+                    target=self.handle, args=(connection,), daemon=True
+                ).start()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self.stopped.set()
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            self.socket_path.unlink(missing_ok=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def handle(self, connection: socket.socket):
+        try:
+            with connection:
+                check_peer(connection)
+                request = json.loads(receive_message(connection))
+                send_message(connection, pickle.dumps(self.submit(request).result()))
+        except Exception:
+            logger.warning("pycc: compile server request failed", exc_info=True)
+        finally:
+            with self.lock:
+                self.connections -= 1
+                self.last_activity = time.monotonic()
+
+    def submit(self, request: dict) -> Future:
+        """The future answer of `request`, compiled unless it already is"""
+        key = request_key(request)
+        with self.lock:
+            self.requests += 1
+            future = self.futures.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                self.futures.move_to_end(key)
+                return future
+
+            self.compiled += 1
+            future = self.executor.submit(build_request, request)
+            self.futures[key] = future
+            while len(self.futures) > RESULT_CACHE_SIZE:
+                self.futures.popitem(last=False)
+        future.add_done_callback(lambda future: self.forget_failed(key, future))
+        return future
+
+    def forget_failed(self, key: str, future: Future):
+        if future.cancelled() or future.exception() is not None or "error" in future.result():
+            with self.lock:
+                if self.futures.get(key) is future:
+                    del self.futures[key]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "compiled": self.compiled,
+                "deduplicated": self.deduplicated,
+            }
+
+
+def spawn_server(socket_path: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+    """Start a detached server on `socket_path`. The server exits by itself
+    when another one already listens."""
+    environment = dict(os.environ)
+    package_root = str(Path(__file__).parent.parent)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [package_root, environment.get("PYTHONPATH")])
+    )
+    # The server compiles for every client, not through another server
+    environment.pop("PYCC_COMPILE_SERVER", None)
+    private_directory(Path(socket_path).parent)
+    with open(str(socket_path) + ".log", "ab") as log:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "pycc.server",
+                "--socket",
+                str(socket_path),
+                "--idle-timeout",
+                str(idle_timeout),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            env=environment,
+            start_new_session=True,
+        )
+
+
+def connect(socket_path: str, spawn: bool) -> socket.socket:
+    """Connect to the server, starting it when `spawn` is set. Raises
+    PermissionError when the socket is not private to the user."""
+    private_directory(Path(socket_path).parent)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(socket_path))
+        check_peer(connection)
+        return connection
+    except PermissionError:
+        connection.close()
+        raise
+    except OSError:
+        connection.close()
+        if not spawn:
+            raise
+
+    spawn_server(socket_path)
+    deadline = time.monotonic() + SPAWN_TIMEOUT
+    while True:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(str(socket_path))
+            check_peer(connection)
+            return connection
+        except PermissionError:
+            connection.close()
+            raise
+        except OSError:
+            connection.close()
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def request_build(
+    socket_path: str,
+    source: str,
+    file_name: str,
+    qualname: str,
+    signature: List[type] | None = None,
+    fast_math: bool = False,
+    bound: dict | None = None,
+    spawn: bool = True,
+):
+    """Have the server compile a function, the client side of pycc.build.
+
+    Returns the machine code, the CFUNCTYPE and the libm imports as build
+    does, or None when the server is unavailable or failed to compile.
+    """
+
+    request = {
+        "source": source,
+        "file_name": str(file_name),
+        "qualname": qualname,
+        "signature": None
+        if signature is None
+        else [argtype.__name__ for argtype in signature],
+        "fast_math": fast_math,
+        "bound": bound,
+    }
+    try:
+        with connect(socket_path, spawn) as connection:
+            connection.settimeout(REQUEST_TIMEOUT)
+            send_message(connection, json.dumps(request).encode())
+            answer = pickle.loads(receive_message(connection))
+    except Exception:
+        logger.warning("pycc: compile server %s is unavailable", socket_path, exc_info=True)
+        return None
+
+    if "error" in answer:
+        logger.info("pycc: compile server failed on %s: %s", qualname, answer["error"])
+        return None
+
+    cdef = ctypes.CFUNCTYPE(answer["restype"], *answer["argtypes"])
+    cdef.argtypes = list(answer["argtypes"])
+    cdef.restype = answer["restype"]
+    return answer["code"], cdef, tuple(answer["imports"])
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pycc.server", description="pycc local compile server"
+    )
+    parser.add_argument("--socket", default=str(default_socket_path()))
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS)
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT)
+    arguments = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = CompileServer(arguments.socket, arguments.jobs, arguments.idle_timeout)
+    if not server.bind():
+        logger.info("pycc: a compile server already listens on %s", arguments.socket)
+        return 0
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,92 @@
 from pycc.ssair.irgrammar import IRGrammar
 from pycc.ssair.irparser import IRParser
+from pycc.ssair.irscheduler_x64 import IRSchedulerX64
+from pycc.ssair.irvectorizer_x64 import IRVectorizerX64
 from pycc.assembler.asm_x64 import AsmX64
+from pycc.libm import INLINE_FUNCTIONS
 
 
 class IRAssemblerX64:
-    """Convert the SSA IR into GNU AS assembly."""
+    """Convert the SSA IR into GNU AS assembly.
 
-    def __init__(self, ir):
+    Registers are allocated in a single pass over the IR, a register is free
+    once the variable it holds is not read by any later statement. At a
+    conditional branch the register state is recorded and restored at the
+    start of the else arm. The arms agree on the registers of the variables
+    that are live after the join, they are never moved, and the values of
+    the phis are moved to common registers at the end of each arm.
+
+    The statements of a pack of IRVectorizerX64 are computed together by a
+    packed instruction. The register of a pack holds a tuple of the variables
+    of its low and high lane, scalar instructions read the low lane variable
+    from it as from any other register.
+    """
+
+    """CPUs whose selects are compiled to the AVX vblendvpd"""
+    AVX_CPUS = ("haswell", "skylake", "zen3")
+
+    """Never allocated, used to break cycles of the moves of phi values"""
+    SCRATCH_XMM = "%xmm15"
+
+    """The cmpsd predicate of each comparison. Greater than comparisons are
+    compiled as less than comparisons with swapped operands."""
+    COMPARE_PREDICATES = {"==": "eq", "!=": "neq", "<": "lt", "<=": "le"}
+
+    def __init__(
+        self, ir, cpu: str = "generic", schedule: bool = True, vectorize: bool = True
+    ):
         self.asmx64 = AsmX64()
         self.xmm_registers = {f"%xmm{n}": None for n in range(15)}
-        self.ir = ir
+        self.cpu = cpu
+
+        # Constants are not loaded into registers, their rip relative location
+        # is used as an operand instead
+        self.memory_locations = {}
+
+        # Registers holding intermediate values while a statement is compiled
+        self.claimed = set()
+
+        # Register state at each branch target and the register of each phi
+        self.label_states = {}
+        self.phi_registers = {}
+        self.join_predecessors = {}
+
+        # Reorder each basic block for the latencies of the target cpu
+        self.scheduler = IRSchedulerX64(ir, cpu)
+        self.ir = self.scheduler.schedule() if schedule else ir
+        self.definitions = {
+            stmt.Left: stmt.Right
+            for stmt in self.ir
+            if type(stmt).__name__ == "Assignment"
+        }
+
+        # Tuples of more than two values are stored to the memory pointed to
+        # by %rdi, which calls do not preserve
+        self.returns_in_memory = any(
+            type(stmt).__name__ == "ReturnValues" and len(stmt.Values) > 2
+            for stmt in self.ir
+        )
+
+        # Variables holding single precision values, see visit_Convert
+        self.singles = self.single_precision_variables()
+
+        # Pack independent operations into the two lanes of the registers
+        self.vectorizer = IRVectorizerX64(self.ir, cpu, self.singles)
+        if vectorize:
+            self.ir = self.vectorizer.vectorize()
+
+        # Functions with stack arguments address them from a frame pointer,
+        # %rsp moves around calls. Single precision arguments are read by a
+        # conversion.
+        self.uses_frame_pointer = any(
+            type(stmt).__name__ == "Assignment"
+            and (
+                type(stmt.Right).__name__ == "StackArgument"
+                or type(stmt.Right).__name__ == "Convert"
+                and type(stmt.Right.Value).__name__ == "StackArgument"
+            )
+            for stmt in self.ir
+        )
 
     def find_versioned_var(self, var: str):
         """Search through all register dicts to find the dict and the key
@@ -17,12 +94,17 @@ class IRAssemblerX64:
         for key, value in self.xmm_registers.items():
             if value == var:
                 return (self.xmm_registers, key)
+        if var in self.memory_locations:
+            return (self.xmm_registers, self.memory_locations[var])
+        for key, value in self.xmm_registers.items():
+            if isinstance(value, tuple) and value[0] == var:
+                return (self.xmm_registers, key)
 
         raise NotImplementedError("Error")
 
     def find_free_xmm_register(self, idx: int):
         for key, value in self.xmm_registers.items():
-            if not key.startswith("%xmm"):
+            if not key.startswith("%xmm") or key in self.claimed:
                 continue
             if value is None:
                 return key
@@ -34,6 +116,28 @@ class IRAssemblerX64:
 
         raise Exception("No more free registers, must push to stack")
 
+    def single_precision_variables(self) -> set:
+        """The variables holding single precision values: the results of
+        conversions to single precision and of the operations on them"""
+        singles = set()
+        for stmt in self.ir:
+            if type(stmt).__name__ != "Assignment":
+                continue
+            match type(stmt.Right).__name__:
+                case "Convert":
+                    is_single = stmt.Right.Type == "single"
+                case "BinOp":
+                    is_single = IRGrammar.versioned_variable_as_str(stmt.Right.Left) in singles
+                case "Call":
+                    is_single = IRGrammar.versioned_variable_as_str(stmt.Right.Arguments[0]) in singles
+                case "VersionedVariable":
+                    is_single = IRGrammar.versioned_variable_as_str(stmt.Right) in singles
+                case _:
+                    is_single = False
+            if is_single:
+                singles.add(IRGrammar.versioned_variable_as_str(stmt.Left))
+        return singles
+
     def assignment_has_dependent(
         self, name: str, assignment: IRGrammar.assignment_tuple
     ):
@@ -50,113 +154,177 @@ class IRAssemblerX64:
                 return left_str == name or right_str == name
             case "VersionedVariable":
                 return IRGrammar.versioned_variable_as_str(assignment.Right) == name
-            case "Constant":
+            case "Compare" | "Phi":
+                return name in (
+                    IRGrammar.versioned_variable_as_str(assignment.Right.Left),
+                    IRGrammar.versioned_variable_as_str(assignment.Right.Right),
+                )
+            case "Select":
+                return name in (
+                    IRGrammar.versioned_variable_as_str(operand)
+                    for operand in assignment.Right
+                )
+            case "Call":
+                return name in (
+                    IRGrammar.versioned_variable_as_str(argument)
+                    for argument in assignment.Right.Arguments
+                )
+            case "Convert":
+                return (
+                    type(assignment.Right.Value).__name__ == "VersionedVariable"
+                    and IRGrammar.versioned_variable_as_str(assignment.Right.Value) == name
+                )
+            case "Constant" | "XmmRegister" | "StackArgument":
                 # We can't be dependent on a constant that we have not set
                 return False
             case _:
                 raise NotImplementedError(type(assignment.Right).__name__)
 
-    def variable_has_dependent(self, name: str, line_idx: int):
+    def statement_has_dependent(self, name: str, stmt):
+        match type(stmt).__name__:
+            case "Assignment":
+                return self.assignment_has_dependent(name, stmt)
+            case "Return":
+                return IRGrammar.versioned_variable_as_str(stmt.VersionedVariable) == name
+            case "ReturnValues":
+                return name in (
+                    IRGrammar.versioned_variable_as_str(value) for value in stmt.Values
+                )
+            case "Branch":
+                return IRGrammar.versioned_variable_as_str(stmt.Condition) == name
+        return False
+
+    def variable_has_dependent(self, name: str, line_idx: int, ignore: list = ()):
+        """Whether any statement after `line_idx`, other than those in
+        `ignore`, reads the variable `name`, or either variable of a pack"""
+        if isinstance(name, tuple):
+            return any(self.variable_has_dependent(var, line_idx, ignore) for var in name)
         for stmt in self.ir[line_idx + 1 :]:
-            match type(stmt).__name__:
-                case "Assignment":
-                    if self.assignment_has_dependent(name, stmt):
-                        return True
+            if stmt in ignore:
+                continue
+            if self.statement_has_dependent(name, stmt):
+                return True
         return False
 
-    def binop_xmm_reg_reg(self, left: str, right: str, op: str, idx: int):
+    def binop_instruction(self, op: str, single: bool = False):
+        """The scalar instruction that computes `dst = dst op src`, on single
+        precision operands when `single`"""
+        if single:
+            match op:
+                case "*":
+                    return self.asmx64.mulss
+                case "+":
+                    return self.asmx64.addss
+                case "-":
+                    return self.asmx64.subss
+                case "/":
+                    return self.asmx64.divss
+                case _:
+                    raise NotImplementedError(f"single precision {op}")
+        match op:
+            case "*":
+                return self.asmx64.mulsd
+            case "+":
+                return self.asmx64.addsd
+            case "-":
+                return self.asmx64.subsd
+            case "/":
+                return self.asmx64.divsd
+            case "&":
+                return self.asmx64.andpd
+            case "|":
+                return self.asmx64.orpd
+            case "min":
+                return self.asmx64.minsd
+            case "max":
+                return self.asmx64.maxsd
+            case "==" | "!=" | "<" | "<=":
+                predicate = self.COMPARE_PREDICATES[op]
+                return lambda src, dst: self.asmx64.cmpsd(predicate, src, dst)
+            case _:
+                raise NotImplementedError(op)
+
+    @staticmethod
+    def is_memory(location: str) -> bool:
+        """Whether `location` is a memory operand, a constant or a stack
+        argument, rather than a register"""
+        return not location.startswith("%")
+
+    def prologue(self):
+        """Set up the frame pointer, the return address and the saved %rbp
+        leave %rsp 16 byte aligned"""
+        if self.uses_frame_pointer:
+            self.asmx64.push("%rbp")
+            self.asmx64.mov("%rsp", "%rbp")
+
+    def epilogue(self):
+        """Restore the callee saved %rbp and return"""
+        if self.uses_frame_pointer:
+            self.asmx64.pop("%rbp")
+        self.asmx64.ret()
+
+    def stack_argument(self, index: int) -> str:
+        """The location of the stack argument `index`, above the saved %rbp
+        and the return address"""
+        return f"{16 + 8 * index}(%rbp)"
+
+    def move_xmm(self, src: str, dst: str, single: bool = False):
+        """Copy a register or memory operand into the `dst` register.
+
+        Register to register copies use movapd. movsd between registers only
+        writes the low lane and so depends on the previous value of `dst`, a
+        false dependency that chains otherwise independent calls of a kernel.
+        Single precision values are loaded from memory with movss.
+        """
+        if src.startswith("%xmm"):
+            self.asmx64.movapd(src, dst)
+        elif single:
+            self.asmx64.movss(src, dst)
+        else:
+            self.asmx64.movsd(src, dst)
+
+    def binop_xmm_tmp(self, left: str, right: str, op: str, idx: int, single: bool = False):
+        """Compute the binop into a free register when neither operand may be
+        overwritten because both are used by later statements"""
+        tmp_reg = self.find_free_xmm_register(idx)
+        self.move_xmm(left, tmp_reg, single)
+        self.binop_instruction(op, single)(right, tmp_reg)
+        return tmp_reg
+
+    def binop_xmm_reg_reg(self, left: str, right: str, op: str, idx: int, single: bool = False):
         # mulsd reg1, reg2
-        if op == "*":
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.mulsd(right, left)
-                return left
-            elif not self.variable_has_dependent(self.xmm_registers[right], idx):
-                self.asmx64.mulsd(left, right)
-                return right
-            raise NotImplementedError("Requires stack storage of a register")
-        elif op == "+":
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.addsd(right, left)
-                return left
-            elif not self.variable_has_dependent(self.xmm_registers[right], idx):
-                self.asmx64.addsd(left, right)
-                return right
-            raise NotImplementedError("Requires stack storage of a register")
-        elif op == "-":
-            # left - right
-            # dst  - src
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.subsd(right, left)
-                return left
-            raise NotImplementedError("Requires stack storage of a register")
-        elif op == "/":
-            # left / right
-            # dst / src
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.divsd(right, left)
-                return left
-            raise NotImplementedError("Requires stack storage of a register")
-
-    def binop_xmm_mem_reg(self, left: str, right: str, op: str, idx: int):
+        instruction = self.binop_instruction(op, single)
+        if not self.variable_has_dependent(self.xmm_registers[left], idx):
+            # left op right
+            # dst  op src
+            instruction(right, left)
+            return left
+        elif op in ("*", "+") and not self.variable_has_dependent(
+            self.xmm_registers[right], idx
+        ):
+            instruction(left, right)
+            return right
+        return self.binop_xmm_tmp(left, right, op, idx, single)
+
+    def binop_xmm_mem_reg(self, left: str, right: str, op: str, idx: int, single: bool = False):
         # mulsd mem, reg2
-        if op == "*":
-            # left * right
-            if not self.variable_has_dependent(self.xmm_registers[right], idx):
-                self.asmx64.mulsd(left, right)
-                return right
-
-            # Get temporary register to move the memory location into
-            tmp_reg = self.find_free_xmm_register(idx)
-            self.asmx64.movsd(left, tmp_reg)
-            self.asmx64.mulsd(right, tmp_reg)
-            return tmp_reg
-        elif op == "+":
-            if not self.variable_has_dependent(self.xmm_registers[right], idx):
-                self.asmx64.addsd(left, right)
-                return right
-
-            # Get temporary register to move the memory location into
-            tmp_reg = self.find_free_xmm_register(idx)
-            self.asmx64.movsd(left, tmp_reg)
-            self.asmx64.addsd(right, tmp_reg)
-            return tmp_reg
-        elif op == "-":
-            # left - right
-            # dst - src
-            tmp_reg = self.find_free_xmm_register(idx)
-            self.asmx64.movsd(left, tmp_reg)
-            self.asmx64.subsd(right, tmp_reg)
-            return tmp_reg
-        elif op == "/":
-            tmp_reg = self.find_free_xmm_register(idx)
-            self.asmx64.movsd(left, tmp_reg)
-            self.asmx64.divsd(right, tmp_reg)
-            return tmp_reg
-
-    def binop_xmm_reg_mem(self, left: str, right: str, op: str, idx: int):
+        if op in ("*", "+") and not self.variable_has_dependent(
+            self.xmm_registers[right], idx
+        ):
+            self.binop_instruction(op, single)(left, right)
+            return right
+
+        # Get temporary register to move the memory location into
+        return self.binop_xmm_tmp(left, right, op, idx, single)
+
+    def binop_xmm_reg_mem(self, left: str, right: str, op: str, idx: int, single: bool = False):
         # mulsd reg, mem
-        if op == "*":
-            # left * right
-            # dst * src
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.mulsd(right, left)
-                return left
-            raise NotImplementedError("Requires stack storage of a register")
-        elif op == "+":
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.addsd(right, left)
-                return left
-            raise NotImplementedError("Requires stack storage of a register")
-        elif op == "-":
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.subsd(right, left)
-                return left
-            raise NotImplementedError("Requires stack storage of a register")
-        elif op == "/":
-            if not self.variable_has_dependent(self.xmm_registers[left], idx):
-                self.asmx64.divsd(right, left)
-                return left
-            raise NotImplementedError("Requires stack storage of a register")
+        if not self.variable_has_dependent(self.xmm_registers[left], idx):
+            # left op right
+            # dst  op src
+            self.binop_instruction(op, single)(right, left)
+            return left
+        return self.binop_xmm_tmp(left, right, op, idx, single)
 
     def visit_BinOp(self, node: IRGrammar.binop_tuple, idx: int):
 
@@ -171,26 +339,272 @@ class IRAssemblerX64:
         if lrd != rrd:
             raise Exception(f"Must change variable type here")
 
+        # Operands of different precisions are converted by the IR
+        single = binop_left_vv in self.singles
+        if single != (binop_right_vv in self.singles):
+            raise Exception(f"Operands of {node.Op} differ in precision")
+
         if lrd_key[0] == "%" and rrd_key[0] == "%":
             if lrd_key.startswith("%xmm"):
-                result_reg = self.binop_xmm_reg_reg(lrd_key, rrd_key, node.Op, idx)
+                result_reg = self.binop_xmm_reg_reg(lrd_key, rrd_key, node.Op, idx, single)
             else:
                 raise NotImplementedError("")
-        elif lrd_key[0] == "_" and rrd_key[0] == "%":
+        elif self.is_memory(lrd_key) and rrd_key[0] == "%":
             if rrd_key.startswith("%xmm"):
-                result_reg = self.binop_xmm_mem_reg(lrd_key, rrd_key, node.Op, idx)
+                result_reg = self.binop_xmm_mem_reg(lrd_key, rrd_key, node.Op, idx, single)
             else:
                 raise NotImplementedError("")
-        elif lrd_key[0] == "%" and rrd_key[0] == "_":
+        elif lrd_key[0] == "%" and self.is_memory(rrd_key):
             if lrd_key.startswith("%xmm"):
-                result_reg = self.binop_xmm_reg_mem(lrd_key, rrd_key, node.Op, idx)
+                result_reg = self.binop_xmm_reg_mem(lrd_key, rrd_key, node.Op, idx, single)
             else:
                 raise NotImplementedError("")
-        elif lrd_key[0] == "_" and rrd_key[0] == "_":
-            raise NotImplementedError("")
+        elif self.is_memory(lrd_key) and self.is_memory(rrd_key):
+            result_reg = self.binop_xmm_tmp(lrd_key, rrd_key, node.Op, idx, single)
 
         return result_reg
 
+    def visit_Compare(self, node: IRGrammar.compare_tuple, idx: int):
+        """Compute the all ones or all zeros mask of a comparison with cmpsd.
+        The predicates are false for unordered operands except for !=, as are
+        python comparisons of nans."""
+
+        match node.Op:
+            case ">":
+                node = IRGrammar.compare_tuple(node.Right, "<", node.Left)
+            case ">=":
+                node = IRGrammar.compare_tuple(node.Right, "<=", node.Left)
+        return self.visit_BinOp(
+            IRGrammar.binop_tuple(node.Left, node.Op, node.Right), idx
+        )
+
+    def min_max_select(self, node: IRGrammar.select_tuple):
+        """The minsd or maxsd binop computing a select, None if the select is
+        not a clamp. minsd computes `dst < src ? dst : src` and maxsd
+        `dst > src ? dst : src`, nans and signed zeros included, so only
+        strict comparisons are replaced."""
+
+        compare = self.definitions.get(node.Condition)
+        if type(compare).__name__ != "Compare":
+            return None
+        match compare.Op:
+            case "<":
+                left, right = compare.Left, compare.Right
+            case ">":
+                left, right = compare.Right, compare.Left
+            case _:
+                return None
+
+        if (node.Left, node.Right) == (left, right):
+            return IRGrammar.binop_tuple(left, "min", right)
+        if (node.Left, node.Right) == (right, left):
+            return IRGrammar.binop_tuple(right, "max", left)
+        return None
+
+    def compare_is_folded(self, mask: IRGrammar.versioned_variable_tuple):
+        """Whether every use of a mask is a select compiled to minsd or maxsd,
+        the comparison then emits no code"""
+
+        uses = [
+            stmt
+            for stmt in self.ir
+            if self.statement_has_dependent(
+                IRGrammar.versioned_variable_as_str(mask), stmt
+            )
+        ]
+        return all(
+            type(stmt).__name__ == "Assignment"
+            and type(stmt.Right).__name__ == "Select"
+            and self.min_max_select(stmt.Right) is not None
+            for stmt in uses
+        )
+
+    def claim_xmm_register(self, idx: int):
+        """A free register that stays reserved until the current statement is
+        compiled"""
+        register = self.find_free_xmm_register(idx)
+        self.claimed.add(register)
+        return register
+
+    def writable_xmm(self, location: str, var: str, idx: int):
+        """A register holding the value at `location` that may be overwritten,
+        the register of `var` itself when it is not read later"""
+        if location in self.claimed or (
+            location.startswith("%xmm")
+            and not self.variable_has_dependent(self.xmm_registers[location], idx)
+        ):
+            return location
+        register = self.claim_xmm_register(idx)
+        self.move_xmm(location, register)
+        return register
+
+    def visit_Select(self, node: IRGrammar.select_tuple, idx: int):
+        """Compile a select without branches. Clamps become minsd or maxsd,
+        otherwise the mask picks the operands with vblendvpd on AVX cpus and
+        with (mask & true) | (~mask & false) on the others."""
+
+        min_max = self.min_max_select(node)
+        if min_max is not None:
+            return self.visit_BinOp(min_max, idx)
+
+        mask_var, true_var, false_var = (
+            IRGrammar.versioned_variable_as_str(operand) for operand in node
+        )
+        _, mask = self.find_versioned_var(mask_var)
+        _, true_loc = self.find_versioned_var(true_var)
+        _, false_loc = self.find_versioned_var(false_var)
+
+        # The packed instructions read 16 bytes, constants are loaded first
+        operands = []
+        for location in (true_loc, false_loc):
+            if not location.startswith("%xmm"):
+                register = self.claim_xmm_register(idx)
+                self.asmx64.movsd(location, register)
+                location = register
+            operands.append(location)
+        true_reg, false_reg = operands
+
+        if self.cpu in self.AVX_CPUS:
+            result = next(
+                (
+                    location
+                    for location, var in (
+                        (mask, mask_var),
+                        (true_reg, true_var),
+                        (false_reg, false_var),
+                    )
+                    if location in self.claimed
+                    or not self.variable_has_dependent(
+                        self.xmm_registers.get(location, var), idx
+                    )
+                ),
+                None,
+            )
+            if result is None:
+                result = self.claim_xmm_register(idx)
+            self.asmx64.vblendvpd(mask, true_reg, false_reg, result)
+        else:
+            true_reg = self.writable_xmm(true_reg, true_var, idx)
+            self.asmx64.andpd(mask, true_reg)
+            result = self.writable_xmm(mask, mask_var, idx)
+            self.asmx64.andnpd(false_reg, result)
+            self.asmx64.orpd(true_reg, result)
+
+        self.claimed.clear()
+        return result
+
+    @staticmethod
+    def asm_label(name: str):
+        return ".L" + name
+
+    def falls_through_to(self, idx: int, label: str) -> bool:
+        """Whether the statement after `idx` is the label `label`"""
+        return (
+            idx + 1 < len(self.ir)
+            and type(self.ir[idx + 1]).__name__ == "Label"
+            and self.ir[idx + 1].Name == label
+        )
+
+    def visit_Branch(self, node: IRGrammar.branch_statement_tuple, idx: int):
+        """Jump to the false label when the sign bit of the mask is clear"""
+
+        _, mask = self.find_versioned_var(
+            IRGrammar.versioned_variable_as_str(node.Condition)
+        )
+        self.asmx64.movmskpd(mask, "%eax")
+        self.asmx64.test("$1", "%eax")
+        self.asmx64.jz(self.asm_label(node.FalseLabel))
+        self.label_states[node.TrueLabel] = dict(self.xmm_registers)
+        self.label_states[node.FalseLabel] = dict(self.xmm_registers)
+        if not self.falls_through_to(idx, node.TrueLabel):
+            self.asmx64.jmp(self.asm_label(node.TrueLabel))
+
+    def visit_Label(self, node: IRGrammar.label_statement_tuple, idx: int):
+        if node.Name in self.label_states:
+            self.xmm_registers = dict(self.label_states[node.Name])
+        self.asmx64.label(self.asm_label(node.Name))
+
+    def phis_at(self, label: str):
+        """The phi assignments at the start of the block of `label`"""
+        label_idx = next(
+            stmt_idx
+            for stmt_idx, stmt in enumerate(self.ir)
+            if type(stmt).__name__ == "Label" and stmt.Name == label
+        )
+        phis = []
+        for stmt in self.ir[label_idx + 1 :]:
+            if type(stmt).__name__ != "Assignment" or type(stmt.Right).__name__ != "Phi":
+                break
+            phis.append(stmt)
+        return phis
+
+    def parallel_move(self, moves: list):
+        """Emit the register moves `moves` as if they happened at once"""
+        moves = [(src, dst) for src, dst in moves if src != dst]
+        while moves:
+            for move_idx, (src, dst) in enumerate(moves):
+                if not any(other_src == dst for other_src, _ in moves):
+                    self.move_xmm(src, dst)
+                    moves.pop(move_idx)
+                    break
+            else:
+                # Only cycles remain, save one destination to break its cycle
+                _, dst = moves[0]
+                self.move_xmm(dst, self.SCRATCH_XMM)
+                moves = [
+                    (self.SCRATCH_XMM if src == dst else src, move_dst)
+                    for src, move_dst in moves
+                ]
+
+    def visit_Goto(self, node: IRGrammar.goto_statement_tuple, idx: int):
+        """Move the values of the phis of the target into their registers.
+        The registers are chosen by the first goto to the target, the
+        registers holding the value of this arm are kept when possible."""
+
+        phis = self.phis_at(node.Name)
+        predecessor = self.join_predecessors.get(node.Name, 0)
+        self.join_predecessors[node.Name] = predecessor + 1
+        if phis and predecessor > 1:
+            raise NotImplementedError("phi nodes with more than two predecessors")
+
+        sources = []
+        for phi in phis:
+            source = phi.Right.Left if predecessor == 0 else phi.Right.Right
+            source = IRGrammar.versioned_variable_as_str(source)
+            sources.append((source, self.find_versioned_var(source)[1]))
+
+        if predecessor == 0:
+            for phi, (source, location) in zip(phis, sources):
+                if (
+                    location.startswith("%xmm")
+                    and not location in self.claimed
+                    and not self.variable_has_dependent(
+                        self.xmm_registers[location], idx, phis
+                    )
+                ):
+                    register = location
+                else:
+                    register = self.find_free_xmm_register(idx)
+                self.claimed.add(register)
+                self.phi_registers[IRGrammar.versioned_variable_as_str(phi.Left)] = register
+            self.claimed.clear()
+
+        self.parallel_move(
+            [
+                (location, self.phi_registers[IRGrammar.versioned_variable_as_str(phi.Left)])
+                for phi, (_, location) in zip(phis, sources)
+            ]
+        )
+
+        if predecessor == 0:
+            for phi in phis:
+                phi_var = IRGrammar.versioned_variable_as_str(phi.Left)
+                self.xmm_registers[self.phi_registers[phi_var]] = phi_var
+            self.label_states[node.Name] = dict(self.xmm_registers)
+
+        if not self.falls_through_to(idx, node.Name):
+            self.asmx64.jmp(self.asm_label(node.Name))
+
     def visit_Constant(self, node: IRGrammar.const_statement_tuple, idx: int):
         """Obtain the constant RIP assembly code.
 
@@ -208,6 +622,211 @@ class IRAssemblerX64:
                 rip_ptr = self.asmx64.double_const(node.Value)
                 return rip_ptr
 
+    def inline_call(self, node: IRGrammar.call_tuple, idx: int):
+        """Compute a function of INLINE_FUNCTIONS with its instruction,
+        in place when the argument is not read later"""
+
+        mnemonic = INLINE_FUNCTIONS[node.Function]
+        (argument,) = node.Arguments
+        if IRGrammar.versioned_variable_as_str(argument) in self.singles:
+            # sqrtsd -> sqrtss
+            mnemonic = mnemonic[:-1] + "s"
+        return self.unary_instruction(getattr(self.asmx64, mnemonic), argument, idx)
+
+    def unary_instruction(self, instruction, argument, idx: int):
+        """Compute `instruction` of `argument` in place when the argument is
+        not read later, into a free register otherwise. Returns the register
+        of the result."""
+
+        _, location = self.find_versioned_var(IRGrammar.versioned_variable_as_str(argument))
+        if location.startswith("%xmm") and not self.variable_has_dependent(
+            self.xmm_registers[location], idx
+        ):
+            instruction(location, location)
+            return location
+
+        register = self.find_free_xmm_register(idx)
+        instruction(location, register)
+        return register
+
+    def visit_Convert(self, node: IRGrammar.convert_tuple, idx: int):
+        """Convert between single and double precision with cvtss2sd and
+        cvtsd2ss. Single precision arguments are bound to their register or
+        stack slot as they are, constants are rounded into a .float constant
+        instead of being converted. Returns the location of the result."""
+
+        match type(node.Value).__name__:
+            case "XmmRegister":
+                return node.Value.Name
+            case "StackArgument":
+                return self.stack_argument(node.Value.Index)
+
+        constant = self.definitions.get(node.Value)
+        if node.Type == "single" and type(constant).__name__ == "Constant":
+            return self.asmx64.float_const(constant.Value)
+
+        instruction = self.asmx64.cvtss2sd if node.Type == "double" else self.asmx64.cvtsd2ss
+        return self.unary_instruction(instruction, node.Value, idx)
+
+    def visit_Call(self, node: IRGrammar.call_tuple, idx: int):
+        """Call a libm function through the import table, see pycc.libm.
+
+        Every xmm register is caller saved in the SysV ABI. The registers
+        holding values that are read after the call are stored to a stack
+        frame and loaded again after it. The size of the frame keeps %rsp 16
+        byte aligned at the call. Returns the register of the result."""
+
+        if node.Function in INLINE_FUNCTIONS:
+            return self.inline_call(node, idx)
+
+        live = [
+            register
+            for register, var in self.xmm_registers.items()
+            if var is not None and self.variable_has_dependent(var, idx)
+        ]
+        saved = live + (["%rdi"] if self.returns_in_memory else [])
+        # Registers of packs are saved with both lanes
+        slots = []
+        frame = 0
+        for register in saved:
+            slots.append(frame)
+            frame += 16 if isinstance(self.xmm_registers.get(register), tuple) else 8
+        # The return address and the saved %rbp are on the stack as well
+        pushed = 16 if self.uses_frame_pointer else 8
+        if (pushed + frame) % 16:
+            frame += 8
+
+        self.asmx64.sub(f"${frame}", "%rsp")
+        for slot, register in zip(slots, saved):
+            if isinstance(self.xmm_registers.get(register), tuple):
+                self.asmx64.movupd(register, f"{slot}(%rsp)")
+            elif register.startswith("%xmm"):
+                self.asmx64.movsd(register, f"{slot}(%rsp)")
+            else:
+                self.asmx64.mov(register, f"{slot}(%rsp)")
+
+        locations = [
+            self.find_versioned_var(IRGrammar.versioned_variable_as_str(argument))[1]
+            for argument in node.Arguments
+        ]
+        self.parallel_move(
+            [
+                (location, f"%xmm{arg_idx}")
+                for arg_idx, location in enumerate(locations)
+                if location.startswith("%xmm")
+            ]
+        )
+        for arg_idx, location in enumerate(locations):
+            if not location.startswith("%xmm"):
+                self.asmx64.movsd(location, f"%xmm{arg_idx}")
+
+        self.asmx64.call("*" + self.asmx64.got_entry(node.Function))
+
+        register = next((key for key in self.xmm_registers if not key in live), None)
+        if register is None:
+            raise Exception("No more free registers, must push to stack")
+        if register != "%xmm0":
+            self.move_xmm("%xmm0", register)
+
+        for slot, saved_register in zip(slots, saved):
+            if isinstance(self.xmm_registers.get(saved_register), tuple):
+                self.asmx64.movupd(f"{slot}(%rsp)", saved_register)
+            elif saved_register.startswith("%xmm"):
+                self.asmx64.movsd(f"{slot}(%rsp)", saved_register)
+            else:
+                self.asmx64.mov(f"{slot}(%rsp)", saved_register)
+        self.asmx64.add(f"${frame}", "%rsp")
+
+        # The values of every other register were clobbered
+        for key in self.xmm_registers:
+            if not key in live:
+                self.xmm_registers[key] = None
+        return register
+
+    def packed_instruction(self, op: str):
+        """The packed instruction that computes `dst = dst op src` in both
+        lanes"""
+        match op:
+            case "*":
+                return self.asmx64.mulpd
+            case "+":
+                return self.asmx64.addpd
+            case "-":
+                return self.asmx64.subpd
+            case "/":
+                return self.asmx64.divpd
+            case _:
+                raise NotImplementedError(f"packed {op}")
+
+    def packed_operand(self, low, high, idx: int, writable: bool):
+        """The location of the pair of values `low` and `high` in the lanes
+        of a register, or of a constant pair in memory unless `writable`.
+        `idx` is the high lane statement, values read by later statements
+        are copied before the register is written."""
+
+        pair = (
+            IRGrammar.versioned_variable_as_str(low),
+            IRGrammar.versioned_variable_as_str(high),
+        )
+        register = next((key for key, value in self.xmm_registers.items() if value == pair), None)
+        if register is not None:
+            if not writable or not self.variable_has_dependent(pair, idx):
+                return register
+            copy = self.claim_xmm_register(idx - 1)
+            self.asmx64.movapd(register, copy)
+            return copy
+
+        constants = (self.definitions.get(low), self.definitions.get(high))
+        if all(type(constant).__name__ == "Constant" for constant in constants):
+            location = self.asmx64.double_pair_const(*(constant.Value for constant in constants))
+            if not writable:
+                return location
+            register = self.claim_xmm_register(idx - 1)
+            self.asmx64.movapd(location, register)
+            return register
+
+        # Shuffle the scalar values into the lanes of the register of the low
+        # value when it is not read later, of a new register otherwise
+        _, low_location = self.find_versioned_var(pair[0])
+        _, high_location = self.find_versioned_var(pair[1])
+        if (
+            low_location.startswith("%xmm")
+            and not low_location in self.claimed
+            and not self.variable_has_dependent(self.xmm_registers[low_location], idx)
+        ):
+            register = low_location
+            self.claimed.add(register)
+        else:
+            register = self.claim_xmm_register(idx - 1)
+            self.move_xmm(low_location, register)
+        if high_location.startswith("%xmm"):
+            self.asmx64.unpcklpd(high_location, register)
+        else:
+            self.asmx64.movhpd(high_location, register)
+        return register
+
+    def visit_Pack(self, low: IRGrammar.assignment_tuple, high: IRGrammar.assignment_tuple, idx: int):
+        """Compute the binops of a pack with a packed instruction. The result
+        is bound to a register as the pair of both variables, the high lane
+        is moved to a register of its own when it is read outside of packs."""
+
+        high_idx = idx + 1
+        left = self.packed_operand(low.Right.Left, high.Right.Left, high_idx, writable=True)
+        right = self.packed_operand(low.Right.Right, high.Right.Right, high_idx, writable=False)
+        self.packed_instruction(low.Right.Op)(right, left)
+        self.claimed.clear()
+
+        pair = (
+            IRGrammar.versioned_variable_as_str(low.Left),
+            IRGrammar.versioned_variable_as_str(high.Left),
+        )
+        self.xmm_registers[left] = pair
+        if high.Left in self.vectorizer.extracted:
+            register = self.find_free_xmm_register(high_idx + 1)
+            self.asmx64.movapd(left, register)
+            self.asmx64.unpckhpd(register, register)
+            self.xmm_registers[register] = pair[1]
+
     def visit_Return(self, node: IRGrammar.returns_tuple, idx: int):
         """Emits a return statement and ensures that the return value is in
         the correct register."""
@@ -222,17 +841,49 @@ class IRAssemblerX64:
             if retval_dict_loc.startswith("%xmm"):
                 if retval_dict_loc != "%xmm0":
                     # We must move the return variable into xmm0 if it is not already
-                    self.asmx64.movsd(retval_dict_loc, "%xmm0")
+                    self.move_xmm(retval_dict_loc, "%xmm0")
             else:
                 raise NotImplementedError("Unable to return non floating point data")
         else:
-            # The return variable lives in a constant location
-            if retval_dict_loc.startswith("__PYCC_INTERNAL_DOUBLE_C"):
-                self.asmx64.movsd(retval_dict_loc, "%xmm0")
-            else:
+            # The return variable is a constant or a stack argument
+            self.move_xmm(retval_dict_loc, "%xmm0", return_variable in self.singles)
+
+        self.epilogue()
+
+    def visit_ReturnValues(self, node: IRGrammar.returns_values_tuple, idx: int):
+        """Return a tuple of doubles, a structure in the SysV ABI. Pairs are
+        returned in %xmm0 and %xmm1, larger tuples are stored to the memory
+        the caller passed in %rdi and %rdi is returned in %rax."""
+
+        locations = [
+            self.find_versioned_var(IRGrammar.versioned_variable_as_str(value))[1]
+            for value in node.Values
+        ]
+        for location in locations:
+            if not location.startswith("%xmm") and not self.is_memory(location):
                 raise NotImplementedError("Unable to return non floating point data")
 
-        self.asmx64.ret()
+        if len(locations) <= 2:
+            # Registers first, loading a constant could overwrite a source
+            self.parallel_move(
+                [
+                    (location, f"%xmm{value_idx}")
+                    for value_idx, location in enumerate(locations)
+                    if location.startswith("%xmm")
+                ]
+            )
+            for value_idx, location in enumerate(locations):
+                if not location.startswith("%xmm"):
+                    self.asmx64.movsd(location, f"%xmm{value_idx}")
+        else:
+            for value_idx, location in enumerate(locations):
+                if not location.startswith("%xmm"):
+                    self.asmx64.movsd(location, self.SCRATCH_XMM)
+                    location = self.SCRATCH_XMM
+                self.asmx64.movsd(location, f"{value_idx * 8}(%rdi)")
+            self.asmx64.mov("%rdi", "%rax")
+
+        self.epilogue()
 
     def visit_Assignment(self, node: IRGrammar.assignment_tuple, idx: int):
 
@@ -241,9 +892,9 @@ class IRAssemblerX64:
             case "Constant":
                 # When assigning a constant we need to know the RIP pointer
                 register = self.visit_Constant(node.Right, idx)
-                if register.startswith("%xmm") or register.startswith(
-                    "__PYCC_INTERNAL_DOUBLE_C"
-                ):
+                if register.startswith("__PYCC_INTERNAL_DOUBLE_C"):
+                    self.memory_locations[vv_str] = register
+                elif register.startswith("%xmm"):
                     self.xmm_registers[register] = vv_str
                 else:
                     raise NotImplementedError("Error")
@@ -251,6 +902,9 @@ class IRAssemblerX64:
             case "XmmRegister":
                 xmm_reg: IRGrammar.xmm_registers_tuple = node.Right
                 self.xmm_registers[xmm_reg.Name] = vv_str
+            case "StackArgument":
+                # Stack arguments are read in place like constants
+                self.memory_locations[vv_str] = self.stack_argument(node.Right.Index)
             case "BinOp":
                 # Check the xmm registers to find the left variable
                 binop: IRGrammar.binop_tuple = node.Right
@@ -259,6 +913,25 @@ class IRAssemblerX64:
                 assignment_vv = IRGrammar.versioned_variable_as_str(node.Left)
                 if register.startswith("%xmm"):
                     self.xmm_registers[register] = assignment_vv
+            case "Compare":
+                if not self.compare_is_folded(node.Left):
+                    register = self.visit_Compare(node.Right, idx)
+                    self.xmm_registers[register] = vv_str
+            case "Select":
+                register = self.visit_Select(node.Right, idx)
+                self.xmm_registers[register] = vv_str
+            case "Call":
+                register = self.visit_Call(node.Right, idx)
+                self.xmm_registers[register] = vv_str
+            case "Convert":
+                location = self.visit_Convert(node.Right, idx)
+                if self.is_memory(location):
+                    self.memory_locations[vv_str] = location
+                else:
+                    self.xmm_registers[location] = vv_str
+            case "Phi":
+                # The value was moved to its register by the gotos
+                self.xmm_registers[self.phi_registers[vv_str]] = vv_str
             case "VersionedVariable":
                 # Find a free register
                 vv_str = IRGrammar.versioned_variable_as_str(node.Right)
@@ -281,9 +954,23 @@ class IRAssemblerX64:
                 raise NotImplementedError(type(node.Right).__name__)
 
     def assemble(self):
+        self.prologue()
         for stmt_idx, stmt in enumerate(self.ir):
             match type(stmt).__name__:
+                case "Assignment" if stmt.Left in self.vectorizer.packs:
+                    low, high = self.vectorizer.packs[stmt.Left]
+                    # The high lane was computed with the low lane
+                    if stmt is low:
+                        self.visit_Pack(low, high, stmt_idx)
                 case "Assignment":
                     self.visit_Assignment(stmt, stmt_idx)
                 case "Return":
                     self.visit_Return(stmt, stmt_idx)
+                case "ReturnValues":
+                    self.visit_ReturnValues(stmt, stmt_idx)
+                case "Branch":
+                    self.visit_Branch(stmt, stmt_idx)
+                case "Goto":
+                    self.visit_Goto(stmt, stmt_idx)
+                case "Label":
+                    self.visit_Label(stmt, stmt_idx)
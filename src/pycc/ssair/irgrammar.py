@@ -11,12 +11,53 @@ class IRGrammar:
     ```
         x#0 := %xmm0
         y#0 := %xmm1
+        z#0 := stack 0
         label name
         x#1 := x#0 * y#0
         goto name
         ret x#1
     ```
 
+    Functions returning several values return them at once, in order.
+
+    ```
+        ret (x#1, y#0)
+    ```
+
+    Functions of the C math library are called with their arguments in
+    parentheses.
+
+    ```
+        y#0 := call pow(x#0, e#0)
+    ```
+
+    Values are doubles unless converted to single precision. Single precision
+    arguments are converted where they are bound to their register, single
+    values are widened before they are mixed with doubles.
+
+    ```
+        s#0 := convert single %xmm0
+        x#0 := convert double s#0
+    ```
+
+    Conditionals are expressed with comparisons, which produce an all ones
+    or all zeros mask, a conditional branch to one of two labels and phi
+    nodes at the join of the branches. The operands of a phi are given in the
+    order of the gotos to its label. Small conditionals are turned into
+    selects by the optimizer.
+
+    ```
+        c#0 := x#0 < y#0
+        br c#0 then lse
+        label then
+        goto join
+        label lse
+        goto join
+        label join
+        z#0 := phi x#0 y#0
+        m#0 := select c#0 x#0 y#0
+    ```
+
     The IR representation is then consumed by the IR compiler to produce
     assembly code. The IR is a good place to perform optimizations such as
     finding the minimal number of phi functions, removing unused code,
@@ -27,40 +68,95 @@ class IRGrammar:
     # __init__common
     integer = pp.common().integer
     double = pp.common().fnumber
+    # Infinities and nans, as str() writes them
+    special_double = pp.Regex(r"[+-]?(inf|nan)\b").set_parse_action(
+        lambda tokens: float(tokens[0])
+    )
 
     # __init__literals
     binop_mult = pp.Literal("*")
     binop_div = pp.Literal("/")
     binop_sub = pp.Literal("-")
+    binop_add = pp.Literal("+")
+    binop_and = pp.Literal("&")
+    binop_or = pp.Literal("|")
+    compare_op = pp.one_of("<= >= == != < >")
     cequals = pp.Literal(":=")
     pound = pp.Literal("#")
     returns = pp.Literal("ret")
     label = pp.Literal("label")
     goto = pp.Literal("goto")
+    branch = pp.Literal("br")
+    select = pp.Literal("select")
+    phi = pp.Literal("phi")
+    call = pp.Literal("call")
+    stack = pp.Literal("stack")
+    convert = pp.Literal("convert")
+    precision = pp.one_of("single double")
 
     # __init__words
-    varname = pp.Word(pp.alphas)
+    # Python identifiers, the front end names its temporaries
+    # __PYCC_INTERNAL__C0 and so on
+    varname = pp.Word(pp.alphas + "_", pp.alphanums + "_")
+    labelname = pp.Word(pp.alphas + "_", pp.alphanums + "_")
 
     # __init__registers
     xmm_registers = pp.Word("%xmm") + integer
     registers = xmm_registers
 
+    # Arguments past the eighth double are passed on the stack
+    stack_argument = stack + integer
+
     versioned_variable = varname + pound + integer
 
-    binop = (
-        versioned_variable + (binop_mult | binop_div | binop_sub) + versioned_variable
+    binop = versioned_variable + (
+        binop_mult | binop_div | binop_sub | binop_add | binop_and | binop_or
+    ) + versioned_variable
+    compare = versioned_variable + compare_op + versioned_variable
+    select_statement = select + versioned_variable + versioned_variable + versioned_variable
+    phi_statement = phi + versioned_variable + versioned_variable
+    call_statement = (
+        call
+        + labelname
+        + pp.Suppress("(")
+        + pp.DelimitedList(versioned_variable)
+        + pp.Suppress(")")
     )
+    convert_statement = convert + precision + (registers | stack_argument | versioned_variable)
     returns_statement = returns + versioned_variable
-    const_statement = double | integer
+    returns_values_statement = (
+        returns
+        + pp.Suppress("(")
+        + pp.DelimitedList(versioned_variable)
+        + pp.Suppress(")")
+    )
+    const_statement = double | integer | special_double
     assignment = (
         versioned_variable
         + cequals
-        + (binop | registers | versioned_variable | const_statement)
+        + (
+            select_statement
+            | phi_statement
+            | call_statement
+            | convert_statement
+            | compare
+            | binop
+            | registers
+            | stack_argument
+            | versioned_variable
+            | const_statement
+        )
     )
-    goto_statement = goto + varname
-    label_statement = label + varname
+    goto_statement = goto + labelname
+    label_statement = label + labelname
+    branch_statement = branch + versioned_variable + labelname + labelname
     assignment_block = pp.OneOrMore(
-        assignment | goto_statement | label_statement | returns_statement
+        assignment
+        | goto_statement
+        | label_statement
+        | branch_statement
+        | returns_statement
+        | returns_values_statement
     )
 
     # __init__namedtuples
@@ -69,16 +165,42 @@ class IRGrammar:
     const_statement_tuple = namedtuple("Constant", "Value")
     label_statement_tuple = namedtuple("Label", "Name")
     goto_statement_tuple = namedtuple("Goto", "Name")
+    branch_statement_tuple = namedtuple("Branch", ["Condition", "TrueLabel", "FalseLabel"])
+    compare_tuple = namedtuple("Compare", ["Left", "Op", "Right"])
+    select_tuple = namedtuple("Select", ["Condition", "Left", "Right"])
+    phi_tuple = namedtuple("Phi", ["Left", "Right"])
+    call_tuple = namedtuple("Call", ["Function", "Arguments"])
+    convert_tuple = namedtuple("Convert", ["Type", "Value"])
     returns_tuple = namedtuple("Return", ["VersionedVariable"])
+    returns_values_tuple = namedtuple("ReturnValues", ["Values"])
     versioned_variable_tuple = namedtuple("VersionedVariable", ["Name", "Version"])
     xmm_registers_tuple = namedtuple("XmmRegister", ["Name"])
+    stack_argument_tuple = namedtuple("StackArgument", ["Index"])
 
     def label_statement_parse_action(original: str, location: int, tokens: List[Any]):
         return IRGrammar.label_statement_tuple(tokens[1])
 
-    def goto_statement_tuple(original: str, location: int, tokens: List[Any]):
+    def goto_statement_parse_action(original: str, location: int, tokens: List[Any]):
         return IRGrammar.goto_statement_tuple(tokens[1])
 
+    def branch_statement_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.branch_statement_tuple(tokens[1], tokens[2], tokens[3])
+
+    def compare_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.compare_tuple(tokens[0], tokens[1], tokens[2])
+
+    def select_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.select_tuple(tokens[1], tokens[2], tokens[3])
+
+    def phi_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.phi_tuple(tokens[1], tokens[2])
+
+    def call_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.call_tuple(tokens[1], tuple(tokens[2:]))
+
+    def convert_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.convert_tuple(tokens[1], tokens[2])
+
     def assignment_parse_action(original: str, location: int, tokens: List[Any]):
         return IRGrammar.assignment_tuple(tokens[0], tokens[2])
 
@@ -91,10 +213,17 @@ class IRGrammar:
     def returns_parse_action(original: str, location: int, tokens: List[Any]):
         return IRGrammar.returns_tuple(tokens[1])
 
+    def returns_values_parse_action(original: str, location: int, tokens: List[Any]):
+        return IRGrammar.returns_values_tuple(tuple(tokens[1:]))
+
     def xmm_registers_parse_action(original: str, location: int, tokens: List[Any]):
         assert tokens[1] >= 0 and tokens[1] < 16
         return IRGrammar.xmm_registers_tuple(f"{tokens[0]}{tokens[1]}")
 
+    def stack_argument_parse_action(original: str, location: int, tokens: List[Any]):
+        assert tokens[1] >= 0
+        return IRGrammar.stack_argument_tuple(tokens[1])
+
     def versioned_variable_parse_action(
         original: str, location: int, tokens: List[Any]
     ):
@@ -106,8 +235,18 @@ class IRGrammar:
     binop.set_parse_action(binop_parse_action)
     const_statement.set_parse_action(const_statement_action)
     returns_statement.set_parse_action(returns_parse_action)
+    returns_values_statement.set_parse_action(returns_values_parse_action)
     versioned_variable.set_parse_action(versioned_variable_parse_action)
     xmm_registers.set_parse_action(xmm_registers_parse_action)
+    stack_argument.set_parse_action(stack_argument_parse_action)
+    label_statement.set_parse_action(label_statement_parse_action)
+    goto_statement.set_parse_action(goto_statement_parse_action)
+    branch_statement.set_parse_action(branch_statement_parse_action)
+    compare.set_parse_action(compare_parse_action)
+    select_statement.set_parse_action(select_parse_action)
+    phi_statement.set_parse_action(phi_parse_action)
+    call_statement.set_parse_action(call_parse_action)
+    convert_statement.set_parse_action(convert_parse_action)
 
     @classmethod
     def assignment_tuple_as_str(cls: "IRGrammar", node: "IRGrammar.assignment_tuple"):
@@ -119,6 +258,8 @@ class IRGrammar:
                 rhs = str(node.Right.Value)
             case "XmmRegister":
                 rhs = str(node.Right.Name)
+            case "StackArgument":
+                rhs = f"stack {node.Right.Index}"
             case "BinOp":
                 binop: IRGrammar.binop_tuple = node.Right
                 rhs = (
@@ -128,6 +269,43 @@ class IRGrammar:
                     + " "
                     + cls.versioned_variable_as_str(binop.Right)
                 )
+            case "Compare":
+                compare: IRGrammar.compare_tuple = node.Right
+                rhs = (
+                    cls.versioned_variable_as_str(compare.Left)
+                    + " "
+                    + compare.Op
+                    + " "
+                    + cls.versioned_variable_as_str(compare.Right)
+                )
+            case "Select":
+                select: IRGrammar.select_tuple = node.Right
+                rhs = "select " + " ".join(
+                    cls.versioned_variable_as_str(operand)
+                    for operand in (select.Condition, select.Left, select.Right)
+                )
+            case "Phi":
+                phi: IRGrammar.phi_tuple = node.Right
+                rhs = "phi " + " ".join(
+                    cls.versioned_variable_as_str(operand)
+                    for operand in (phi.Left, phi.Right)
+                )
+            case "Call":
+                call: IRGrammar.call_tuple = node.Right
+                arguments = ", ".join(
+                    cls.versioned_variable_as_str(argument) for argument in call.Arguments
+                )
+                rhs = f"call {call.Function}({arguments})"
+            case "Convert":
+                value = node.Right.Value
+                match type(value).__name__:
+                    case "XmmRegister":
+                        value = value.Name
+                    case "StackArgument":
+                        value = f"stack {value.Index}"
+                    case _:
+                        value = cls.versioned_variable_as_str(value)
+                rhs = f"convert {node.Right.Type} {value}"
             case "VersionedVariable":
                 rhs = cls.versioned_variable_as_str(node.Right)
             case _:
@@ -138,6 +316,15 @@ class IRGrammar:
     def returns_tuple_as_str(cls: "IRGrammar", node: "IRGrammar.returns_tuple"):
         return "ret " + IRGrammar.versioned_variable_as_str(node.VersionedVariable)
 
+    @classmethod
+    def returns_values_tuple_as_str(
+        cls: "IRGrammar", node: "IRGrammar.returns_values_tuple"
+    ):
+        values = ", ".join(
+            IRGrammar.versioned_variable_as_str(value) for value in node.Values
+        )
+        return f"ret ({values})"
+
     @classmethod
     def versioned_variable_as_str(
         cls: "IRGrammar", node: "IRGrammar.versioned_variable_tuple"
@@ -153,3 +340,10 @@ class IRGrammar:
         cls: "IRGrammar", node: "IRGrammar.goto_statement_tuple"
     ):
         return f"label {node.Name}"
+
+    @classmethod
+    def branch_statement_as_str(
+        cls: "IRGrammar", node: "IRGrammar.branch_statement_tuple"
+    ):
+        condition = IRGrammar.versioned_variable_as_str(node.Condition)
+        return f"br {condition} {node.TrueLabel} {node.FalseLabel}"
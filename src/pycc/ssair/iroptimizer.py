@@ -1,133 +1,1352 @@
 from pycc.ssair.irgrammar import IRGrammar
 from typing import List
 
+import functools
+import heapq
+import math
+import struct
+
 
 class IROptimizer:
 
-    def __init__(self, ir: List[IRGrammar.assignment_tuple | IRGrammar.returns_tuple]):
+    """Operators whose operands may be swapped without changing the result"""
+    COMMUTATIVE_OPS = ("+", "*")
+
+    """Lattice value of a variable that is not a compile time constant"""
+    OVERDEFINED = object()
+
+    """Conditionals whose arms cost at most IF_CONVERSION_LIMIT are turned into
+    selects, both arms are then executed. Operations not listed cost 1,
+    constants and copies are free. Calls into libm are never speculated,
+    except sqrt which is a single instruction."""
+    IF_CONVERSION_LIMIT = 8
+    IF_CONVERSION_COSTS = {"/": 4, "sqrt": 4, "call": 20}
+
+    """Integer exponents up to this magnitude are computed by multiplications
+    in fast math"""
+    POWER_CHAIN_LIMIT = 64
+
+    """Polynomials of at least this degree in Horner form are evaluated in
+    Estrin form by fast math"""
+    ESTRIN_MIN_DEGREE = 3
+
+    def __init__(
+        self,
+        ir: List[IRGrammar.assignment_tuple | IRGrammar.returns_tuple],
+        fast_math: bool = False,
+    ):
         self.ir = ir
 
+        # Fast math allows transformations that change the rounding of the
+        # results, the passes are bit exact otherwise
+        self.fast_math = fast_math
+        self.n_temporaries = 0
+
+        # Counters of the work done by each pass, reported by pycc.compile
+        self.stats = {
+            "constants_folded": 0,
+            "algebraic_simplified": 0,
+            "value_numbering_eliminated": 0,
+            # Copies are renamed away by value numbering as well, they are no
+            # repeated computation and are counted apart
+            "copies_propagated": 0,
+            "if_converted": 0,
+            "branches_folded": 0,
+            "powers_reduced": 0,
+            "narrowed": 0,
+        }
+        if fast_math:
+            self.stats.update(reciprocals=0, polynomials=0, reassociated=0)
+
         self.propogate_version_version_assignments()
-        self.precompute_constant_binops()
+        self.constant_propagation()
+        self.power_reduction()
+        self.if_conversion()
+        if fast_math:
+            self.reciprocal_division()
+            self.polynomial_evaluation()
+            self.reassociation()
+        self.narrow_precision()
+        self.value_numbering()
         self.remove_unused_variables()
 
-    def get_ir_constant(self, node: IRGrammar.versioned_variable_tuple):
+    def temporary(self) -> IRGrammar.versioned_variable_tuple:
+        """A new variable for an intermediate value created by a pass"""
+        name = f"__PYCC_INTERNAL__F{self.n_temporaries}"
+        self.n_temporaries += 1
+        return IRGrammar.versioned_variable_tuple(name, 0)
+
+    def definitions(self) -> dict:
+        return {
+            stmt.Left: stmt.Right
+            for stmt in self.ir
+            if type(stmt).__name__ == "Assignment"
+        }
+
+    def use_counts(self) -> dict:
+        uses = {}
         for stmt in self.ir:
-            if type(stmt).__name__ != "Assignment":
-                continue
-            if stmt.Left == node:
-                return stmt.Right.Value
+            for operand in self.statement_operands(stmt):
+                uses[operand] = uses.get(operand, 0) + 1
+        return uses
 
-    def delete_and_replace(
-        self,
-        to_delete: IRGrammar.versioned_variable_tuple,
-        replace_with: IRGrammar.versioned_variable_tuple,
-    ):
-        # Delete any assignment that assigns to_delete in its left hand side
+    @staticmethod
+    def single_use_binop(var, op: str, definitions: dict, uses: dict):
+        """The binop `op` defining `var` if `var` is read once, None otherwise"""
+        value = definitions.get(var)
+        if type(value).__name__ == "BinOp" and value.Op == op and uses.get(var) == 1:
+            return value
+        return None
+
+    @staticmethod
+    @functools.cache
+    def addition_chain(n: int) -> tuple:
+        """A shortest addition chain of `n`, the exponents from 1 to `n` that
+        are each the sum of the previous one and an earlier one. x ** n is
+        computed with one multiplication per exponent after the first. The
+        chains of this form are the shortest of all for the exponents below
+        12509, they are found by iterative deepening."""
+
+        def search(chain: tuple, remaining: int):
+            if chain[-1] == n:
+                return chain
+            if remaining == 0 or chain[-1] << remaining < n:
+                return None
+            for exponent in reversed(chain):
+                if chain[-1] + exponent <= n:
+                    found = search(chain + (chain[-1] + exponent,), remaining - 1)
+                    if found is not None:
+                        return found
+            return None
+
+        length = 0
+        while (chain := search((1,), length)) is None:
+            length += 1
+        return chain
+
+    def power(self, base, exponent: float, result) -> list | None:
+        """The statements computing `result` := pow(base, exponent) without a
+        call of pow, None if the exponent is not reduced.
+
+        Python and libm compute powers correctly rounded, so only squares,
+        which are a single rounded multiplication, reciprocals and the
+        exponents 0 and 1 are reduced in strict mode. pow(x, 0.5) is sqrt(x)
+        except for -0.0, whose square root keeps its sign, and -inf, whose
+        square root is a nan. With fast math any integer exponent up to
+        POWER_CHAIN_LIMIT is computed by a shortest addition chain and
+        x ** -0.5 is 1 / sqrt(x).
+        """
+
+        def assign(left, right):
+            return IRGrammar.assignment_tuple(left, right)
 
+        def constant(value):
+            var = self.temporary()
+            ir.append(assign(var, IRGrammar.const_statement_tuple(value)))
+            return var
+
+        ir = []
+        if exponent == 0.5 or (exponent == -0.5 and self.fast_math):
+            root = result if exponent == 0.5 and self.fast_math else self.temporary()
+            if self.fast_math:
+                ir.append(assign(root, IRGrammar.call_tuple("sqrt", (base,))))
+            else:
+                # Adding 0.0 turns -0.0 into 0.0
+                positive = self.temporary()
+                ir.append(
+                    assign(positive, IRGrammar.binop_tuple(base, "+", constant(0.0)))
+                )
+                ir.append(assign(root, IRGrammar.call_tuple("sqrt", (positive,))))
+                is_minus_inf = self.temporary()
+                ir.append(
+                    assign(
+                        is_minus_inf,
+                        IRGrammar.compare_tuple(base, "==", constant(-math.inf)),
+                    )
+                )
+                ir.append(
+                    assign(
+                        result, IRGrammar.select_tuple(is_minus_inf, constant(math.inf), root)
+                    )
+                )
+            if exponent == -0.5:
+                ir.append(assign(result, IRGrammar.binop_tuple(constant(1.0), "/", root)))
+            return ir
+
+        if not float(exponent).is_integer():
+            return None
+        n = int(exponent)
+        if self.fast_math:
+            if abs(n) > self.POWER_CHAIN_LIMIT:
+                return None
+        elif not n in (-1, 0, 1, 2):
+            return None
+
+        if n == 0:
+            # pow(x, 0.0) is 1.0 for every x, nans included
+            return [assign(result, IRGrammar.const_statement_tuple(1.0))]
+        if n == 1:
+            return [assign(result, base)]
+
+        chain = self.addition_chain(abs(n))
+        powers = {1: base}
+        for exponent_idx, exponent in enumerate(chain[1:], start=1):
+            last = chain[exponent_idx - 1]
+            powers[exponent] = result if exponent == n else self.temporary()
+            ir.append(
+                assign(
+                    powers[exponent],
+                    IRGrammar.binop_tuple(powers[last], "*", powers[exponent - last]),
+                )
+            )
+        if n < 0:
+            ir.append(
+                assign(result, IRGrammar.binop_tuple(constant(1.0), "/", powers[-n]))
+            )
+        return ir
+
+    def power_reduction(self):
+        """Replace calls of pow with constant exponents, `x ** 2.0` or
+        `math.pow(x, 3.0)`, by multiplications and square roots"""
+
+        definitions = self.definitions()
         new_ir = []
         for stmt in self.ir:
-            stmt_type = type(stmt).__name__
-            if stmt_type != "Assignment":
-                new_ir.append(stmt)
-                continue
+            if (
+                type(stmt).__name__ == "Assignment"
+                and type(stmt.Right).__name__ == "Call"
+                and stmt.Right.Function == "pow"
+                and type(definitions.get(stmt.Right.Arguments[1])).__name__ == "Constant"
+            ):
+                base, exponent = stmt.Right.Arguments
+                reduced = self.power(base, float(definitions[exponent].Value), stmt.Left)
+                if reduced is not None:
+                    new_ir += reduced
+                    self.stats["powers_reduced"] += 1
+                    continue
+            new_ir.append(stmt)
+        self.ir = new_ir
 
-            left_type = type(stmt.Left).__name__
-            right_type = type(stmt.Right).__name__
+    """Operations computed in single precision when their operands and result
+    are single precision values"""
+    SINGLE_PRECISION_OPS = ("+", "-", "*", "/")
 
-            if left_type == "VersionedVariable" and stmt.Left == to_delete:
-                # Delete this assignment
-                continue
+    @staticmethod
+    def is_single(value: float) -> bool:
+        """Whether `value` is exactly a single precision value"""
+        try:
+            (single,) = struct.unpack("<f", struct.pack("<f", value))
+        except OverflowError:
+            return False
+        return IROptimizer.same_constant(single, value)
+
+    def narrow(self, var, definitions: dict, uses: dict, top: bool = False):
+        """The statements computing the double `var` in single precision and
+        the variable of the result, None if it is not a single precision value
+        or `var` is not computed by an operation that may be narrowed"""
+
+        value = definitions.get(var)
+        match type(value).__name__:
+            case "Convert" if value.Type == "double":
+                # A widened single
+                return [], value.Value
+            case "Constant" if self.is_single(float(value.Value)):
+                single = self.temporary()
+                return [
+                    IRGrammar.assignment_tuple(single, IRGrammar.convert_tuple("single", var))
+                ], single
+
+        # Strict mode narrows the last operation, whose operands are singles
+        if not (top or self.fast_math) or uses.get(var) != 1:
+            return None
+        match type(value).__name__:
+            case "BinOp" if value.Op in self.SINGLE_PRECISION_OPS:
+                operands = (value.Left, value.Right)
+            case "Call" if value.Function == "sqrt":
+                operands = value.Arguments
+            case _:
+                return None
+
+        ir = []
+        narrowed = []
+        for operand in operands:
+            operand_narrowed = self.narrow(operand, definitions, uses)
+            if operand_narrowed is None:
+                return None
+            ir += operand_narrowed[0]
+            narrowed.append(operand_narrowed[1])
+
+        single = self.temporary()
+        if type(value).__name__ == "BinOp":
+            ir.append(
+                IRGrammar.assignment_tuple(
+                    single, IRGrammar.binop_tuple(narrowed[0], value.Op, narrowed[1])
+                )
+            )
+        else:
+            ir.append(IRGrammar.assignment_tuple(single, value._replace(Arguments=tuple(narrowed))))
+        return ir, single
+
+    def narrow_precision(self):
+        """Compute operations rounded to single precision in single precision.
+
+        Python computes with doubles, single precision arguments are widened
+        and results are rounded to single precision when returned. The sum,
+        difference, product, quotient and square root of single precision
+        values rounded to double and then to single precision are the single
+        precision results, doubles have more than twice the precision of
+        singles, so the last operation before the rounding is computed with
+        the single precision instructions in strict mode. With fast math whole
+        expressions of single precision values are.
+        """
+
+        definitions = self.definitions()
+        uses = self.use_counts()
+        new_ir = []
+        for stmt in self.ir:
+            if (
+                type(stmt).__name__ == "Assignment"
+                and type(stmt.Right).__name__ == "Convert"
+                and stmt.Right.Type == "single"
+                and type(stmt.Right.Value).__name__ == "VersionedVariable"
+                and type(definitions.get(stmt.Right.Value)).__name__ != "Constant"
+            ):
+                narrowed = self.narrow(stmt.Right.Value, definitions, uses, top=True)
+                if narrowed is not None:
+                    ir, single = narrowed
+                    if ir:
+                        # The last statement computes the result
+                        ir[-1] = ir[-1]._replace(Left=stmt.Left)
+                    else:
+                        ir = [IRGrammar.assignment_tuple(stmt.Left, single)]
+                    new_ir += ir
+                    self.stats["narrowed"] += 1
+                    continue
+            new_ir.append(stmt)
+        self.ir = new_ir
+
+    def reciprocal_division(self):
+        """Fast math: replace divisions by multiplications.
 
-            if right_type == "BinOp":
-                new_stmt = stmt.Right
-                if stmt.Right.Left == to_delete:
-                    new_stmt = IRGrammar.binop_tuple(
-                        replace_with, new_stmt.Op, new_stmt.Right
+        A division by a constant becomes a multiplication by its reciprocal,
+        rounded. A variable that divides several values is inverted once,
+        right after its definition, and the divisions multiply by the inverse.
+        """
+
+        definitions = self.definitions()
+        divisions = {}
+        for stmt in self.ir:
+            if (
+                type(stmt).__name__ == "Assignment"
+                and type(stmt.Right).__name__ == "BinOp"
+                and stmt.Right.Op == "/"
+            ):
+                divisions[stmt.Right.Right] = divisions.get(stmt.Right.Right, 0) + 1
+        shared = {
+            divisor
+            for divisor, count in divisions.items()
+            if count > 1 and type(definitions.get(divisor)).__name__ != "Constant"
+        }
+
+        reciprocals = {}
+        pending = []
+        new_ir = []
+        for stmt in self.ir:
+            is_phi = (
+                type(stmt).__name__ == "Assignment" and type(stmt.Right).__name__ == "Phi"
+            )
+            if not is_phi:
+                # The inverses follow the phis of a block
+                new_ir += pending
+                pending = []
+
+            if (
+                type(stmt).__name__ == "Assignment"
+                and type(stmt.Right).__name__ == "BinOp"
+                and stmt.Right.Op == "/"
+            ):
+                divisor = stmt.Right.Right
+                constant = definitions.get(divisor)
+                if type(constant).__name__ == "Constant":
+                    reciprocal = self.temporary()
+                    value = self.evaluate_binop(1.0, "/", constant.Value)
+                    new_ir.append(
+                        IRGrammar.assignment_tuple(
+                            reciprocal, IRGrammar.const_statement_tuple(value)
+                        )
                     )
-                if stmt.Right.Right == to_delete:
-                    new_stmt = IRGrammar.binop_tuple(
-                        new_stmt.Left, new_stmt.Op, replace_with
+                    divisor = reciprocal
+                else:
+                    divisor = reciprocals.get(divisor)
+                if divisor is not None:
+                    stmt = IRGrammar.assignment_tuple(
+                        stmt.Left, IRGrammar.binop_tuple(stmt.Right.Left, "*", divisor)
                     )
-                new_ir.append(IRGrammar.assignment_tuple(stmt.Left, new_stmt))
+                    self.stats["reciprocals"] += 1
+
+            new_ir.append(stmt)
+            if type(stmt).__name__ == "Assignment" and stmt.Left in shared:
+                one = self.temporary()
+                reciprocal = self.temporary()
+                pending += [
+                    IRGrammar.assignment_tuple(one, IRGrammar.const_statement_tuple(1.0)),
+                    IRGrammar.assignment_tuple(
+                        reciprocal, IRGrammar.binop_tuple(one, "/", stmt.Left)
+                    ),
+                ]
+                reciprocals[stmt.Left] = reciprocal
+        self.ir = new_ir + pending
+
+    def horner_coefficients(self, var, x, definitions: dict, uses: dict) -> tuple:
+        """The coefficients, lowest first, of `var` computed in Horner form
+        a0 + x * (a1 + x * (a2 + ...)) in the variable `x`, and the variables
+        of the additions and multiplications of the form. Any variable is a
+        polynomial of degree 0 in x. `x` is None when it is not known yet,
+        the candidate giving the highest degree is taken."""
+
+        best = [var], x, []
+        addition = definitions.get(var)
+        if type(addition).__name__ != "BinOp" or addition.Op != "+":
+            return best
+        for constant, product in (
+            (addition.Left, addition.Right),
+            (addition.Right, addition.Left),
+        ):
+            multiplication = self.single_use_binop(product, "*", definitions, uses)
+            if multiplication is None:
                 continue
+            for variable, inner in (
+                (multiplication.Left, multiplication.Right),
+                (multiplication.Right, multiplication.Left),
+            ):
+                if x is not None and variable != x:
+                    continue
+                coefficients, steps = [inner], []
+                if uses.get(inner) == 1:
+                    coefficients, _, steps = self.horner_coefficients(
+                        inner, variable, definitions, uses
+                    )
+                if len(coefficients) + 1 > len(best[0]):
+                    best = [constant] + coefficients, variable, [var, product] + steps
+        return best
+
+    def polynomial_evaluation(self):
+        """Fast math: evaluate polynomials written in Horner form in Estrin
+        form.
+
+        The Horner form is a chain of dependent multiply and adds. Estrin's
+        scheme computes the pairs a0 + a1 * x, a2 + a3 * x, ... independently
+        and combines them with x^2, then the pairs of those with x^4 and so
+        on, the depth grows with the logarithm of the degree.
+        """
 
+        definitions = self.definitions()
+        uses = self.use_counts()
+        polynomials = {}
+        covered = set()
+        # Outermost polynomials first, their inner Horner steps are covered
+        for stmt in reversed(self.ir):
+            if type(stmt).__name__ != "Assignment" or stmt.Left in covered:
+                continue
+            coefficients, x, steps = self.horner_coefficients(
+                stmt.Left, None, definitions, uses
+            )
+            if len(coefficients) <= self.ESTRIN_MIN_DEGREE:
+                continue
+            polynomials[stmt.Left] = coefficients, x
+            covered.update(steps)
+
+        new_ir = []
+        for stmt in self.ir:
+            if type(stmt).__name__ == "Assignment" and stmt.Left in polynomials:
+                new_ir += self.estrin(*polynomials[stmt.Left], stmt.Left)
+                self.stats["polynomials"] += 1
+                continue
             new_ir.append(stmt)
         self.ir = new_ir
 
-    def precompute_constant_binops(self):
+    def estrin(self, coefficients: list, x, result) -> list:
+        """The statements evaluating the polynomial of `coefficients` in `x`
+        into `result` with Estrin's scheme"""
+        ir = []
+        terms = coefficients
+        power = x
+        while len(terms) > 1:
+            pairs = []
+            for term_idx in range(0, len(terms), 2):
+                if term_idx + 1 == len(terms):
+                    pairs.append(terms[term_idx])
+                    continue
+                product = self.temporary()
+                pair = result if len(terms) == 2 else self.temporary()
+                ir += [
+                    IRGrammar.assignment_tuple(
+                        product, IRGrammar.binop_tuple(terms[term_idx + 1], "*", power)
+                    ),
+                    IRGrammar.assignment_tuple(
+                        pair, IRGrammar.binop_tuple(terms[term_idx], "+", product)
+                    ),
+                ]
+                pairs.append(pair)
+            if len(pairs) > 1:
+                square = self.temporary()
+                ir.append(
+                    IRGrammar.assignment_tuple(square, IRGrammar.binop_tuple(power, "*", power))
+                )
+                power = square
+            terms = pairs
+        return ir
+
+    def reassociation(self):
+        """Fast math: evaluate chains of additions or multiplications as
+        balanced trees.
+
+        a + b + c + d is parsed as ((a + b) + c) + d, three dependent
+        additions. The operands of a chain are collected through its
+        intermediate results that are read once, its constants are folded
+        into one and the operands are combined pairwise, (a + b) + (c + d).
+        Operands computed by longer chains are combined last.
+        """
+
+        definitions = self.definitions()
+        uses = self.use_counts()
+        users = {}
+        for stmt in self.ir:
+            for operand in self.statement_operands(stmt):
+                users[operand] = stmt
+
+        # Length of the longest chain of binops computing a variable
+        depths = {}
+        for stmt in self.ir:
+            if type(stmt).__name__ == "Assignment" and type(stmt.Right).__name__ == "BinOp":
+                depths[stmt.Left] = (
+                    max(depths.get(stmt.Right.Left, 0), depths.get(stmt.Right.Right, 0)) + 1
+                )
+
+        def operands(var, op):
+            binop = self.single_use_binop(var, op, definitions, uses)
+            if binop is None:
+                return [var]
+            return operands(binop.Left, op) + operands(binop.Right, op)
+
         new_ir = []
         for stmt in self.ir:
-            stmt_type = type(stmt).__name__
-            if stmt_type != "Assignment":
+            if (
+                type(stmt).__name__ != "Assignment"
+                or type(stmt.Right).__name__ != "BinOp"
+                or not stmt.Right.Op in self.COMMUTATIVE_OPS
+            ):
                 new_ir.append(stmt)
                 continue
 
-            stmt_right_type = type(stmt.Right).__name__
-            if (
-                stmt_right_type == "BinOp"
-                and stmt.Right.Left.Name.startswith("__PYCC_INTERNAL__C")
-                and stmt.Right.Right.Name.startswith("__PYCC_INTERNAL__C")
+            op = stmt.Right.Op
+            user = users.get(stmt.Left)
+            if uses.get(stmt.Left) == 1 and (
+                type(user).__name__ == "Assignment"
+                and type(user.Right).__name__ == "BinOp"
+                and user.Right.Op == op
             ):
-                # We can perform this binop during compilation
-                left = self.get_ir_constant(stmt.Right.Left)
-                right = self.get_ir_constant(stmt.Right.Right)
-                evaluated_const = eval(f"{left} {stmt.Right.Op} {right}")
+                # Part of the chain of its user
+                new_ir.append(stmt)
+                continue
+
+            leaves = operands(stmt.Right.Left, op) + operands(stmt.Right.Right, op)
+            if len(leaves) < 3:
+                new_ir.append(stmt)
+                continue
+
+            constants = [
+                leaf
+                for leaf in leaves
+                if type(definitions.get(leaf)).__name__ == "Constant"
+            ]
+            leaves = [leaf for leaf in leaves if not leaf in constants]
+            if len(constants) > 1:
+                value = float(definitions[constants[0]].Value)
+                for constant in constants[1:]:
+                    value = self.evaluate_binop(value, op, definitions[constant].Value)
+                folded = self.temporary()
+                new_ir.append(
+                    IRGrammar.assignment_tuple(folded, IRGrammar.const_statement_tuple(value))
+                )
+                constants = [folded]
+            leaves += constants
+
+            # Combine the two operands available first, as in a Huffman code
+            heap = [(depths.get(leaf, 0), leaf_idx, leaf) for leaf_idx, leaf in enumerate(leaves)]
+            heapq.heapify(heap)
+            while len(heap) > 2:
+                left_depth, _, left = heapq.heappop(heap)
+                right_depth, _, right = heapq.heappop(heap)
+                pair = self.temporary()
+                new_ir.append(
+                    IRGrammar.assignment_tuple(pair, IRGrammar.binop_tuple(left, op, right))
+                )
+                depths[pair] = max(left_depth, right_depth) + 1
+                heapq.heappush(heap, (depths[pair], len(leaves) + len(new_ir), pair))
+            leaves = [leaf for _, _, leaf in sorted(heap)]
+            if len(leaves) == 2:
                 new_ir.append(
                     IRGrammar.assignment_tuple(
-                        stmt.Left, IRGrammar.const_statement_tuple(evaluated_const)
+                        stmt.Left, IRGrammar.binop_tuple(leaves[0], op, leaves[1])
                     )
                 )
-                continue
-            new_ir.append(stmt)
-
+            else:
+                new_ir.append(IRGrammar.assignment_tuple(stmt.Left, leaves[0]))
+            self.stats["reassociated"] += 1
         self.ir = new_ir
 
-    def propogate_version_version_assignments(self):
-        to_propogate = []
+    def rename_uses(self, stmt, renames: dict):
+        """Rewrite the variables read by `stmt` through `renames`"""
+
+        match type(stmt).__name__:
+            case "Assignment":
+                match type(stmt.Right).__name__:
+                    case "BinOp":
+                        binop = stmt.Right
+                        return IRGrammar.assignment_tuple(
+                            stmt.Left,
+                            IRGrammar.binop_tuple(
+                                renames.get(binop.Left, binop.Left),
+                                binop.Op,
+                                renames.get(binop.Right, binop.Right),
+                            ),
+                        )
+                    case "VersionedVariable":
+                        return IRGrammar.assignment_tuple(
+                            stmt.Left, renames.get(stmt.Right, stmt.Right)
+                        )
+                    case "Call":
+                        return IRGrammar.assignment_tuple(
+                            stmt.Left,
+                            stmt.Right._replace(
+                                Arguments=tuple(
+                                    renames.get(argument, argument)
+                                    for argument in stmt.Right.Arguments
+                                )
+                            ),
+                        )
+                    case "Convert":
+                        return IRGrammar.assignment_tuple(
+                            stmt.Left,
+                            stmt.Right._replace(
+                                Value=renames.get(stmt.Right.Value, stmt.Right.Value)
+                            ),
+                        )
+                    case "Compare" | "Select" | "Phi":
+                        # Every field other than the operator is an operand
+                        return IRGrammar.assignment_tuple(
+                            stmt.Left,
+                            stmt.Right._replace(
+                                **{
+                                    field: renames.get(value, value)
+                                    for field, value in stmt.Right._asdict().items()
+                                    if field != "Op"
+                                }
+                            ),
+                        )
+            case "Return":
+                return IRGrammar.returns_tuple(
+                    renames.get(stmt.VersionedVariable, stmt.VersionedVariable)
+                )
+            case "ReturnValues":
+                return IRGrammar.returns_values_tuple(
+                    tuple(renames.get(value, value) for value in stmt.Values)
+                )
+            case "Branch":
+                return stmt._replace(
+                    Condition=renames.get(stmt.Condition, stmt.Condition)
+                )
+        return stmt
+
+    def value_numbering(self):
+        """Remove redundant computations.
+
+        Every constant and binary operation is given a key made of its
+        operation and the value numbers of its operands, the operands of
+        commutative operations are put in a canonical order. An assignment
+        whose key was already computed is removed and its uses are renamed to
+        the first variable holding that value. The IR is in SSA form so a
+        variable always holds the value it was first assigned.
+
+        Value numbers do not flow across labels.
+        """
+
+        renames = {}
+        values = {}
+        new_ir = []
         for stmt in self.ir:
+            stmt = self.rename_uses(stmt, renames)
             stmt_type = type(stmt).__name__
+            if stmt_type == "Label":
+                values = {}
             if stmt_type != "Assignment":
+                new_ir.append(stmt)
                 continue
 
-            left_type = type(stmt.Left).__name__
-            right_type = type(stmt.Right).__name__
+            match type(stmt.Right).__name__:
+                case "Constant":
+                    # repr() tells apart 0.0 and -0.0
+                    value = stmt.Right.Value
+                    key = ("const", type(value).__name__, repr(value))
+                case "BinOp":
+                    binop = stmt.Right
+                    operands = (binop.Left, binop.Right)
+                    if binop.Op in self.COMMUTATIVE_OPS:
+                        operands = tuple(sorted(operands))
+                    key = (binop.Op,) + operands
+                case "Compare":
+                    compare = stmt.Right
+                    key = ("compare", compare.Left, compare.Op, compare.Right)
+                case "Select":
+                    select = stmt.Right
+                    key = ("select", select.Condition, select.Left, select.Right)
+                case "Call":
+                    # libm functions are pure
+                    key = ("call", stmt.Right.Function) + stmt.Right.Arguments
+                case "Convert" if type(stmt.Right.Value).__name__ == "VersionedVariable":
+                    key = ("convert", stmt.Right.Type, stmt.Right.Value)
+                case "VersionedVariable":
+                    # Copies are the value of their right hand side
+                    renames[stmt.Left] = stmt.Right
+                    self.stats["copies_propagated"] += 1
+                    continue
+                case _:
+                    new_ir.append(stmt)
+                    continue
 
-            if left_type == "VersionedVariable" and right_type == "VersionedVariable":
-                to_propogate.append((stmt.Left, stmt.Right))
+            if key in values:
+                renames[stmt.Left] = values[key]
+                self.stats["value_numbering_eliminated"] += 1
+                continue
 
-        for to_delete, replace_with in to_propogate:
-            self.delete_and_replace(to_delete, replace_with)
+            values[key] = stmt.Left
+            new_ir.append(stmt)
 
-    def remove_unused_variables(self):
-        new_ir = []
+        self.ir = new_ir
+
+    @staticmethod
+    def same_constant(left, right) -> bool:
+        """Bitwise equality of two constants, 0.0 and -0.0 differ and a nan is
+        the same constant as itself"""
+        return struct.pack("<d", left) == struct.pack("<d", right)
+
+    @staticmethod
+    def evaluate_binop(left: float, op: str, right: float) -> float:
+        """Evaluate a binop with the IEEE-754 double semantics of the SSE
+        instructions it is compiled to. Python floats are IEEE-754 doubles
+        rounded to nearest except that python raises on a division by zero
+        where the hardware produces an infinity or a nan."""
+
+        left = float(left)
+        right = float(right)
+        match op:
+            case "+":
+                return left + right
+            case "-":
+                return left - right
+            case "*":
+                return left * right
+            case "/":
+                if right == 0.0:
+                    if left == 0.0 or math.isnan(left):
+                        return math.nan
+                    return math.copysign(math.inf, left) * math.copysign(1.0, right)
+                return left / right
+            case _:
+                raise NotImplementedError(op)
+
+    @staticmethod
+    def evaluate_compare(left: float, op: str, right: float) -> bool:
+        """Evaluate a comparison as the cmpsd predicates of the assembler do:
+        comparisons with a nan are false except for !=, as in python"""
+
+        left = float(left)
+        right = float(right)
+        match op:
+            case "<":
+                return left < right
+            case "<=":
+                return left <= right
+            case ">":
+                return left > right
+            case ">=":
+                return left >= right
+            case "==":
+                return left == right
+            case "!=":
+                return left != right
+            case _:
+                raise NotImplementedError(op)
+
+    @staticmethod
+    def exact_reciprocal(value: float) -> float | None:
+        """The reciprocal of a power of two when it is exactly representable,
+        division by the value is then the same as multiplication by the
+        reciprocal for every dividend"""
+
+        value = float(value)
+        if value == 0.0 or not math.isfinite(value) or abs(math.frexp(value)[0]) != 0.5:
+            return None
+        reciprocal = 1.0 / value
+        if reciprocal == 0.0 or not math.isfinite(reciprocal):
+            return None
+        if abs(math.frexp(reciprocal)[0]) != 0.5 or reciprocal * value != 1.0:
+            return None
+        return reciprocal
+
+    @staticmethod
+    def is_terminator(stmt) -> bool:
+        return type(stmt).__name__ in ("Goto", "Branch", "Return", "ReturnValues")
+
+    def basic_blocks(self) -> list:
+        """The start and end index of every basic block. A block starts at
+        the first statement or at a label and ends after a goto, a branch or a
+        return, a block ending otherwise falls through to the next one."""
+        blocks = []
+        start = 0
         for stmt_idx, stmt in enumerate(self.ir):
+            if type(stmt).__name__ == "Label" and stmt_idx > start:
+                blocks.append((start, stmt_idx))
+                start = stmt_idx
+            if self.is_terminator(stmt):
+                blocks.append((start, stmt_idx + 1))
+                start = stmt_idx + 1
+        if start < len(self.ir):
+            blocks.append((start, len(self.ir)))
+        return blocks
 
-            stmt_type = type(stmt).__name__
-            if stmt_type != "Assignment":
-                new_ir.append(stmt)
+    def meet(self, left, right):
+        """The lattice value of a variable that is both `left` and `right`.
+        Undefined, None, is the identity and overdefined absorbs."""
+        if left is None:
+            return right
+        if right is None or left is right:
+            return left
+        if left is self.OVERDEFINED or right is self.OVERDEFINED:
+            return self.OVERDEFINED
+        if self.same_constant(left, right):
+            return left
+        return self.OVERDEFINED
+
+    def constant_propagation(self):
+        """Sparse conditional constant propagation.
+
+        Every variable starts out undefined and every block unreachable but
+        the first. The assignments of reachable blocks are evaluated, lowering
+        their variables to a constant or to overdefined, and a variable that
+        changed has the reachable statements using it evaluated again along
+        the SSA def-use chains. A branch on a known condition only makes the
+        block it jumps to reachable and phis only meet the values of their
+        reachable predecessors, so an arm that is never taken does not make
+        the variables of the join overdefined.
+
+        Comparisons of constants evaluate to True or False with the IEEE-754
+        semantics of evaluate_compare, masks combined by & and | as booleans.
+        A select on a known condition is the value of the operand it picks.
+
+        Afterwards assignments of constant variables are replaced by their
+        value, branches on known conditions become gotos, unreachable blocks
+        are removed and phis left with a single reachable predecessor become
+        copies. Folding uses the IEEE-754 semantics of evaluate_binop, never
+        eval().
+        """
+
+        blocks = self.basic_blocks()
+        block_of = {}
+        label_blocks = {}
+        for block_idx, (start, end) in enumerate(blocks):
+            for stmt_idx in range(start, end):
+                block_of[stmt_idx] = block_idx
+            if type(self.ir[start]).__name__ == "Label":
+                label_blocks[self.ir[start].Name] = block_idx
+
+        # The operands of a phi are given in the order of the gotos to its
+        # label. Labels that are entered otherwise as well have their phis
+        # meet every operand.
+        predecessors = {}
+        for stmt_idx, stmt in enumerate(self.ir):
+            if type(stmt).__name__ == "Goto":
+                predecessors.setdefault(stmt.Name, []).append(block_of[stmt_idx])
+        for block_idx, (start, end) in enumerate(blocks):
+            stmt = self.ir[end - 1]
+            if type(stmt).__name__ == "Branch":
+                predecessors[stmt.TrueLabel] = None
+                predecessors[stmt.FalseLabel] = None
+            elif not self.is_terminator(stmt) and block_idx + 1 < len(blocks):
+                successor = self.ir[blocks[block_idx + 1][0]]
+                predecessors[successor.Name] = None
+        for label, label_predecessors in predecessors.items():
+            if label_predecessors is not None and len(label_predecessors) != 2:
+                predecessors[label] = None
+
+        def phi_operands(stmt_idx: int, phi: IRGrammar.phi_tuple) -> list:
+            """The operands of the phi coming from reachable blocks"""
+            label = self.ir[blocks[block_of[stmt_idx]][0]]
+            phi_predecessors = None
+            if type(label).__name__ == "Label":
+                phi_predecessors = predecessors.get(label.Name)
+            if phi_predecessors is None:
+                return [phi.Left, phi.Right]
+            return [
+                operand
+                for operand, block_idx in zip((phi.Left, phi.Right), phi_predecessors)
+                if block_idx in reachable
+            ]
+
+        uses = {}
+        for stmt_idx, stmt in enumerate(self.ir):
+            for operand in self.statement_operands(stmt):
+                uses.setdefault(operand, []).append(stmt_idx)
+
+        lattice = {}
+        reachable = set()
+        block_worklist = [0] if blocks else []
+        stmt_worklist = []
+
+        def reach(label: str):
+            block_idx = label_blocks[label]
+            if not block_idx in reachable:
+                block_worklist.append(block_idx)
+            else:
+                # A new predecessor of the phis of the block
+                start, end = blocks[block_idx]
+                stmt_worklist.extend(range(start, end))
+
+        while block_worklist or stmt_worklist:
+            if block_worklist:
+                block_idx = block_worklist.pop()
+                if block_idx in reachable:
+                    continue
+                reachable.add(block_idx)
+                start, end = blocks[block_idx]
+                stmt_worklist.extend(range(start, end))
+                if not self.is_terminator(self.ir[end - 1]) and block_idx + 1 < len(blocks):
+                    block_worklist.append(block_idx + 1)
+                continue
+
+            stmt_idx = stmt_worklist.pop()
+            if not block_of[stmt_idx] in reachable:
+                continue
+            stmt = self.ir[stmt_idx]
+            match type(stmt).__name__:
+                case "Goto":
+                    reach(stmt.Name)
+                case "Branch":
+                    condition = lattice.get(stmt.Condition)
+                    if condition is None:
+                        continue
+                    if condition is not False:
+                        reach(stmt.TrueLabel)
+                    if condition is not True:
+                        reach(stmt.FalseLabel)
+                case "Assignment":
+                    operands = None
+                    if type(stmt.Right).__name__ == "Phi":
+                        operands = phi_operands(stmt_idx, stmt.Right)
+                    old_value = lattice.get(stmt.Left)
+                    value = self.meet(old_value, self.evaluate_lattice(stmt, lattice, operands))
+                    if value is old_value or (
+                        old_value is not None
+                        and value is not self.OVERDEFINED
+                        and self.same_constant(old_value, value)
+                    ):
+                        continue
+                    lattice[stmt.Left] = value
+                    stmt_worklist += uses.get(stmt.Left, [])
+
+        # Conditions are not constants of the IR
+        constants = {
+            var: value for var, value in lattice.items() if type(value) is float
+        }
+        new_ir = []
+        reciprocals = set()
+        for block_idx, (start, end) in enumerate(blocks):
+            if not block_idx in reachable:
                 continue
+            # Phis stay at the start of their block
+            head, block_ir = [], []
+            for stmt_idx in range(start, end):
+                stmt = self.ir[stmt_idx]
+                match type(stmt).__name__, type(getattr(stmt, "Right", None)).__name__:
+                    case "Label", _:
+                        head.append(stmt)
+                    case "Branch", _:
+                        condition = lattice.get(stmt.Condition)
+                        if type(condition) is bool:
+                            label = stmt.TrueLabel if condition else stmt.FalseLabel
+                            block_ir.append(IRGrammar.goto_statement_tuple(label))
+                            self.stats["branches_folded"] += 1
+                        else:
+                            block_ir.append(stmt)
+                    case "Assignment", "BinOp" | "VersionedVariable" | "Phi" | "Select" if (
+                        stmt.Left in constants
+                    ):
+                        block_ir.append(
+                            IRGrammar.assignment_tuple(
+                                stmt.Left, IRGrammar.const_statement_tuple(constants[stmt.Left])
+                            )
+                        )
+                        self.stats["constants_folded"] += 1
+                    case "Assignment", "Select" if (
+                        type(lattice.get(stmt.Right.Condition)) is bool
+                    ):
+                        select: IRGrammar.select_tuple = stmt.Right
+                        picked = select.Left if lattice[select.Condition] else select.Right
+                        block_ir.append(IRGrammar.assignment_tuple(stmt.Left, picked))
+                    case "Assignment", "Phi":
+                        operands = phi_operands(stmt_idx, stmt.Right)
+                        if len(operands) == 1:
+                            block_ir.append(IRGrammar.assignment_tuple(stmt.Left, operands[0]))
+                        else:
+                            head.append(stmt)
+                    case "Assignment", "BinOp" | "VersionedVariable":
+                        block_ir += self.simplify_algebraic(stmt, constants, reciprocals)
+                    case _:
+                        block_ir.append(stmt)
+            new_ir += head + block_ir
+        self.ir = self.merge_straight_blocks(new_ir)
+
+    def merge_straight_blocks(self, ir: list) -> list:
+        """Remove the gotos to the label right after them when nothing else
+        jumps to the label, as left behind by folded branches"""
+        jumps = {}
+        for stmt in ir:
+            match type(stmt).__name__:
+                case "Goto":
+                    jumps[stmt.Name] = jumps.get(stmt.Name, 0) + 1
+                case "Branch":
+                    for label in (stmt.TrueLabel, stmt.FalseLabel):
+                        jumps[label] = jumps.get(label, 0) + 1
 
-            lhs = stmt.Left
+        merged = []
+        skip_label = None
+        for stmt_idx, stmt in enumerate(ir):
+            if self.is_statement(stmt, "Label", skip_label):
+                skip_label = None
+                continue
+            if (
+                type(stmt).__name__ == "Goto"
+                and jumps[stmt.Name] == 1
+                and stmt_idx + 2 < len(ir)
+                and self.is_statement(ir[stmt_idx + 1], "Label", stmt.Name)
+                and not (
+                    type(ir[stmt_idx + 2]).__name__ == "Assignment"
+                    and type(ir[stmt_idx + 2].Right).__name__ == "Phi"
+                )
+            ):
+                skip_label = stmt.Name
+                continue
+            merged.append(stmt)
+        return merged
 
-            is_used = False
-            for next_stmt in self.ir[stmt_idx + 1 :]:
+    def assignment_operands(self, stmt: IRGrammar.assignment_tuple):
+        match type(stmt.Right).__name__:
+            case "BinOp" | "Compare" | "Phi":
+                return [stmt.Right.Left, stmt.Right.Right]
+            case "Select":
+                return [stmt.Right.Condition, stmt.Right.Left, stmt.Right.Right]
+            case "Call":
+                return list(stmt.Right.Arguments)
+            case "Convert":
+                if type(stmt.Right.Value).__name__ == "VersionedVariable":
+                    return [stmt.Right.Value]
+            case "VersionedVariable":
+                return [stmt.Right]
+        return []
 
-                if type(next_stmt).__name__ == "Return":
-                    next_stmt: IRGrammar.returns_tuple = next_stmt
-                    if next_stmt.VersionedVariable == lhs:
-                        is_used = True
-                        break
+    def statement_operands(self, stmt):
+        """The variables read by any statement"""
+        match type(stmt).__name__:
+            case "Assignment":
+                return self.assignment_operands(stmt)
+            case "Return":
+                return [stmt.VersionedVariable]
+            case "ReturnValues":
+                return list(stmt.Values)
+            case "Branch":
+                return [stmt.Condition]
+        return []
 
-                if type(next_stmt).__name__ != "Assignment":
+    @staticmethod
+    def is_statement(stmt, kind: str, name: str) -> bool:
+        """Whether `stmt` is the label or goto `name`. Statements are compared
+        by type first, namedtuples of equal fields compare equal."""
+        return type(stmt).__name__ == kind and stmt.Name == name
+
+    def match_diamond(self, branch_idx: int):
+        """Match the statements of an if/else starting at the branch at
+        `branch_idx` whose arms only hold assignments
+
+            br c then else
+            label then
+            ... then arm
+            goto join
+            label else
+            ... else arm
+            goto join
+            label join
+            phis
+
+        Returns the arms, the phis and the index past the last phi or None."""
+
+        branch = self.ir[branch_idx]
+        if not self.is_statement(self.ir[branch_idx + 1], "Label", branch.TrueLabel):
+            return None
+
+        def match_arm(start_idx: int):
+            arm = []
+            for stmt_idx in range(start_idx, len(self.ir)):
+                stmt = self.ir[stmt_idx]
+                match type(stmt).__name__:
+                    case "Goto":
+                        return arm, stmt.Name, stmt_idx
+                    case "Assignment":
+                        if type(stmt.Right).__name__ in ("XmmRegister", "Phi"):
+                            return None
+                        arm.append(stmt)
+                    case _:
+                        return None
+            return None
+
+        then_arm = match_arm(branch_idx + 2)
+        if then_arm is None:
+            return None
+        then_ir, join_label, goto_idx = then_arm
+        if not self.is_statement(self.ir[goto_idx + 1], "Label", branch.FalseLabel):
+            return None
+
+        else_arm = match_arm(goto_idx + 2)
+        if else_arm is None or else_arm[1] != join_label:
+            return None
+        else_ir, _, goto_idx = else_arm
+        if not self.is_statement(self.ir[goto_idx + 1], "Label", join_label):
+            return None
+
+        # The join must not be reached from anywhere else
+        jumps = [
+            stmt
+            for stmt in self.ir
+            if self.is_statement(stmt, "Goto", join_label)
+            or (
+                type(stmt).__name__ == "Branch"
+                and join_label in (stmt.TrueLabel, stmt.FalseLabel)
+            )
+        ]
+        if len(jumps) != 2:
+            return None
+
+        phis = []
+        end_idx = goto_idx + 2
+        while end_idx < len(self.ir):
+            stmt = self.ir[end_idx]
+            if type(stmt).__name__ != "Assignment" or type(stmt.Right).__name__ != "Phi":
+                break
+            phis.append(stmt)
+            end_idx += 1
+        return then_ir, else_ir, phis, end_idx
+
+    def if_conversion(self):
+        """Turn small conditionals into straight line code.
+
+        Both arms of an if/else whose cost is at most IF_CONVERSION_LIMIT are
+        executed unconditionally and the phis at the join become selects on
+        the branch condition. The assembler compiles selects without branches
+        so data dependent conditions can not be mispredicted. Arms have no
+        side effects, floating point exceptions are masked. Nested
+        conditionals are converted from the inside out.
+        """
+
+        converted = True
+        while converted:
+            converted = False
+            for stmt_idx, stmt in enumerate(self.ir):
+                if type(stmt).__name__ != "Branch":
+                    continue
+                diamond = self.match_diamond(stmt_idx)
+                if diamond is None:
                     continue
 
-                if type(next_stmt.Right).__name__ == "BinOp":
-                    binop = next_stmt.Right
-                    if binop.Left == lhs or binop.Right == lhs:
-                        is_used = True
-                        break
-            if is_used:
-                new_ir.append(stmt)
+                then_ir, else_ir, phis, end_idx = diamond
+                cost = 0
+                for arm_stmt in then_ir + else_ir:
+                    match type(arm_stmt.Right).__name__:
+                        case "BinOp":
+                            cost += self.IF_CONVERSION_COSTS.get(arm_stmt.Right.Op, 1)
+                        case "Compare" | "Select" | "Convert":
+                            cost += 1
+                        case "Call":
+                            cost += self.IF_CONVERSION_COSTS.get(
+                                arm_stmt.Right.Function, self.IF_CONVERSION_COSTS["call"]
+                            )
+                if cost > self.IF_CONVERSION_LIMIT:
+                    continue
+
+                selects = []
+                for phi in phis:
+                    if phi.Right.Left == phi.Right.Right:
+                        selects.append(IRGrammar.assignment_tuple(phi.Left, phi.Right.Left))
+                        continue
+                    selects.append(
+                        IRGrammar.assignment_tuple(
+                            phi.Left,
+                            IRGrammar.select_tuple(
+                                stmt.Condition, phi.Right.Left, phi.Right.Right
+                            ),
+                        )
+                    )
+
+                self.ir = (
+                    self.ir[:stmt_idx] + then_ir + else_ir + selects + self.ir[end_idx:]
+                )
+                self.stats["if_converted"] += 1
+                converted = True
+                break
+
+    def evaluate_lattice(
+        self, stmt: IRGrammar.assignment_tuple, lattice: dict, phi_operands: list = None
+    ):
+        """The lattice value of the left hand side of `stmt`, None while it is
+        still undefined. Phis meet their `phi_operands`, the operands of
+        reachable predecessors."""
+
+        match type(stmt.Right).__name__:
+            case "Phi":
+                value = None
+                for operand in phi_operands:
+                    value = self.meet(value, lattice.get(operand))
+                return value
+            case "Constant":
+                return float(stmt.Right.Value)
+            case "VersionedVariable":
+                return lattice.get(stmt.Right)
+            case "Select":
+                condition = lattice.get(stmt.Right.Condition)
+                if type(condition) is bool:
+                    return lattice.get(stmt.Right.Left if condition else stmt.Right.Right)
+                if condition is None:
+                    return None
+                return self.meet(lattice.get(stmt.Right.Left), lattice.get(stmt.Right.Right))
+            case "BinOp" | "Compare":
+                left = lattice.get(stmt.Right.Left)
+                right = lattice.get(stmt.Right.Right)
+                if left is self.OVERDEFINED or right is self.OVERDEFINED:
+                    return self.OVERDEFINED
+                if left is None or right is None:
+                    return None
+                op = stmt.Right.Op
+                masks = op in ("&", "|")
+                if masks != (type(left) is bool) or masks != (type(right) is bool):
+                    return self.OVERDEFINED
+                if type(stmt.Right).__name__ == "Compare":
+                    return self.evaluate_compare(left, op, right)
+                if masks:
+                    return left and right if op == "&" else left or right
+                return self.evaluate_binop(left, op, right)
+        return self.OVERDEFINED
+
+    def simplify_algebraic(
+        self, stmt: IRGrammar.assignment_tuple, lattice: dict, reciprocals: set
+    ) -> list:
+        """Apply the algebraic identities that hold for every IEEE-754 value,
+        including signed zeros, infinities and nans
+
+            x * 1.0 -> x        x + -0.0 -> x       x / 2^k -> x * 2^-k
+            1.0 * x -> x        -0.0 + x -> x
+            x / 1.0 -> x        x - 0.0 -> x
+
+        Identities such as x * 0.0 -> 0.0 or x + 0.0 -> x do not hold for nans
+        or for -0.0 and are not applied. The statements replacing `stmt` are
+        returned, a reciprocal is defined once per divisor in `reciprocals`.
+        """
+
+        if type(stmt.Right).__name__ != "BinOp":
+            return [stmt]
+
+        binop: IRGrammar.binop_tuple = stmt.Right
+        left = lattice.get(binop.Left)
+        right = lattice.get(binop.Right)
+
+        def is_constant(value, constant):
+            return (
+                value is not None
+                and value is not self.OVERDEFINED
+                and self.same_constant(value, constant)
+            )
+
+        replacement = None
+        match binop.Op:
+            case "*":
+                if is_constant(right, 1.0):
+                    replacement = binop.Left
+                elif is_constant(left, 1.0):
+                    replacement = binop.Right
+            case "+":
+                if is_constant(right, -0.0):
+                    replacement = binop.Left
+                elif is_constant(left, -0.0):
+                    replacement = binop.Right
+            case "-":
+                if is_constant(right, 0.0):
+                    replacement = binop.Left
+            case "/":
+                if is_constant(right, 1.0):
+                    replacement = binop.Left
+                elif right is not None and right is not self.OVERDEFINED:
+                    reciprocal = self.exact_reciprocal(right)
+                    if reciprocal is not None:
+                        self.stats["algebraic_simplified"] += 1
+                        reciprocal_vv = IRGrammar.versioned_variable_tuple(
+                            binop.Right.Name + "__R", binop.Right.Version
+                        )
+                        reciprocal_ir = []
+                        if not reciprocal_vv in reciprocals:
+                            reciprocals.add(reciprocal_vv)
+                            reciprocal_ir.append(
+                                IRGrammar.assignment_tuple(
+                                    reciprocal_vv,
+                                    IRGrammar.const_statement_tuple(reciprocal),
+                                )
+                            )
+                        return reciprocal_ir + [
+                            IRGrammar.assignment_tuple(
+                                stmt.Left,
+                                IRGrammar.binop_tuple(binop.Left, "*", reciprocal_vv),
+                            )
+                        ]
+
+        if replacement is None:
+            return [stmt]
+        self.stats["algebraic_simplified"] += 1
+        return [IRGrammar.assignment_tuple(stmt.Left, replacement)]
+
+    def propogate_version_version_assignments(self):
+        renames = {}
+        new_ir = []
+        for stmt in self.ir:
+            stmt = self.rename_uses(stmt, renames)
+            if (
+                type(stmt).__name__ == "Assignment"
+                and type(stmt.Left).__name__ == "VersionedVariable"
+                and type(stmt.Right).__name__ == "VersionedVariable"
+            ):
+                renames[stmt.Left] = stmt.Right
                 continue
+            new_ir.append(stmt)
         self.ir = new_ir
+
+    def remove_unused_variables(self):
+        """Remove assignments that are never read, repeated until the
+        assignments only read by removed ones are gone as well"""
+        removed = True
+        while removed:
+            used = set()
+            for stmt in self.ir:
+                used.update(self.statement_operands(stmt))
+            new_ir = [
+                stmt
+                for stmt in self.ir
+                if type(stmt).__name__ != "Assignment" or stmt.Left in used
+            ]
+            removed = len(new_ir) != len(self.ir)
+            self.ir = new_ir
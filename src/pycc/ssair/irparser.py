@@ -16,6 +16,14 @@ class IRParser:
                     stmt_as_str.append(IRGrammar.assignment_tuple_as_str(stmt))
                 case "Return":
                     stmt_as_str.append(IRGrammar.returns_tuple_as_str(stmt))
+                case "ReturnValues":
+                    stmt_as_str.append(IRGrammar.returns_values_tuple_as_str(stmt))
+                case "Label":
+                    stmt_as_str.append(IRGrammar.label_statement_as_str(stmt))
+                case "Goto":
+                    stmt_as_str.append(IRGrammar.goto_statement_as_str(stmt))
+                case "Branch":
+                    stmt_as_str.append(IRGrammar.branch_statement_as_str(stmt))
                 case _:
                     print(stmt)
                     raise NotImplementedError(type(stmt).__name__)
@@ -0,0 +1,410 @@
+from pycc.ssair.irgrammar import IRGrammar
+from pycc.libm import INLINE_FUNCTIONS
+from typing import List
+
+
+class IRSchedulerX64:
+    """Latency aware list scheduler for the basic blocks of the SSA IR.
+
+    IRAssemblerX64 emits instructions in IR order, so the order of the IR is
+    the order of the machine code. The scheduler builds the dependency DAG of
+    each basic block and issues its statements cycle by cycle, always picking
+    the ready statement with the longest latency weighted path to the end of
+    the block. Long latency operations such as divisions are started as early
+    as possible so that independent work overlaps them.
+
+    The number of live values is bounded by `max_live`. Once reached, the
+    statements that free the most registers are preferred over those that
+    start new values, the register allocator has no spill support. Live
+    values are counted as IRAssemblerX64 allocates them, see
+    register_intervals, including the values live across the block. The
+    bound only steers the order: a block whose scheduled order would need
+    more registers than the assembler has is kept in IR order.
+    """
+
+    """Registers IRAssemblerX64 allocates, %xmm15 is its scratch register"""
+    REGISTERS = 15
+
+    """Registers a select may claim besides those of the live values: its
+    constant operands are loaded into registers and without AVX the operands
+    that are read later are copied before they are masked"""
+    SELECT_TEMPORARIES = 3
+
+    """Latency and reciprocal throughput in cycles of the scalar double
+    instructions each IR operation is compiled to. The numbers are those of
+    the register forms from the vendor optimization manuals and uops.info.
+    A select is the three instruction and/andn/or sequence. Operations on
+    single precision values are given the numbers of their double forms. A
+    shuffle moves doubles between the lanes of a register for the packed
+    instructions of IRVectorizerX64, which share the numbers of their scalar
+    forms."""
+    LATENCY_TABLES = {
+        "skylake": {
+            "+": (4, 0.5),
+            "-": (4, 0.5),
+            "*": (4, 0.5),
+            "/": (14, 4.0),
+            "copy": (1, 0.25),
+            "cmp": (4, 0.5),
+            "&": (1, 0.33),
+            "|": (1, 0.33),
+            "select": (3, 1.0),
+            "sqrt": (18, 6.0),
+            "convert": (5, 1.0),
+            "shuffle": (1, 1.0),
+        },
+        "haswell": {
+            "+": (3, 1.0),
+            "-": (3, 1.0),
+            "*": (5, 0.5),
+            "/": (14, 8.0),
+            "copy": (1, 0.25),
+            "cmp": (3, 1.0),
+            "&": (1, 1.0),
+            "|": (1, 1.0),
+            "select": (3, 1.0),
+            "sqrt": (16, 8.0),
+            "convert": (4, 1.0),
+            "shuffle": (1, 1.0),
+        },
+        "zen3": {
+            "+": (3, 0.5),
+            "-": (3, 0.5),
+            "*": (3, 0.5),
+            "/": (13, 4.5),
+            "copy": (1, 0.25),
+            "cmp": (3, 0.5),
+            "&": (1, 0.25),
+            "|": (1, 0.25),
+            "select": (3, 1.0),
+            "sqrt": (20, 9.0),
+            "convert": (3, 1.0),
+            "shuffle": (1, 0.5),
+        },
+    }
+    LATENCY_TABLES["generic"] = LATENCY_TABLES["skylake"]
+
+    """Statements that end a basic block"""
+    TERMINATORS = ("Return", "ReturnValues", "Goto", "Label", "Branch")
+
+    def __init__(self, ir: List, cpu: str = "generic", max_live: int = 14):
+        if not cpu in self.LATENCY_TABLES:
+            raise ValueError(f"No latency table for cpu {cpu}")
+        self.ir = ir
+        self.cpu = cpu
+        self.table = self.LATENCY_TABLES[cpu]
+        self.max_live = max_live
+        # Blocks kept in IR order for their register pressure
+        self.fallbacks = 0
+        self.constants = {
+            stmt.Left
+            for stmt in ir
+            if type(stmt).__name__ == "Assignment"
+            and type(stmt.Right).__name__ == "Constant"
+        }
+
+    def is_barrier(self, stmt) -> bool:
+        """Statements nothing is moved across: terminators and calls, which
+        clobber every xmm register. Moving work across a call would only add
+        values to save around it. Functions compiled to an instruction are no
+        calls."""
+        return type(stmt).__name__ in self.TERMINATORS or (
+            type(stmt).__name__ == "Assignment"
+            and type(stmt.Right).__name__ == "Call"
+            and not stmt.Right.Function in INLINE_FUNCTIONS
+        )
+
+    def operation(self, stmt) -> str | None:
+        """The latency table entry of a statement, None for statements that
+        emit no instruction of their own"""
+        if type(stmt).__name__ != "Assignment":
+            return None
+        match type(stmt.Right).__name__:
+            case "BinOp":
+                return stmt.Right.Op
+            case "VersionedVariable":
+                return "copy"
+            case "Compare":
+                return "cmp"
+            case "Select":
+                return "select"
+            case "Call" if stmt.Right.Function in INLINE_FUNCTIONS:
+                return stmt.Right.Function
+            case "Convert":
+                # Arguments are bound to their register and constants are
+                # rounded when assembled
+                if type(stmt.Right.Value).__name__ == "VersionedVariable" and (
+                    not stmt.Right.Value in self.constants
+                ):
+                    return "convert"
+        return None
+
+    def operands(self, stmt) -> list:
+        match type(stmt).__name__:
+            case "Assignment":
+                match type(stmt.Right).__name__:
+                    case "BinOp" | "Compare" | "Phi":
+                        return [stmt.Right.Left, stmt.Right.Right]
+                    case "Select":
+                        return [stmt.Right.Condition, stmt.Right.Left, stmt.Right.Right]
+                    case "Call":
+                        return list(stmt.Right.Arguments)
+                    case "Convert":
+                        if type(stmt.Right.Value).__name__ == "VersionedVariable":
+                            return [stmt.Right.Value]
+                    case "VersionedVariable":
+                        return [stmt.Right]
+            case "Return":
+                return [stmt.VersionedVariable]
+            case "ReturnValues":
+                return list(stmt.Values)
+            case "Branch":
+                return [stmt.Condition]
+        return []
+
+    def blocks(self):
+        """Split the IR into (head, body, terminator) basic blocks, calls end
+        a block as well. The head holds the argument, constant and phi
+        definitions which emit no code and keep their place, the body is
+        reordered."""
+        head, body = [], []
+        for stmt in self.ir:
+            if self.is_barrier(stmt):
+                yield head, body, stmt
+                head, body = [], []
+            elif self.operation(stmt) is None:
+                head.append(stmt)
+            else:
+                body.append(stmt)
+        if head or body:
+            yield head, body, None
+
+    def in_register(self, stmt) -> bool:
+        """Whether the assembler keeps the variable assigned by `stmt` in a
+        register. Constants and stack arguments are read from memory."""
+        if type(stmt).__name__ != "Assignment":
+            return False
+        match type(stmt.Right).__name__:
+            case "Constant" | "StackArgument":
+                return False
+            case "Convert":
+                return not (
+                    type(stmt.Right.Value).__name__ == "StackArgument"
+                    or stmt.Right.Value in self.constants
+                )
+        return True
+
+    def register_intervals(self, ir: List) -> dict:
+        """The first and last statement index at which each variable holds a
+        register. The assembler frees a register once no later statement
+        reads its variable. The registers of phis are chosen at the first
+        goto to their join and kept through the other arm."""
+        last_use = {}
+        first_goto = {}
+        for stmt_idx, stmt in enumerate(ir):
+            for operand in self.operands(stmt):
+                last_use[operand] = stmt_idx
+            if type(stmt).__name__ == "Goto":
+                first_goto.setdefault(stmt.Name, stmt_idx)
+
+        intervals = {}
+        label = None
+        for stmt_idx, stmt in enumerate(ir):
+            if type(stmt).__name__ == "Label":
+                label = stmt.Name
+            if not self.in_register(stmt):
+                continue
+            start = stmt_idx
+            if type(stmt.Right).__name__ == "Phi":
+                start = min(stmt_idx, first_goto.get(label, stmt_idx))
+            intervals[stmt.Left] = (start, max(start, last_use.get(stmt.Left, start)))
+        return intervals
+
+    def register_pressure(self, ir: List, start: int = 0, end: int = None) -> int:
+        """The most registers the assembler holds at once while compiling the
+        statements `start` to `end` of `ir`"""
+        end = len(ir) if end is None else end
+        live = [0] * (len(ir) + 1)
+        for first, last in self.register_intervals(ir).values():
+            live[first] += 1
+            live[last + 1] -= 1
+        pressure = 0
+        count = 0
+        for stmt_idx, stmt in enumerate(ir[:end]):
+            count += live[stmt_idx]
+            if stmt_idx < start:
+                continue
+            temporaries = 0
+            if type(stmt).__name__ == "Assignment" and type(stmt.Right).__name__ == "Select":
+                temporaries = self.SELECT_TEMPORARIES
+            pressure = max(pressure, count + temporaries)
+        return pressure
+
+    def schedule(self) -> List:
+        """Return the scheduled IR"""
+        blocks = list(self.blocks())
+        block_irs = [
+            head + body + ([terminator] if terminator else [])
+            for head, body, terminator in blocks
+        ]
+
+        # Values read after their own block stay live until its end
+        last_block_use = {}
+        for block_idx, block_ir in enumerate(block_irs):
+            for stmt in block_ir:
+                for operand in self.operands(stmt):
+                    last_block_use[operand] = block_idx
+
+        intervals = self.register_intervals(self.ir)
+        new_ir = []
+        block_start = 0
+        for block_idx, (head, body, terminator) in enumerate(blocks):
+            block_end = block_start + len(block_irs[block_idx])
+            live_out = {
+                var for var, last_block in last_block_use.items() if last_block > block_idx
+            }
+            if terminator is not None:
+                live_out.update(self.operands(terminator))
+            # Registers held across the block by values it does not read
+            read = {operand for stmt in block_irs[block_idx] for operand in self.operands(stmt)}
+            live_across = sum(
+                1
+                for var, (first, last) in intervals.items()
+                if first < block_start and last >= block_end and not var in read
+            )
+
+            scheduled = self.schedule_block(head, body, live_out, live_across)
+            if scheduled != body:
+                # The assembler has no spill support, a block that would need
+                # more registers than it has is kept in IR order
+                tail = [stmt for block_ir in block_irs[block_idx + 1 :] for stmt in block_ir]
+                block_ir = head + scheduled + ([terminator] if terminator else [])
+                if (
+                    self.register_pressure(
+                        new_ir + block_ir + tail, len(new_ir), len(new_ir) + len(block_ir)
+                    )
+                    > self.REGISTERS
+                ):
+                    scheduled = body
+                    self.fallbacks += 1
+
+            new_ir += head
+            new_ir += scheduled
+            if terminator is not None:
+                new_ir.append(terminator)
+            block_start = block_end
+        return new_ir
+
+    def schedule_block(
+        self, head: List, body: List, live_out: set, live_across: int = 0
+    ) -> List:
+        defined_by = {stmt.Left: stmt_idx for stmt_idx, stmt in enumerate(body)}
+        preds = [set() for _ in body]
+        succs = [set() for _ in body]
+        remaining_uses = {}
+        for stmt_idx, stmt in enumerate(body):
+            for operand in self.operands(stmt):
+                remaining_uses[operand] = remaining_uses.get(operand, 0) + 1
+                if operand in defined_by:
+                    preds[stmt_idx].add(defined_by[operand])
+                    succs[defined_by[operand]].add(stmt_idx)
+
+        # Longest latency weighted path from each statement to the end of the
+        # block, computed in reverse since the body is in a topological order
+        priority = [0.0] * len(body)
+        for stmt_idx in reversed(range(len(body))):
+            latency, _ = self.table[self.operation(body[stmt_idx])]
+            priority[stmt_idx] = latency + max(
+                (priority[succ] for succ in succs[stmt_idx]), default=0
+            )
+
+        # Every value read by the block but not defined in it is live on entry
+        # of the block, except for constants which live in memory
+        live = {
+            var
+            for var in remaining_uses
+            if not var in defined_by and not var in self.constants
+        }
+
+        ready_at = [0.0] * len(body)
+        unit_free = {}
+        cycle = 0.0
+        scheduled = []
+        unscheduled = set(range(len(body)))
+        while unscheduled:
+            candidates = [
+                stmt_idx
+                for stmt_idx in unscheduled
+                if not preds[stmt_idx] & unscheduled
+            ]
+
+            def issue_cycle(stmt_idx):
+                op = self.operation(body[stmt_idx])
+                return max(cycle, ready_at[stmt_idx], unit_free.get(op, 0.0))
+
+            def frees(stmt_idx):
+                operands = set(self.operands(body[stmt_idx]))
+                return sum(
+                    1
+                    for operand in operands
+                    if operand in live
+                    and not operand in live_out
+                    and remaining_uses[operand]
+                    == self.operands(body[stmt_idx]).count(operand)
+                )
+
+            if len(live) + live_across >= self.max_live:
+                best = min(
+                    candidates,
+                    key=lambda idx: (-frees(idx), issue_cycle(idx), -priority[idx], idx),
+                )
+            else:
+                best = min(
+                    candidates,
+                    key=lambda idx: (issue_cycle(idx), -priority[idx], idx),
+                )
+
+            stmt = body[best]
+            op = self.operation(stmt)
+            latency, throughput = self.table[op]
+            issue = issue_cycle(best)
+            cycle = issue + 1
+            unit_free[op] = issue + throughput
+            for succ in succs[best]:
+                ready_at[succ] = max(ready_at[succ], issue + latency)
+
+            for operand in self.operands(stmt):
+                remaining_uses[operand] -= 1
+                if remaining_uses[operand] == 0 and not operand in live_out:
+                    live.discard(operand)
+            if remaining_uses.get(stmt.Left) or stmt.Left in live_out:
+                live.add(stmt.Left)
+
+            scheduled.append(stmt)
+            unscheduled.remove(best)
+
+        return scheduled
+
+    def estimate_cycles(self, ir: List = None) -> float:
+        """Cycles until the last result of `ir`, by default the unscheduled
+        IR, is available on a core issuing one instruction per cycle in order
+        with the latencies and throughputs of the table."""
+
+        ready = {}
+        unit_free = {}
+        cycle = 0.0
+        finish = 0.0
+        for stmt in self.ir if ir is None else ir:
+            op = self.operation(stmt)
+            if op is None:
+                continue
+            latency, throughput = self.table[op]
+            issue = max(
+                [cycle, unit_free.get(op, 0.0)]
+                + [ready.get(operand, 0.0) for operand in self.operands(stmt)]
+            )
+            cycle = issue + 1
+            unit_free[op] = issue + throughput
+            ready[stmt.Left] = issue + latency
+            finish = max(finish, ready[stmt.Left])
+        return finish
@@ -0,0 +1,292 @@
+from pycc.ssair.irgrammar import IRGrammar
+from pycc.ssair.irscheduler_x64 import IRSchedulerX64
+from typing import List
+
+
+class IRVectorizerX64:
+    """Superword level parallelism for the basic blocks of the scheduled IR.
+
+    Two independent statements computing the same operation are a pack, the
+    assembler computes both with one packed instruction: the first statement
+    in the low lane of an xmm register and the second in the high lane.
+    Packs are grown from a seed pair along the operands of their statements
+    and along the statements reading their results, so that a chain of packs
+    passes its values from register to register without leaving the lanes.
+
+    Values enter the lanes with a shuffle, unless they are the result of a
+    pack or both are constants, which are loaded as a 16 byte pair. A low
+    lane value is read by scalar instructions as it is, a high lane value read
+    by anything but a matching lane of another pack is extracted with another
+    shuffle. A group of packs is kept when the throughput of the instructions
+    it saves exceeds the throughput of its shuffles on the target cpu.
+
+    The IR is not changed apart from the order of the statements, the two
+    statements of every pack are made adjacent. A block whose packs would
+    need more registers than the assembler has is left unvectorized.
+    """
+
+    """Operations with a packed instruction, on doubles"""
+    PACKED_OPS = ("+", "-", "*", "/")
+
+    """Registers a pack may claim besides those of the live values: the copy
+    of its left operand pair and the gather of its right operand pair"""
+    PACK_TEMPORARIES = 2
+
+    def __init__(self, ir: List, cpu: str = "generic", singles: set = frozenset()):
+        self.ir = ir
+        self.table = IRSchedulerX64.LATENCY_TABLES[cpu]
+        self.scheduler = IRSchedulerX64(ir, cpu)
+        self.singles = singles
+        self.constants = {
+            stmt.Left
+            for stmt in ir
+            if type(stmt).__name__ == "Assignment"
+            and type(stmt.Right).__name__ == "Constant"
+        }
+        self.uses = {}
+        for stmt in ir:
+            for operand in self.scheduler.operands(stmt):
+                self.uses.setdefault(operand, []).append(stmt)
+
+        # The pack of each statement, by the variable the statement defines
+        self.packs = {}
+        # High lane results that are read outside of packs
+        self.extracted = set()
+        self.stats = {"packs": 0, "gathers": 0, "extracts": 0}
+        # Blocks left unvectorized for their register pressure
+        self.fallbacks = 0
+
+    def packable(self, stmt) -> bool:
+        return (
+            type(stmt).__name__ == "Assignment"
+            and type(stmt.Right).__name__ == "BinOp"
+            and stmt.Right.Op in self.PACKED_OPS
+            and not IRGrammar.versioned_variable_as_str(stmt.Left) in self.singles
+        )
+
+    def producer(self, low, high):
+        """The pack whose lanes hold `low` and `high`, in this order"""
+        pack = self.packs.get(low)
+        if pack is not None and pack[0].Left == low and pack[1].Left == high:
+            return pack
+        return None
+
+    def gathered(self, pack) -> list:
+        """The operand pairs of `pack` that are shuffled into the lanes"""
+        low, high = pack
+        return [
+            (low_operand, high_operand)
+            for low_operand, high_operand in (
+                (low.Right.Left, high.Right.Left),
+                (low.Right.Right, high.Right.Right),
+            )
+            if self.producer(low_operand, high_operand) is None
+            and not (low_operand in self.constants and high_operand in self.constants)
+        ]
+
+    def gathered_in_place(self, pack, low_operand) -> bool:
+        """Whether the high lane is shuffled into the register of
+        `low_operand`, which is only read by `pack`"""
+        return not low_operand in self.constants and all(
+            stmt is pack[0] or stmt is pack[1] for stmt in self.uses.get(low_operand, [])
+        )
+
+    def is_extracted(self, pack) -> bool:
+        """Whether the high lane result of `pack` is read outside of a
+        matching lane of another pack"""
+        low, high = pack
+        for stmt in self.uses.get(high.Left, []):
+            user = self.packs.get(stmt.Left) if type(stmt).__name__ == "Assignment" else None
+            if user is None or user[1] is not stmt:
+                return True
+            if any(
+                high_operand == high.Left and low_operand != low.Left
+                for low_operand, high_operand in (
+                    (user[0].Right.Left, stmt.Right.Left),
+                    (user[0].Right.Right, stmt.Right.Right),
+                )
+            ):
+                return True
+        return False
+
+    def profit(self, group: list) -> float:
+        """Cycles of throughput saved by `group`, the packs are registered.
+        Shuffles copy the register they shuffle first, unless a gather may
+        overwrite the register of its low lane."""
+        _, shuffle = self.table["shuffle"]
+        _, copy = self.table["copy"]
+        saved = sum(self.table[low.Right.Op][1] for low, _ in group)
+        for pack in group:
+            for low_operand, _ in self.gathered(pack):
+                saved -= shuffle
+                if not self.gathered_in_place(pack, low_operand):
+                    saved -= copy
+            if self.is_extracted(pack):
+                saved -= shuffle + copy
+        return saved
+
+    def register(self, group: list):
+        for pack in group:
+            self.packs[pack[0].Left] = pack
+            self.packs[pack[1].Left] = pack
+
+    def unregister(self, group: list):
+        for low, high in group:
+            del self.packs[low.Left]
+            del self.packs[high.Left]
+
+    def order(self, body: List, preds: list) -> List | None:
+        """`body` with the statements of every pack adjacent, statements are
+        kept in their scheduled order where the dependencies allow it. None if
+        the packs depend on each other in a cycle."""
+        position = {stmt.Left: stmt_idx for stmt_idx, stmt in enumerate(body)}
+        nodes = []
+        for stmt in body:
+            pack = self.packs.get(stmt.Left)
+            if pack is None:
+                nodes.append((stmt,))
+            elif pack[0] is stmt:
+                nodes.append(pack)
+        node_preds = []
+        for node in nodes:
+            members = {position[stmt.Left] for stmt in node}
+            node_preds.append(
+                {body[pred].Left for stmt in node for pred in preds[position[stmt.Left]]}
+                - {body[member].Left for member in members}
+            )
+
+        ordered = []
+        placed = set()
+        remaining = list(range(len(nodes)))
+        while remaining:
+            ready = next(
+                (node_idx for node_idx in remaining if node_preds[node_idx] <= placed), None
+            )
+            if ready is None:
+                return None
+            remaining.remove(ready)
+            ordered += nodes[ready]
+            placed.update(stmt.Left for stmt in nodes[ready])
+        return ordered
+
+    def vectorize_block(self, body: List) -> List:
+        defined_by = {stmt.Left: stmt_idx for stmt_idx, stmt in enumerate(body)}
+        preds = [
+            {defined_by[operand] for operand in self.scheduler.operands(stmt) if operand in defined_by}
+            for stmt in body
+        ]
+        users = [[] for _ in body]
+        for stmt_idx, stmt_preds in enumerate(preds):
+            for pred in stmt_preds:
+                users[pred].append(stmt_idx)
+
+        # Statements that transitively read each statement, as bit sets
+        descendants = [0] * len(body)
+        for stmt_idx in reversed(range(len(body))):
+            for user in users[stmt_idx]:
+                descendants[stmt_idx] |= (1 << user) | descendants[user]
+
+        def independent(a: int, b: int) -> bool:
+            return (
+                a != b
+                and self.packable(body[a])
+                and self.packable(body[b])
+                and body[a].Right.Op == body[b].Right.Op
+                and not body[a].Left in self.packs
+                and not body[b].Left in self.packs
+                and not descendants[a] >> b & 1
+                and not descendants[b] >> a & 1
+            )
+
+        def grow(seed: tuple) -> list:
+            group = [(body[seed[0]], body[seed[1]])]
+            self.register(group)
+            work = [seed]
+            while work:
+                low, high = work.pop()
+                candidates = []
+                for operand in ("Left", "Right"):
+                    candidates.append(
+                        (
+                            defined_by.get(getattr(body[low].Right, operand)),
+                            defined_by.get(getattr(body[high].Right, operand)),
+                        )
+                    )
+                    for low_user in users[low]:
+                        for high_user in users[high]:
+                            if (
+                                self.packable(body[low_user])
+                                and self.packable(body[high_user])
+                                and getattr(body[low_user].Right, operand) == body[low].Left
+                                and getattr(body[high_user].Right, operand) == body[high].Left
+                            ):
+                                candidates.append((low_user, high_user))
+                for pair in candidates:
+                    if None in pair or not independent(*pair):
+                        continue
+                    pack = (body[pair[0]], body[pair[1]])
+                    group.append(pack)
+                    self.register([pack])
+                    work.append(pair)
+            return group
+
+        # Seeds are tried by the cycles they save, divisions first
+        seeds = sorted(
+            (stmt_idx for stmt_idx, stmt in enumerate(body) if self.packable(stmt)),
+            key=lambda stmt_idx: (-self.table[body[stmt_idx].Right.Op][1], stmt_idx),
+        )
+        for low in seeds:
+            best, best_profit = None, 0.0
+            for high in range(low + 1, len(body)):
+                if not independent(low, high):
+                    continue
+                group = grow((low, high))
+                profit = self.profit(group)
+                if profit > best_profit and self.order(body, preds) is not None:
+                    best, best_profit = group, profit
+                self.unregister(group)
+            if best is not None:
+                self.register(best)
+
+        return self.order(body, preds)
+
+    def vectorize(self) -> List:
+        """Return the IR with the statements of each pack adjacent"""
+        blocks = list(self.scheduler.blocks())
+        block_irs = [
+            head + body + ([terminator] if terminator else [])
+            for head, body, terminator in blocks
+        ]
+        new_ir = []
+        for block_idx, (head, body, terminator) in enumerate(blocks):
+            packed = set(self.packs)
+            vectorized = self.vectorize_block(body)
+            group = {
+                pack[0].Left: pack for var, pack in self.packs.items() if not var in packed
+            }
+            if group:
+                # The assembler has no spill support, the packs of a block
+                # that would run out of registers are dropped
+                tail = [stmt for block_ir in block_irs[block_idx + 1 :] for stmt in block_ir]
+                block_ir = head + vectorized + ([terminator] if terminator else [])
+                pressure = self.scheduler.register_pressure(
+                    new_ir + block_ir + tail, len(new_ir), len(new_ir) + len(block_ir)
+                )
+                if pressure + self.PACK_TEMPORARIES > IRSchedulerX64.REGISTERS:
+                    self.unregister(group.values())
+                    vectorized = body
+                    self.fallbacks += 1
+
+            new_ir += head
+            new_ir += vectorized
+            if terminator is not None:
+                new_ir.append(terminator)
+
+        packs = {pack[0].Left: pack for pack in self.packs.values()}.values()
+        for pack in packs:
+            self.stats["packs"] += 1
+            self.stats["gathers"] += len(self.gathered(pack))
+            if self.is_extracted(pack):
+                self.extracted.add(pack[1].Left)
+                self.stats["extracts"] += 1
+        return new_ir
@@ -0,0 +1,173 @@
+"""Tiered compilation of decorated functions.
+
+Compiling at decoration runs `as` and `ld` for every kernel of a module on
+import, even for kernels that are rarely called. A tiered function starts out
+running the original python function and counts its calls. Once the count
+reaches the threshold the function is queued for compilation on a background
+thread, calls keep running the python function until the native code is ready
+and the entry point is swapped to it.
+
+Tiered functions are pickled like dispatchers, by the module and qualified
+name of the python function and with the compiled function once there is one.
+"""
+
+from pycc.dispatch import function_reference, resolve_function
+from pycc.py2ir import CompilerException
+from types import FunctionType
+from typing import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+"""Interpreted calls after which a tiered function is compiled, unless the
+decorator gives its own threshold"""
+DEFAULT_THRESHOLD = 1000
+
+__lock = threading.Lock()
+__executor = None
+"""Every live tiered function, for tiering_stats()"""
+tiered_functions = weakref.WeakSet()
+
+
+def set_default_threshold(threshold: int):
+    """Change the threshold of tiered functions decorated from now on"""
+    global DEFAULT_THRESHOLD
+    if threshold < 1:
+        raise ValueError("the tiering threshold must be at least 1")
+    DEFAULT_THRESHOLD = threshold
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """The single worker thread compiling hot functions. Compilation is
+    serialized by the compiler lock so more workers would not help."""
+    global __executor
+    with __lock:
+        if __executor is None:
+            __executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pycc-tiering"
+            )
+        return __executor
+
+
+def rebuild_tiered(
+    reference: tuple,
+    compile_function: Callable,
+    threshold: int,
+    calls: int,
+    compiled: Callable = None,
+) -> "PyObject_Tiered":
+    """Unpickle a tiered function, a compiled function is mapped without
+    compiling it again"""
+    tiered = PyObject_Tiered(resolve_function(*reference), compile_function, threshold)
+    tiered.calls = calls
+    if compiled is not None:
+        tiered.compiled = compiled
+        tiered.entry = compiled
+        tiered.state = "compiled"
+    return tiered
+
+
+class PyObject_Tiered:
+    """Callable returned by pycc.compile(tiered=True).
+
+    Calls go through `entry`, initially the counting interpreter tier. The
+    background compilation replaces `entry` by the compiled function with a
+    single attribute store, so concurrent callers see either tier but never a
+    partially initialized one. If compilation fails the function stays on the
+    python tier and the exception is kept in `error`.
+
+    state is one of "interpreted", "queued", "compiled" or "failed".
+    """
+
+    def __init__(self, func: FunctionType, compile_function: Callable, threshold: int = None):
+        if threshold is None:
+            threshold = DEFAULT_THRESHOLD
+        if threshold < 1:
+            raise ValueError("the tiering threshold must be at least 1")
+
+        self.py_func = func
+        self.name = func.__qualname__
+        self.compile_function = compile_function
+        self.threshold = threshold
+        self.calls = 0
+        self.state = "interpreted"
+        self.compiled = None
+        self.error = None
+        self.future = None
+        self.lock = threading.Lock()
+        self.entry = self.interpret
+        tiered_functions.add(self)
+
+    def __reduce__(self):
+        # A queued or failed compilation is not carried over, the rebuilt
+        # function is compiled once it reaches the threshold again
+        return (
+            rebuild_tiered,
+            (
+                function_reference(self.py_func),
+                self.compile_function,
+                self.threshold,
+                self.calls if self.state == "interpreted" else 0,
+                self.compiled,
+            ),
+        )
+
+    def __call__(self, *args):
+        return self.entry(*args)
+
+    def interpret(self, *args):
+        self.calls += 1
+        if self.calls >= self.threshold and self.state == "interpreted":
+            self.promote()
+        return self.py_func(*args)
+
+    def promote(self) -> Future:
+        """Queue this function for background compilation, regardless of its
+        call count. Returns the future of the compilation."""
+        with self.lock:
+            if self.future is None:
+                self.state = "queued"
+                self.future = get_executor().submit(self.compile)
+            return self.future
+
+    def compile(self):
+        try:
+            compiled = self.compile_function(self.py_func)
+        except (Exception, CompilerException) as error:
+            # CompilerException derives from BaseException
+            logger.warning("pycc: unable to compile %s, staying interpreted", self.name, exc_info=True)
+            self.error = error
+            self.state = "failed"
+            return None
+
+        self.compiled = compiled
+        self.entry = compiled
+        self.state = "compiled"
+        return compiled
+
+    def wait(self, timeout: float = None):
+        """Block until the queued compilation finished, returns the compiled
+        function or None if the function is not queued or failed to compile"""
+        if self.future is None:
+            return None
+        return self.future.result(timeout)
+
+
+def tiering_stats() -> list:
+    """Call counts, thresholds and states of the live tiered functions"""
+    return sorted(
+        (
+            {
+                "name": function.name,
+                "calls": function.calls,
+                "threshold": function.threshold,
+                "state": function.state,
+            }
+            for function in list(tiered_functions)
+        ),
+        key=lambda stat: (-stat["calls"], stat["name"]),
+    )
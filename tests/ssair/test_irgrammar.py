@@ -1,4 +1,5 @@
 from pycc.ssair import irgrammar
+from pycc.ssair.irparser import IRParser
 from pyparsing.exceptions import ParseException
 import pytest
 
@@ -25,3 +26,81 @@ def test_double():
 
     with pytest.raises(ParseException):
         irgrammar.IRGrammar().double.parse_string("sdfaq")
+
+
+def test_conditional_round_trip():
+    source = "\n".join(
+        [
+            "x#0\t:=\t%xmm0",
+            "y#0\t:=\t%xmm1",
+            "c#0\t:=\tx#0 < y#0",
+            "br c#0 then lse",
+            "label then",
+            "goto join",
+            "label lse",
+            "goto join",
+            "label join",
+            "z#0\t:=\tphi x#0 y#0",
+            "m#0\t:=\tselect c#0 x#0 z#0",
+            "ret m#0",
+        ]
+    )
+    ir = list(IRParser.parse(source))
+    assert [type(stmt).__name__ for stmt in ir[3:9]] == [
+        "Branch",
+        "Label",
+        "Goto",
+        "Label",
+        "Goto",
+        "Label",
+    ]
+    assert IRParser.unparse(ir) == source
+
+
+def test_return_values_round_trip():
+    source = "\n".join(
+        ["x#0\t:=\t%xmm0", "z#0\t:=\tstack 1", "y#0\t:=\tx#0 * z#0", "ret (y#0, x#0)"]
+    )
+    ir = list(IRParser.parse(source))
+    assert type(ir[-1]).__name__ == "ReturnValues"
+    assert [value.Name for value in ir[-1].Values] == ["y", "x"]
+    assert IRParser.unparse(ir) == source
+
+
+def test_convert_round_trip():
+    source = "\n".join(
+        [
+            "s#0\t:=\tconvert single %xmm0",
+            "t#0\t:=\tconvert single stack 0",
+            "x#0\t:=\tconvert double s#0",
+            "y#0\t:=\tx#0 * x#0",
+            "r#0\t:=\tconvert single y#0",
+            "ret r#0",
+        ]
+    )
+    ir = list(IRParser.parse(source))
+    assert [stmt.Right.Type for stmt in ir[:-1] if type(stmt.Right).__name__ == "Convert"] == [
+        "single",
+        "single",
+        "double",
+        "single",
+    ]
+    assert type(ir[1].Right.Value).__name__ == "StackArgument"
+    assert IRParser.unparse(ir) == source
+
+
+def test_front_end_names_round_trip():
+    source = "\n".join(
+        [
+            "x#0\t:=\t%xmm0",
+            "__PYCC_INTERNAL__C1#0\t:=\t-inf",
+            "__PYCC_INTERNAL__C2#0\t:=\tnan",
+            "x_2#0\t:=\tx#0 * __PYCC_INTERNAL__C1#0",
+            "ret x_2#0",
+        ]
+    )
+    ir = list(IRParser.parse(source))
+    assert ir[1].Left.Name == "__PYCC_INTERNAL__C1"
+    assert ir[1].Right.Value == float("-inf")
+    assert ir[2].Right.Value != ir[2].Right.Value
+    assert IRParser.unparse(ir) == source
@@ -0,0 +1,428 @@
+from pycc.py2ir import Py2IR
+from pycc.ssair.iroptimizer import IROptimizer
+from pycc.ssair.irparser import IRParser
+import ast
+import math
+import textwrap
+
+
+def optimize(source: str, fast_math: bool = False) -> IROptimizer:
+    ir = Py2IR("<test>").visit(ast.parse(textwrap.dedent(source)))
+    return IROptimizer(ir, fast_math=fast_math)
+
+
+def count_binops(ir, op: str):
+    return sum(
+        1
+        for stmt in ir
+        if type(stmt).__name__ == "Assignment"
+        and type(stmt.Right).__name__ == "BinOp"
+        and stmt.Right.Op == op
+    )
+
+
+def test_value_numbering_removes_repeated_binops():
+    optimizer = optimize(
+        """
+        def slope(x1: float, x2: float, y1: float, y2: float) -> float:
+            return (y2 - y1) / (x2 - x1) + (y2 - y1) * (x2 - x1)
+        """
+    )
+    assert count_binops(optimizer.ir, "-") == 2
+    assert optimizer.stats["value_numbering_eliminated"] == 2
+
+
+def test_value_numbering_commutative_operands():
+    optimizer = optimize(
+        """
+        def f(m: float, x: float) -> float:
+            return m * x + x * m
+        """
+    )
+    assert count_binops(optimizer.ir, "*") == 1
+
+
+def test_value_numbering_keeps_non_commutative_operands():
+    optimizer = optimize(
+        """
+        def f(a: float, b: float) -> float:
+            return (a - b) * (b - a)
+        """
+    )
+    assert count_binops(optimizer.ir, "-") == 2
+
+
+def test_value_numbering_constants():
+    optimizer = optimize(
+        """
+        def f(x: float) -> float:
+            return 2.0 * x + 2.0
+        """
+    )
+    constants = [
+        stmt.Right.Value
+        for stmt in optimizer.ir
+        if type(stmt).__name__ == "Assignment"
+        and type(stmt.Right).__name__ == "Constant"
+    ]
+    assert constants.count(2.0) == 1
+    assert IRParser.unparse(optimizer.ir)
+    assert optimizer.stats["value_numbering_eliminated"] == 1
+
+
+def test_value_numbering_counts_copies_apart():
+    optimizer = optimize(
+        """
+        def f(x: float) -> float:
+            y = x
+            z = y
+            return z * z
+        """
+    )
+    assert optimizer.stats["value_numbering_eliminated"] == 0
+
+
+def test_constant_propagation_folds_chains():
+    optimizer = optimize(
+        """
+        def f(x: float) -> float:
+            a = 1.0 - 0.0
+            b = a * 4.0 + 2.0
+            return b / x
+        """
+    )
+    assert count_binops(optimizer.ir, "-") == 0
+    assert count_binops(optimizer.ir, "*") == 0
+    assert count_binops(optimizer.ir, "+") == 0
+    assert count_binops(optimizer.ir, "/") == 1
+    assert optimizer.stats["constants_folded"] == 3
+
+
+def test_constant_propagation_ieee_division():
+    evaluate = IROptimizer.evaluate_binop
+    assert evaluate(1.0, "/", 0.0) == math.inf
+    assert evaluate(-1.0, "/", 0.0) == -math.inf
+    assert evaluate(1.0, "/", -0.0) == -math.inf
+    assert math.isnan(evaluate(0.0, "/", 0.0))
+    assert math.isnan(evaluate(math.nan, "/", 0.0))
+    assert math.copysign(1.0, evaluate(-0.0, "*", 1.0)) == -1.0
+
+
+def test_algebraic_identities():
+    optimizer = optimize(
+        """
+        def f(x: float) -> float:
+            return ((x * 1.0 + -0.0) - 0.0) / 1.0
+        """
+    )
+    assert "BinOp" not in [type(stmt.Right).__name__ for stmt in optimizer.ir[:-1]]
+    assert optimizer.stats["algebraic_simplified"] == 4
+
+
+def test_algebraic_identities_are_ieee_safe():
+    # x + 0.0 is -0.0 + 0.0 = 0.0 for x = -0.0 and x * 0.0 is nan for x = inf
+    optimizer = optimize(
+        """
+        def f(x: float) -> float:
+            return (x + 0.0) * 0.0
+        """
+    )
+    assert count_binops(optimizer.ir, "+") == 1
+    assert count_binops(optimizer.ir, "*") == 1
+    assert optimizer.stats["algebraic_simplified"] == 0
+
+
+def test_division_by_power_of_two():
+    optimizer = optimize(
+        """
+        def f(x: float, y: float) -> float:
+            return x / 4.0 + y / 4.0 + x / 3.0
+        """
+    )
+    assert count_binops(optimizer.ir, "/") == 1
+    assert count_binops(optimizer.ir, "*") == 2
+    assert IROptimizer.exact_reciprocal(2.0**-1074) is None
+    assert IROptimizer.exact_reciprocal(2.0**-1022) == 2.0**1022
+
+
+def count_statements(ir, kind: str):
+    return sum(
+        1
+        for stmt in ir
+        if type(stmt).__name__ == kind
+        or (type(stmt).__name__ == "Assignment" and type(stmt.Right).__name__ == kind)
+    )
+
+
+def test_if_conversion_of_small_conditionals():
+    optimizer = optimize(
+        """
+        def f(x: float, lo: float) -> float:
+            if x < lo:
+                x = lo * 2.0
+            return x
+        """
+    )
+    assert optimizer.stats["if_converted"] == 1
+    assert count_statements(optimizer.ir, "Select") == 1
+    assert count_statements(optimizer.ir, "Branch") == 0
+    assert count_statements(optimizer.ir, "Label") == 0
+
+
+def test_if_conversion_keeps_expensive_arms():
+    optimizer = optimize(
+        """
+        def f(x: float, y: float) -> float:
+            if x < y:
+                x = x / y / y / y
+            return x
+        """
+    )
+    assert optimizer.stats["if_converted"] == 0
+    assert count_statements(optimizer.ir, "Branch") == 1
+    assert count_statements(optimizer.ir, "Phi") == 1
+
+
+def test_nested_conditionals_are_converted_inside_out():
+    optimizer = optimize(
+        """
+        def f(x: float, lo: float, hi: float) -> float:
+            return lo if x < lo else (hi if x > hi else x)
+        """
+    )
+    assert optimizer.stats["if_converted"] == 2
+    assert count_statements(optimizer.ir, "Select") == 2
+
+
+def test_constant_propagation_meets_phis():
+    optimizer = optimize(
+        """
+        def f(x: float, y: float) -> float:
+            if x < y:
+                a = 2.0
+                x = x / y / y / y
+            else:
+                a = 1.0 + 1.0
+            return a * x
+        """
+    )
+    # Both arms assign 2.0, only the phi of x remains
+    assert optimizer.stats["if_converted"] == 0
+    assert count_statements(optimizer.ir, "Phi") == 1
+    definitions = optimizer.definitions()
+    product = next(
+        value
+        for value in definitions.values()
+        if type(value).__name__ == "BinOp" and value.Op == "*"
+    )
+    assert type(definitions[product.Left]).__name__ == "Constant"
+    assert definitions[product.Left].Value == 2.0
+
+
+def test_constant_conditions_remove_branches():
+    optimizer = optimize(
+        """
+        def f(x: float, y: float) -> float:
+            if 1.0 < 2.0:
+                x = x / y / y / y
+            else:
+                x = x * y
+            nan = 0.0 / 0.0
+            if nan == nan:
+                x = x - y
+            return x
+        """
+    )
+    assert optimizer.stats["branches_folded"] == 2
+    assert count_statements(optimizer.ir, "Branch") == 0
+    assert count_statements(optimizer.ir, "Label") == 0
+    assert count_statements(optimizer.ir, "Phi") == 0
+    assert count_statements(optimizer.ir, "Compare") == 0
+    # Only the taken arms are left, comparisons with a nan are false
+    assert count_binops(optimizer.ir, "/") == 3
+    assert count_binops(optimizer.ir, "*") == 0
+    assert count_binops(optimizer.ir, "-") == 0
+
+
+def test_constant_conditions_fold_selects():
+    ir = IRParser.parse(
+        """
+        x#0 := %xmm0
+        a#0 := 1.0
+        b#0 := 2.0
+        c#0 := a#0 >= b#0
+        d#0 := a#0 != b#0
+        e#0 := c#0 | d#0
+        y#0 := x#0 + x#0
+        m#0 := select e#0 y#0 x#0
+        ret m#0
+        """
+    )
+    optimizer = IROptimizer(list(ir))
+    assert count_statements(optimizer.ir, "Select") == 0
+    assert count_statements(optimizer.ir, "Compare") == 0
+    assert count_binops(optimizer.ir, "+") == 1
+    assert IROptimizer.evaluate_compare(math.nan, "!=", math.nan)
+    assert not IROptimizer.evaluate_compare(math.nan, "<=", 1.0)
+
+
+def depth(ir, var) -> int:
+    """Length of the longest chain of binops computing `var`"""
+    definitions = {stmt.Left: stmt.Right for stmt in ir if type(stmt).__name__ == "Assignment"}
+    value = definitions.get(var)
+    if type(value).__name__ == "BinOp":
+        return 1 + max(depth(ir, value.Left), depth(ir, value.Right))
+    if type(value).__name__ == "VersionedVariable":
+        return depth(ir, value)
+    return 0
+
+
+def returned(ir):
+    return next(stmt.VersionedVariable for stmt in ir if type(stmt).__name__ == "Return")
+
+
+SUM8 = """
+def f(a: float, b: float, c: float, d: float, e: float, g: float, h: float, k: float) -> float:
+    return a + b + c + d + e + g + h + k
+"""
+
+
+def test_fast_math_balances_sums():
+    strict = optimize(SUM8)
+    assert depth(strict.ir, returned(strict.ir)) == 7
+    assert not "reassociated" in strict.stats
+
+    fast = optimize(SUM8, fast_math=True)
+    assert fast.stats["reassociated"] == 1
+    assert count_binops(fast.ir, "+") == 7
+    assert depth(fast.ir, returned(fast.ir)) == 3
+
+
+def test_fast_math_folds_constants_of_chains():
+    optimizer = optimize(
+        """
+        def f(x: float, y: float) -> float:
+            return 2.0 * x * 3.0 * y
+        """,
+        fast_math=True,
+    )
+    assert count_binops(optimizer.ir, "*") == 2
+    assert 6.0 in [
+        stmt.Right.Value
+        for stmt in optimizer.ir
+        if type(stmt).__name__ == "Assignment" and type(stmt.Right).__name__ == "Constant"
+    ]
+
+
+def test_fast_math_estrin_polynomials():
+    source = """
+    def f(x: float, c0: float, c1: float, c2: float, c3: float, c4: float, c5: float, c6: float, c7: float) -> float:
+        return c0 + x * (c1 + x * (c2 + x * (c3 + x * (c4 + x * (c5 + x * (c6 + x * c7))))))
+    """
+    strict = optimize(source)
+    assert depth(strict.ir, returned(strict.ir)) == 14
+
+    fast = optimize(source, fast_math=True)
+    assert fast.stats["polynomials"] == 1
+    assert depth(fast.ir, returned(fast.ir)) == 6
+    assert count_binops(fast.ir, "+") == 7
+
+    # Evaluate the Estrin form with the same operations in python
+    values = dict(zip("x c0 c1 c2 c3 c4 c5 c6 c7".split(), [0.5] + [float(k) for k in range(8)]))
+    env = {}
+    for stmt in fast.ir:
+        if type(stmt).__name__ != "Assignment":
+            continue
+        match type(stmt.Right).__name__:
+            case "XmmRegister" | "StackArgument":
+                env[stmt.Left] = values[stmt.Left.Name]
+            case "VersionedVariable":
+                env[stmt.Left] = env[stmt.Right]
+            case "BinOp":
+                env[stmt.Left] = IROptimizer.evaluate_binop(
+                    env[stmt.Right.Left], stmt.Right.Op, env[stmt.Right.Right]
+                )
+    assert math.isclose(env[returned(fast.ir)], sum(k * 0.5**k for k in range(8)))
+
+
+def test_fast_math_reciprocals():
+    source = """
+    def f(x: float, y: float, d: float) -> float:
+        return x / d + y / d + x / 3.0
+    """
+    strict = optimize(source)
+    assert count_binops(strict.ir, "/") == 3
+
+    fast = optimize(source, fast_math=True)
+    assert fast.stats["reciprocals"] == 3
+    # A single division computes the reciprocal of d, the one of 3.0 is folded
+    assert count_binops(fast.ir, "/") == 1
+    assert count_binops(fast.ir, "*") == 3
+
+
+def test_addition_chains():
+    assert IROptimizer.addition_chain(1) == (1,)
+    assert IROptimizer.addition_chain(2) == (1, 2)
+    # The binary method takes 6 multiplications for 15
+    assert len(IROptimizer.addition_chain(15)) - 1 == 5
+    for n in range(2, IROptimizer.POWER_CHAIN_LIMIT + 1):
+        chain = IROptimizer.addition_chain(n)
+        assert chain[-1] == n
+        assert all(b - a in chain for a, b in zip(chain, chain[1:]))
+        assert len(chain) - 1 <= (n.bit_length() - 1) + (n.bit_count() - 1)
+
+
+POWERS = """
+def f(x: float, y: float) -> float:
+    return x ** 2 + x ** 3 + x ** -1 + x ** 0.5 + x ** 1.5 + y ** x
+"""
+
+
+def count_calls(ir, function: str):
+    return sum(
+        1
+        for stmt in ir
+        if type(stmt).__name__ == "Assignment"
+        and type(stmt.Right).__name__ == "Call"
+        and stmt.Right.Function == function
+    )
+
+
+def test_power_reduction():
+    strict = optimize(POWERS)
+    # x ** 3 would round twice, x ** 1.5 and y ** x are no integer powers
+    assert strict.stats["powers_reduced"] == 3
+    assert count_calls(strict.ir, "pow") == 3
+    assert count_calls(strict.ir, "sqrt") == 1
+    assert count_statements(strict.ir, "Select") == 1
+
+    fast = optimize(POWERS, fast_math=True)
+    assert fast.stats["powers_reduced"] == 4
+    assert count_calls(fast.ir, "pow") == 2
+    assert count_statements(fast.ir, "Select") == 0
+
+
+def test_single_precision_narrowing():
+    strict = optimize(
+        """
+        def f(x: c_float, y: c_float) -> c_float:
+            return x * y
+        """
+    )
+    assert strict.stats["narrowed"] == 1
+    # The arguments are not widened at all
+    assert count_statements(strict.ir, "Convert") == 2
+
+    source = """
+    def f(x: c_float, y: c_float) -> c_float:
+        return x * y + x * 0.5
+    """
+    # The products are rounded to doubles before the sum
+    strict = optimize(source)
+    assert strict.stats["narrowed"] == 0
+
+    fast = optimize(source, fast_math=True)
+    assert fast.stats["narrowed"] == 1
+    # The arguments and 0.5 are converted to single precision
+    assert count_statements(fast.ir, "Convert") == 3
+    assert count_binops(fast.ir, "*") == 2
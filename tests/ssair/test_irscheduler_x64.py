@@ -0,0 +1,103 @@
+from pycc.py2ir import Py2IR
+from pycc.ssair.iroptimizer import IROptimizer
+from pycc.ssair.irscheduler_x64 import IRSchedulerX64
+from pycc.ssair.irassembler_x64 import IRAssemblerX64
+import ast
+import textwrap
+import pytest
+
+
+def lower(source: str):
+    ir = Py2IR("<test>").visit(ast.parse(textwrap.dedent(source)))
+    return IROptimizer(ir).ir
+
+
+def binops(ir):
+    return [
+        stmt.Right.Op
+        for stmt in ir
+        if type(stmt).__name__ == "Assignment" and type(stmt.Right).__name__ == "BinOp"
+    ]
+
+
+def test_division_is_started_first():
+    ir = lower(
+        """
+        def f(a: float, b: float, c: float, d: float, e: float) -> float:
+            return c * d * e * c + a / b
+        """
+    )
+    assert binops(ir)[0] == "*"
+
+    scheduler = IRSchedulerX64(ir, "skylake")
+    scheduled = scheduler.schedule()
+    assert binops(scheduled)[0] == "/"
+    assert sorted(scheduled, key=str) == sorted(ir, key=str)
+    assert type(scheduled[-1]).__name__ == "Return"
+    assert scheduler.estimate_cycles(scheduled) < scheduler.estimate_cycles()
+
+
+@pytest.mark.parametrize("cpu", ["generic", "skylake", "haswell", "zen3"])
+def test_dependencies_are_respected(cpu):
+    ir = lower(
+        """
+        def f(low: float, high: float, z: float) -> float:
+            m = 1.0 / (high - low)
+            b = 0.0 - (m * low)
+            return m * z + b
+        """
+    )
+    scheduled = IRSchedulerX64(ir, cpu).schedule()
+    defined = set()
+    for stmt in scheduled:
+        if type(stmt).__name__ == "Assignment":
+            if type(stmt.Right).__name__ == "BinOp":
+                assert stmt.Right.Left in defined and stmt.Right.Right in defined
+            defined.add(stmt.Left)
+
+
+@pytest.mark.parametrize("vectorize", [False, True])
+def test_high_pressure_kernels_compile(vectorize):
+    # Both kernels run out of registers when their blocks are scheduled or
+    # vectorized without regard to the values the assembler keeps live
+    kernels = [
+        """
+        def f(a0: float, a1: float, a2: float, a3: float, a4: float, a5: float, a6: float, a7: float, a8: float, a9: float) -> float:
+            t0 = (((a8 / a8) - a5) * (a3 / (a6 + a0)))
+            t1 = ((a1 * -0.28) + ((a0 - a3) * t0))
+            t2 = (a6 + 2.33)
+            t3 = (((a1 / t1) * (a1 / t1)) / ((a2 + a5) * (a2 * a2)))
+            t4 = (((0.54 - -0.05) - (-1.52 - a7)) + (t3 / a6))
+            t5 = (((a2 / 0.15) - (2.4 + a2)) * ((a8 / a2) / (a2 + -2.86))) if a9 < a5 else (t2 / (a2 - a2))
+            t6 = a9 if t0 < t2 else ((a1 - (a0 + a2)) - ((t0 - a7) - (a9 * t5)))
+            t7 = t6
+            t8 = (t7 * t0)
+            if t3 < t4:
+                r = a7 / t2 / t8 / t0 / t5
+            else:
+                r = a7 * a2 * a1 * t5
+            return r + a5 + t5 + t1 + a6 + t4 + t0
+        """,
+        """
+        def f(a0: float, a1: float, a2: float, a3: float, a4: float, a5: float, a6: float, a7: float, a8: float, a9: float) -> float:
+            t0 = (((-1.78 * a2) / a2) / a4) if a3 < a6 else (((a7 * a3) - (a5 / a8)) + ((a0 / a0) + (a7 - a0)))
+            t1 = (a8 / t0) if a6 < a4 else (-0.71 / ((a7 - a1) + (a8 * t0)))
+            t2 = (a4 * a7)
+            t3 = (((a4 + t2) + (t1 * -2.03)) * ((a1 * t0) + (-0.85 + a0))) if a5 < a9 else ((a1 + (a5 + a4)) - a1)
+            t4 = (((a2 - a5) / (t1 + a5)) * ((a8 + a6) + (a7 + a6)))
+            t5 = (((a5 - a5) - (t2 + a0)) * ((a8 / t3) - (0.24 / a5)))
+            t6 = (((t5 * t3) - t4) * ((a1 / t2) + (a8 / t0)))
+            if t4 < a3:
+                r = t4 / t0 / a7 / a9 / t2
+            else:
+                r = t6 * a4 * a6 * t2
+            return r + t5 + a1 + a0 + a3 + t2 + a4
+        """,
+    ]
+    for kernel in kernels:
+        IRAssemblerX64(lower(kernel), vectorize=vectorize).assemble()
+
+
+def test_unknown_cpu():
+    with pytest.raises(ValueError):
+        IRSchedulerX64([], "pentium")
@@ -0,0 +1,102 @@
+from pycc.py2ir import Py2IR
+from pycc.ssair.iroptimizer import IROptimizer
+from pycc.ssair.irassembler_x64 import IRAssemblerX64
+from pycc.ssair.irvectorizer_x64 import IRVectorizerX64
+import ast
+import textwrap
+import pytest
+
+
+def lower(source: str):
+    ir = Py2IR("<test>").visit(ast.parse(textwrap.dedent(source)))
+    return IROptimizer(ir).ir
+
+
+def assembled(source: str, **kwargs) -> IRAssemblerX64:
+    ir_assembler = IRAssemblerX64(lower(source), **kwargs)
+    ir_assembler.assemble()
+    return ir_assembler
+
+
+def mnemonics(ir_assembler: IRAssemblerX64) -> list:
+    return [instruction[0] for instruction in ir_assembler.asmx64.instrs]
+
+
+WIDE = """
+def f(a: float, b: float, c: float, d: float) -> float:
+    return (a * 1.5 + 2.0) / (b * 0.5 + 1.0) + (c * 2.5 + 3.0) / (d * 1.5 + 2.0)
+"""
+
+
+def test_chains_stay_in_the_lanes():
+    ir_assembler = assembled(WIDE)
+    assert ir_assembler.vectorizer.stats == {"packs": 5, "gathers": 2, "extracts": 1}
+
+    # The constants are loaded as pairs, only the arguments are shuffled in
+    # and the second quotient out
+    instructions = mnemonics(ir_assembler)
+    assert instructions.count("mulpd") == 2
+    assert instructions.count("addpd") == 2
+    assert instructions.count("divpd") == 1
+    assert instructions.count("unpcklpd") == 2
+    assert instructions.count("unpckhpd") == 1
+    assert not any(mnemonic.endswith("sd") and mnemonic != "addsd" for mnemonic in instructions)
+    assert len(ir_assembler.asmx64.double_pair_consts) == 4
+
+    # The statements of every pack are adjacent
+    ir = ir_assembler.ir
+    for low, high in ir_assembler.vectorizer.packs.values():
+        assert ir.index(high) == ir.index(low) + 1
+
+
+def test_divisions_are_packed():
+    ir_assembler = assembled(
+        """
+        def f(x1: float, x2: float, y1: float, y2: float, z1: float, z2: float) -> float:
+            return (y2 - y1) / (x2 - x1) + (z2 - z1) / (x2 - x1)
+        """
+    )
+    instructions = mnemonics(ir_assembler)
+    assert "divpd" in instructions and not "divsd" in instructions
+    assert "subpd" in instructions
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        # The shuffles cost more than the two multiplications save
+        """
+        def f(m1: float, v1: float, m2: float, v2: float) -> float:
+            return 0.5 * m1 * v1 * v1 + 0.5 * m2 * v2 * v2
+        """,
+        # Dependent operations are never packed
+        """
+        def f(x: float) -> float:
+            return ((x / 3.0) / 5.0) / 7.0
+        """,
+    ],
+)
+def test_unprofitable_packs(source):
+    ir_assembler = assembled(source)
+    assert ir_assembler.vectorizer.stats["packs"] == 0
+    assert not any(mnemonic.endswith("pd") for mnemonic in mnemonics(ir_assembler))
+
+
+def test_cost_model_follows_the_cpu():
+    # Additions only pay for their shuffles where shuffles are cheap
+    source = """
+    def f(a: float, b: float, c: float, d: float) -> tuple[float, float]:
+        return (a + 1.0) * 2.0 + 3.0, (c + 4.0) * 5.0 + 6.0
+    """
+    ir = lower(source)
+    skylake, zen3 = IRVectorizerX64(ir, "skylake"), IRVectorizerX64(ir, "zen3")
+    skylake.vectorize()
+    zen3.vectorize()
+    assert skylake.stats["packs"] == 0
+    assert zen3.stats["packs"] == 3
+
+
+def test_vectorize_disabled():
+    ir_assembler = assembled(WIDE, vectorize=False)
+    assert not ir_assembler.vectorizer.packs
+    assert "divpd" not in mnemonics(ir_assembler)
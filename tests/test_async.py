@@ -0,0 +1,149 @@
+from pycc import pycc
+from pycc import execmem
+from pycc.dispatch import PyObject_Dispatcher
+from pathlib import Path
+import asyncio
+import inspect
+import textwrap
+import threading
+import time
+import pytest
+
+
+def async_lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+
+def async_cube(x: float) -> float:
+    return x * x * x
+
+
+def async_square(x: float) -> float:
+    return x * x
+
+
+def async_polymorphic(x, y):
+    return x * y
+
+
+def test_compile_async():
+    compiled = asyncio.run(pycc.compile_async(async_lerp))
+    assert isinstance(compiled, execmem.PyObject_ExecMem)
+    assert compiled(0.0, 2.0, 0.25) == 0.5
+    assert compiled.py_func is async_lerp
+    assert pycc.func_map[f"{__name__}.async_lerp"] is compiled
+
+    dispatcher = asyncio.run(pycc.compile_async(async_polymorphic))
+    assert isinstance(dispatcher, PyObject_Dispatcher)
+    assert dispatcher(2.0, 3.0) == 6.0
+
+
+def test_event_loop_keeps_running():
+    async def main():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticking = asyncio.create_task(ticker())
+        compiled = await asyncio.gather(
+            pycc.compile_async(async_cube),
+            pycc.compile_async(async_square, semaphore=asyncio.Semaphore(1)),
+            pycc.compile_async(async_cube, fast_math=True),
+        )
+        done.set()
+        await ticking
+        return ticks, compiled
+
+    ticks, (cube, square, fast_cube) = asyncio.run(main())
+    assert cube(2.0) == 8.0 and square(3.0) == 9.0 and fast_cube(2.0) == 8.0
+    # The loop ran between the stages of the compilations
+    assert ticks > 3
+
+
+def test_event_loop_does_not_wait_for_the_compiler():
+    # Another thread compiling holds the compiler lock
+    compile_lock = vars(pycc)["__compile_lock"]
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with compile_lock:
+            held.set()
+            release.wait(timeout=2.0)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+
+    async def main():
+        start = time.monotonic()
+        task = asyncio.create_task(pycc.compile_async(async_lerp, fast_math=True))
+        await asyncio.sleep(0.05)
+        elapsed = time.monotonic() - start
+        release.set()
+        return elapsed, await task
+
+    try:
+        elapsed, compiled = asyncio.run(main())
+    finally:
+        release.set()
+        holder.join()
+    assert elapsed < 1.0
+    assert compiled(0.0, 2.0, 0.25) == 0.5
+
+
+def test_cancellation():
+    async def main():
+        task = asyncio.create_task(pycc.compile_async(async_square, fast_math=True))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    key = f"{__name__}.async_square[fast_math]"
+    pycc.func_map.pop(key, None)
+    asyncio.run(main())
+    assert key not in pycc.func_map
+
+
+def test_compile_concurrency():
+    with pytest.raises(ValueError):
+        pycc.set_compile_concurrency(0)
+
+
+def async_shared(x: float, y: float) -> float:
+    return x * y - x
+
+
+def test_artifacts_are_shared_by_sync_and_async_builds():
+    # Two event loops and synchronous builds compile the same function at
+    # once, each assembles privately and then replaces the shared artifacts
+    results = []
+
+    def compile_in_loop():
+        compiled = asyncio.run(pycc.compile_async(async_shared))
+        results.append(compiled(3.0, 2.0))
+
+    def compile_sync():
+        results.append(pycc.compile(async_shared)(3.0, 2.0))
+
+    threads = [
+        threading.Thread(target=target)
+        for target in (compile_in_loop, compile_sync, compile_in_loop, compile_sync)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [3.0] * 4
+
+    artifacts = Path(inspect.getfile(async_shared)).parent / "__pycache__"
+    base_name = artifacts / "test_async-async_shared-async_shared"
+    code = base_name.with_suffix(".bin").read_bytes()
+    source = textwrap.dedent(inspect.getsource(async_shared))
+    assert code == pycc.build(source, inspect.getfile(async_shared), "async_shared")[0]
+    assert not list(artifacts.glob(".test_async-async_shared-*"))
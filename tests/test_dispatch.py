@@ -0,0 +1,45 @@
+from pycc import pycc
+from pycc.dispatch import PyObject_Dispatcher
+import ctypes
+import pytest
+
+
+@pycc.compile
+def poly_scale(x, y: float | int) -> float:
+    return x * y + 1.0
+
+
+def test_specializes_per_signature():
+    assert isinstance(poly_scale, PyObject_Dispatcher)
+    assert poly_scale(2.0, 3.0) == 7.0
+    assert poly_scale(2, 3.0) == 7.0
+    assert poly_scale(ctypes.c_double(2.0), 3) == 7.0
+
+    # int and float arguments are both passed as doubles and so share the
+    # compiled code
+    assert len(poly_scale.specializations) == 1
+    assert len(poly_scale.dispatch) == 3
+
+
+def test_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        poly_scale("a", 1.0)
+
+
+def test_specialization_cap_falls_back_to_python():
+    def unannotated(x):
+        return x * 2.0
+
+    dispatcher = pycc.compile(unannotated)
+    dispatcher.max_specializations = 0
+    assert dispatcher(2.0) == 4.0
+    assert dispatcher.fallback_calls == 1
+    assert dispatcher.specializations == {}
+
+
+def test_unannotated_tuple_return():
+    @pycc.compile
+    def poly_divmod(x, y):
+        return x / y, x - y
+
+    assert poly_divmod(3.0, 2) == (1.5, 1.0)
@@ -0,0 +1,185 @@
+from pycc import pycc
+from pycc import execmem
+import ctypes
+import gc
+import pickle
+import threading
+import pytest
+
+
+@pycc.compile
+def return_add(x: float, y: float) -> float:
+    return x + y
+
+
+@pycc.compile
+def return_sub(x: float, y: float) -> float:
+    return x - y
+
+
+@pycc.compile
+def return_div(x: float, y: float) -> float:
+    return x / y
+
+
+def test_unload_and_reload():
+    before = pycc.memory_stats()
+    assert return_add.loaded
+
+    return_add.unload()
+    assert not return_add.loaded
+    after = pycc.memory_stats()
+    assert after["unloads"] == before["unloads"] + 1
+    assert after["resident_bytes"] == before["resident_bytes"] - return_add.size.value
+
+    # The retained machine code is mapped again on the next call
+    assert return_add(1.0, 2.0) == 3.0
+    assert return_add.loaded
+
+
+def test_memory_budget_evicts_least_recently_used():
+    page = return_add.size.value
+    before = pycc.memory_stats()
+    try:
+        pycc.set_memory_budget(before["resident_bytes"] + 3 * page)
+        return_add(1.0, 1.0)
+        return_sub(1.0, 1.0)
+        return_div(1.0, 1.0)
+
+        pycc.set_memory_budget(2 * page)
+        assert not return_add.loaded
+        assert return_sub.loaded and return_div.loaded
+
+        # Calling the evicted function evicts the coldest resident one
+        assert return_add(2.0, 3.0) == 5.0
+        assert return_add.loaded and not return_sub.loaded
+
+        after = pycc.memory_stats()
+        assert after["evictions"] >= before["evictions"] + 2
+        assert after["resident_bytes"] == after["budget"]
+    finally:
+        pycc.set_memory_budget(None)
+
+    assert return_sub(3.0, 1.0) == 2.0
+
+
+def test_garbage_collected_functions_are_unmapped():
+    def kernel(x: float) -> float:
+        return x
+
+    compiled = pycc.compile(kernel)
+    before = pycc.memory_stats()
+    del compiled
+    gc.collect()
+
+    after = pycc.memory_stats()
+    assert after["functions"] == before["functions"] - 1
+    assert after["resident_functions"] == before["resident_functions"] - 1
+
+
+def test_calls_race_with_budget_and_unload():
+    stop = threading.Event()
+    errors = []
+
+    def call():
+        while not stop.is_set():
+            try:
+                assert return_sub(3.0, 1.0) == 2.0
+            except Exception as error:
+                errors.append(error)
+                return
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(200):
+            pycc.set_memory_budget(0)
+            pycc.set_memory_budget(None)
+            try:
+                return_sub.unload()
+            except RuntimeError:
+                # A call is in flight
+                pass
+    finally:
+        pycc.set_memory_budget(None)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert errors == []
+
+
+def test_calls_without_budget_take_no_lock():
+    # Calls go through while another thread holds the manager lock
+    called = []
+    with execmem.manager.lock:
+        thread = threading.Thread(target=lambda: called.append(return_sub(3.0, 1.0)))
+        thread.start()
+        thread.join(timeout=5.0)
+        assert called == [2.0]
+    assert return_sub.active_calls == 0
+
+
+def test_loaded_functions_are_collected():
+    rebuilt = pickle.loads(pickle.dumps(return_div))
+    before = pycc.memory_stats()
+    del rebuilt
+    gc.collect()
+    assert pycc.memory_stats()["functions"] == before["functions"] - 1
+    assert pickle.loads(pickle.dumps(return_div))(1.0, 4.0) == 0.25
+
+
+@pycc.compile
+def return_pair(x: float, y: float) -> tuple[float, float, float]:
+    return x + y, x - y, x * y
+
+
+def test_native_entry_point():
+    assert return_sub.c_signature == "double return_sub(double x, double y);"
+    assert return_pair.c_signature == (
+        "struct c_double_tuple3 { double v0; double v1; double v2; } "
+        "return_pair(double x, double y);"
+    )
+
+    # Native code calls the function at its address without python
+    native = ctypes.CFUNCTYPE(ctypes.c_double, ctypes.c_double, ctypes.c_double)(
+        return_sub.address
+    )
+    assert native(5.0, 3.0) == 2.0
+
+
+def test_pinned_functions_stay_mapped():
+    def kernel(x: float) -> float:
+        return x * 3.0
+
+    compiled = pycc.compile(kernel)
+    assert "kernel(double x);" in compiled.c_signature
+    address = compiled.pin()
+    native = ctypes.CFUNCTYPE(ctypes.c_double, ctypes.c_double)(address)
+    try:
+        with pytest.raises(RuntimeError):
+            compiled.unload()
+
+        # Pinned functions are neither evicted nor collected
+        pycc.set_memory_budget(0)
+        assert compiled.loaded
+        before = pycc.memory_stats()
+        assert before["pinned_functions"] >= 1
+        del compiled
+        gc.collect()
+        assert pycc.memory_stats()["functions"] == before["functions"]
+        assert native(2.0) == 6.0
+    finally:
+        pycc.set_memory_budget(None)
+        pinned = next(
+            function for function in list(execmem.manager.pinned.values())
+            if function.name.endswith("kernel")
+        )
+        pinned.unpin()
+
+    with pytest.raises(RuntimeError):
+        pinned.unpin()
+    with return_add.pinned() as address:
+        assert address == return_add.address
+        assert return_add.pins == 1
+    assert return_add.pins == 0
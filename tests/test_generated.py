@@ -0,0 +1,75 @@
+from pycc import pycc
+from pycc.ssair.irparser import IRParser
+import ast
+import ctypes
+import pytest
+
+FORMULA = """
+def formula(x: float, y: float) -> float:
+    return x * {scale} + y / {divisor}
+"""
+
+
+def test_compile_source():
+    compiled = pycc.compile_source(FORMULA.format(scale=2.0, divisor=4.0))
+    assert compiled(1.0, 2.0) == 2.5
+    assert compiled.name == "formula"
+    assert compiled.py_func is None
+
+    # A function among several, unannotated arguments take a signature
+    source = "def first(x: float) -> float:\n    return x\n\ndef second(x):\n    return -x\n"
+    assert pycc.compile_source(source, "second", signature=[ctypes.c_double])(2.0) == -2.0
+    with pytest.raises(TypeError):
+        pycc.compile_source(source, "second")
+    with pytest.raises(ValueError):
+        pycc.compile_source(source, "third")
+
+
+def test_compile_ast():
+    arguments = ast.arguments(
+        posonlyargs=[],
+        args=[ast.arg("x", ast.Name("float"))],
+        kwonlyargs=[],
+        kw_defaults=[],
+        defaults=[],
+    )
+    node = ast.FunctionDef(
+        name="triple",
+        args=arguments,
+        body=[ast.Return(ast.BinOp(ast.Name("x", ast.Load()), ast.Mult(), ast.Constant(3.0)))],
+        decorator_list=[],
+        returns=ast.Name("float"),
+    )
+    assert pycc.compile_ast(node)(2.0) == 6.0
+
+
+def test_compile_ir():
+    source = "\n".join(
+        [
+            "x#0\t:=\t%xmm0",
+            "__PYCC_INTERNAL__C1#0\t:=\t1.5",
+            "y#0\t:=\tx#0 * __PYCC_INTERNAL__C1#0",
+            "ret y#0",
+        ]
+    )
+    assert pycc.compile_ir(source, [ctypes.c_double])(2.0) == 3.0
+    assert pycc.compile_ir(list(IRParser.parse(source)), [ctypes.c_double])(4.0) == 6.0
+
+
+def test_compile_many():
+    formulas = [FORMULA.format(scale=float(idx % 5), divisor=2.0) for idx in range(20)]
+    ir = "x#0\t:=\t%xmm0\ny#0\t:=\tx#0 + x#0\nret y#0"
+    compiled = pycc.compile_many(formulas + [(ir, [ctypes.c_double])], workers=4)
+    assert len(compiled) == 21
+    for idx, kernel in enumerate(compiled[:20]):
+        assert kernel(1.0, 3.0) == (idx % 5) + 1.5
+    assert compiled[-1](1.25) == 2.5
+
+    # Identical kernels are compiled once
+    assert compiled[0] is compiled[5]
+    assert len({id(kernel) for kernel in compiled}) == 6
+
+    with pytest.raises(TypeError):
+        pycc.compile_many([42])
+    with pytest.raises(ValueError):
+        pycc.compile_many(formulas, workers=0)
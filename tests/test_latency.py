@@ -0,0 +1,68 @@
+from pycc import pycc
+from pycc import latency
+import ctypes
+import pytest
+
+
+def latency_horner(x: float) -> float:
+    return ((((x * 0.5 + 1.0) * x + 2.0) * x + 3.0) * x + 4.0) * x + 5.0
+
+
+def latency_single(scale: ctypes.c_float, x: float) -> float:
+    return scale * x
+
+
+def latency_polymorphic(x, y):
+    return x * y
+
+
+def latency_identity(x: float) -> float:
+    return x
+
+
+def test_measure():
+    horner = pycc.compile(latency_horner)
+    result = latency.measure(horner, 0.75, calls=20_000, repeat=3, dependent=True)
+    assert result["calls"] == 20_000 and result["dependent"]
+    # Five dependent multiply adds take well over a cycle
+    assert result["cycles_per_call"] > 5.0
+    assert result["ns_per_call"] > 0.0
+    assert result["loop_cycles_per_call"] > 0.0
+    assert result["python_ns_per_call"] > result["ns_per_call"]
+    assert result["dispatch_ns_per_call"] == pytest.approx(
+        result["python_ns_per_call"] - result["ns_per_call"]
+    )
+    # Measuring does not leave the kernel pinned
+    assert horner.pins == 0
+
+
+def test_measure_is_never_negative():
+    # The kernel is shorter than the loop, noise makes the loop samples
+    # exceed the kernel samples about half the time
+    identity = pycc.compile(latency_identity)
+    for _ in range(5):
+        result = latency.measure(identity, 1.0, calls=1_000, repeat=7)
+        assert result["cycles_per_call"] >= 0.0
+        assert result["ns_per_call"] >= 0.0
+        assert result["cycles_spread"] >= 0.0
+        assert result["ns_spread"] >= 0.0
+
+
+def test_measure_signatures():
+    single = pycc.compile(latency_single)
+    for dependent in (False, True):
+        result = latency.measure(single, 0.5, 3.0, calls=1_000, repeat=1, dependent=dependent)
+        assert result["loop_ns_per_call"] > 0.0
+
+    dispatcher = pycc.compile(latency_polymorphic)
+    assert latency.measure(dispatcher, 2.0, 3.0, calls=1_000, repeat=1)["calls"] == 1_000
+
+
+def test_measure_errors():
+    horner = pycc.compile(latency_horner)
+    with pytest.raises(TypeError):
+        latency.measure(latency_horner, 0.75)
+    with pytest.raises(TypeError):
+        latency.measure(horner)
+    with pytest.raises(ValueError):
+        latency.measure(horner, 0.75, calls=0)
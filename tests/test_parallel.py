@@ -0,0 +1,83 @@
+from pycc import pycc
+from ctypes import c_float
+import array
+import threading
+import pytest
+
+
+@pycc.compile
+def lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+
+def test_parallel_map():
+    n = 10001
+    a = array.array("d", [float(i) for i in range(n)])
+    b = array.array("d", [float(2 * i) for i in range(n)])
+    t = array.array("d", [0.25] * n)
+    out = array.array("d", [0.0] * n)
+
+    assert lerp.parallel_map(out, a, b, t, workers=4) is out
+    for i in range(n):
+        assert out[i] == lerp(a[i], b[i], t[i])
+
+
+def test_parallel_map_chunks_and_readonly_inputs():
+    n = 1000
+    a = array.array("d", [float(i) for i in range(n)])
+    out = array.array("d", [0.0] * n)
+
+    lerp.parallel_map(
+        out, memoryview(a).toreadonly(), a, a, workers=3, chunk_size=7
+    )
+    assert list(out) == list(a)
+
+
+@pycc.compile
+def scale_offset(x: c_float, k: float) -> c_float:
+    return x * k + 0.5
+
+
+def test_parallel_map_single_precision():
+    n = 1003
+    x = array.array("f", [i / 7.0 for i in range(n)])
+    k = array.array("d", [1.0 / 3.0] * n)
+    out = array.array("f", [0.0] * n)
+
+    scale_offset.parallel_map(out, x, k, workers=2)
+    expected = array.array("f", (x[i] * k[i] + 0.5 for i in range(n)))
+    assert out == expected
+
+    with pytest.raises(TypeError):
+        scale_offset.parallel_map(out, k, k)
+
+
+def test_parallel_map_rejects_bad_buffers():
+    out = array.array("d", [0.0] * 4)
+    with pytest.raises(TypeError):
+        lerp.parallel_map(out, out, out)
+    with pytest.raises(TypeError):
+        lerp.parallel_map(array.array("f", [0.0] * 4), out, out, out)
+    with pytest.raises(ValueError):
+        lerp.parallel_map(out, out[:2], out, out)
+    with pytest.raises(ValueError):
+        lerp.parallel_map(out, out, out, out, workers=0)
+
+
+def test_compile_from_threads():
+    compiled = []
+
+    def worker(value):
+        def kernel(x: float) -> float:
+            return x * 3.0
+
+        compiled.append(pycc.compile(kernel))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [kernel(2.0) for kernel in compiled] == [6.0] * 4
+    assert pycc.func_map[f"{__name__}.{compiled[-1].name}"] in compiled
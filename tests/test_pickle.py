@@ -0,0 +1,147 @@
+from pycc import pycc
+from pycc import execmem
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import pickle
+import math
+import pytest
+
+
+@pycc.compile
+def return_scaled(x: float, y: float) -> float:
+    return 2.0 * x + y
+
+
+@pycc.compile
+def return_bounds(x: float, y: float) -> tuple[float, float, float]:
+    return x - y, x, x + y
+
+
+def test_pickle_roundtrip():
+    data = pickle.dumps(return_scaled)
+    rebuilt = pickle.loads(data)
+
+    assert rebuilt is not return_scaled
+    assert rebuilt.name == return_scaled.name
+    assert rebuilt.code == return_scaled.code
+    assert rebuilt(3.0, 1.0) == 7.0
+
+    # Unpickling the same code again reuses the existing mapping
+    assert pickle.loads(data) is rebuilt
+
+
+def test_process_pool():
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=2, mp_context=context) as pool:
+        results = list(pool.map(return_scaled, [1.0, 2.0, 3.0], [0.5, 0.5, 0.5]))
+    assert results == [2.5, 4.5, 6.5]
+
+
+def test_load_without_compiler():
+    rebuilt = execmem.load(
+        return_scaled.code,
+        return_scaled.cdef.restype,
+        return_scaled.cdef.argtypes,
+    )
+    assert rebuilt(1.0, 1.0) == 3.0
+
+
+def test_pickle_tuple_return():
+    rebuilt = pickle.loads(pickle.dumps(return_bounds))
+    assert rebuilt(1.0, 0.5) == (0.5, 1.0, 1.5)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        assert list(pool.map(return_bounds, [2.0], [1.0])) == [(1.0, 2.0, 3.0)]
+
+
+@pycc.compile
+def return_decay(x: float, rate: float) -> float:
+    return math.exp(-rate * x)
+
+
+def test_pickle_links_libm():
+    # The libm addresses are filled in again by the unpickling process
+    rebuilt = pickle.loads(pickle.dumps(return_decay))
+    assert rebuilt.imports == ("exp",)
+    assert rebuilt(1.0, 0.5) == math.exp(-0.5)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        assert list(pool.map(return_decay, [2.0], [0.25])) == [math.exp(-0.5)]
+
+
+@pycc.compile
+def polymorphic_scaled(x, y):
+    return 2.0 * x + y
+
+
+def polymorphic_affine(a, x, b):
+    return a * x + b
+
+
+def test_pickle_dispatcher():
+    assert polymorphic_scaled(1.0, 0.5) == 2.5
+    rebuilt = pickle.loads(pickle.dumps(polymorphic_scaled))
+    assert rebuilt is not polymorphic_scaled
+    assert rebuilt.py_func is polymorphic_scaled.py_func
+    # The specialization is unpickled rather than compiled again
+    assert list(rebuilt.specializations) == list(polymorphic_scaled.specializations)
+    assert rebuilt(3.0, 1.0) == 7.0
+    assert rebuilt(3, 1.0) == 7.0
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        assert list(pool.map(polymorphic_scaled, [1.0, 2.0], [0.5, 0.5])) == [2.5, 4.5]
+
+
+def test_pickle_specialized_dispatcher():
+    affine = pycc.specialize(polymorphic_affine, b=1.0)
+    assert affine(2.0, 3.0) == 7.0
+    rebuilt = pickle.loads(pickle.dumps(affine))
+    assert rebuilt.py_func.bound == {"b": 1.0}
+    assert rebuilt(2.0, 3.0) == 7.0
+    assert rebuilt(2, 3.0) == 7.0
+
+
+def test_pickle_local_dispatcher():
+    def local(x, y):
+        return x * y
+
+    with pytest.raises(TypeError):
+        pickle.dumps(pycc.compile(local))
+
+
+@pycc.compile(tiered=True, threshold=1000)
+def tiered_scaled(x: float, y: float) -> float:
+    return 2.0 * x + y
+
+
+@pycc.compile(tiered=True, threshold=1000)
+def tiered_offset(x: float, y: float) -> float:
+    return x - 3.0 * y
+
+
+def test_pickle_interpreted_tiered():
+    assert tiered_offset(4.0, 1.0) == 1.0
+    rebuilt = pickle.loads(pickle.dumps(tiered_offset))
+    assert rebuilt is not tiered_offset
+    assert rebuilt.py_func is tiered_offset.py_func
+    assert rebuilt.state == "interpreted"
+    assert rebuilt.calls == tiered_offset.calls
+    assert rebuilt.threshold == 1000
+    assert rebuilt(4.0, 1.0) == 1.0
+
+
+def test_pickle_compiled_tiered():
+    tiered_scaled.promote()
+    assert tiered_scaled.wait() is not None
+    rebuilt = pickle.loads(pickle.dumps(tiered_scaled))
+    # The compiled function is unpickled rather than compiled again
+    assert rebuilt.state == "compiled"
+    assert rebuilt.compiled.code == tiered_scaled.compiled.code
+    assert rebuilt(3.0, 1.0) == 7.0
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        assert list(pool.map(tiered_scaled, [1.0, 2.0], [0.5, 0.5])) == [2.5, 4.5]
@@ -0,0 +1,56 @@
+from pycc import pycc
+from pycc import profiling
+import struct
+
+
+@pycc.compile
+def return_hypot_sq(x: float, y: float) -> float:
+    return x * x + y * y
+
+
+def test_perf_map(tmp_path):
+    # Map the function again in case another test evicted it
+    return_hypot_sq(0.0, 0.0)
+    path = pycc.enable_perf_map(tmp_path / "perf.map")
+    try:
+        # Functions mapped before the map was enabled are listed as well
+        entries = path.read_text().splitlines()
+        address = f"{return_hypot_sq.addr.value:x}"
+        assert f"{address} {len(return_hypot_sq.code):x} return_hypot_sq" in entries
+
+        return_hypot_sq.unload()
+        assert return_hypot_sq(3.0, 4.0) == 25.0
+        address = f"{return_hypot_sq.addr.value:x}"
+        assert path.read_text().splitlines()[-1].startswith(address)
+    finally:
+        pycc.disable_perf_map()
+
+
+def test_jitdump(tmp_path):
+    return_hypot_sq(0.0, 0.0)
+    path = pycc.enable_jitdump(tmp_path)
+    pycc.disable_jitdump()
+
+    dump = path.read_bytes()
+    magic, version, header_size, elf_mach = struct.unpack_from("<IIII", dump)
+    assert (magic, version, elf_mach) == (profiling.JITDUMP_MAGIC, 1, 62)
+
+    # The machine code of every mapped function is part of its load record
+    assert b"return_hypot_sq\0" + return_hypot_sq.code in dump
+    record_id, _, _ = profiling.JITDUMP_RECORD_HEADER.unpack_from(dump, header_size)
+    assert record_id == profiling.JIT_CODE_LOAD
+
+
+def test_counters():
+    pycc.enable_counters()
+    try:
+        pycc.reset_counters()
+        for _ in range(10):
+            return_hypot_sq(1.0, 2.0)
+    finally:
+        pycc.disable_counters()
+    return_hypot_sq(1.0, 2.0)
+
+    stats = {stat["name"]: stat for stat in pycc.counter_stats()}
+    assert stats["return_hypot_sq"]["calls"] == 10
+    assert stats["return_hypot_sq"]["time_ns"] > 0
@@ -1,9 +1,14 @@
-from pycc.py2ir import Py2IR
+from pycc.py2ir import Py2IR, CompilerException
 from pycc.ssair.irassembler_x64 import IRAssemblerX64
+from pycc.ssair.iroptimizer import IROptimizer
 from pycc import pycc
 import inspect
+import ctypes
+import math
 import ast
+import itertools
 import time
+import pytest
 
 
 @pycc.compile
@@ -37,6 +42,195 @@ def return_normalized(low: float, high: float, z: float) -> float:
     return m * z + b
 
 
+@pycc.compile
+def return_slope_sum(x1: float, x2: float, y1: float, y2: float) -> float:
+    return (y2 - y1) / (x2 - x1) + (y2 - y1) * (x2 - x1)
+
+
+@pycc.compile
+def return_signed_zero(x: float) -> float:
+    return (x + -0.0) * 1.0 / 2.0
+
+
+def clamp(x: float, lo: float, hi: float) -> float:
+    if x < lo:
+        x = lo
+    elif x > hi:
+        x = hi
+    return x
+
+
+def safe_div(a: float, b: float) -> float:
+    if b == 0.0:
+        return 0.0
+    return a / b
+
+
+def piecewise(x: float) -> float:
+    y = x * 2.0 if 0.0 <= x < 1.0 else x - 1.0
+    return y + 1.0
+
+
+def long_arms(x: float, y: float, z: float) -> float:
+    if x > y or z != 0.0:
+        a = x / y
+        b = a / z
+        c = b / x + y
+    else:
+        a = y / x
+        b = a - z
+        c = z
+    return b * c + x
+
+
+@pycc.compile
+def return_square_and_derivative(x: float) -> tuple[float, float]:
+    return x * x, 2.0 * x
+
+
+@pycc.compile
+def return_swapped(x: float, y: float) -> tuple[float, float]:
+    return y, x
+
+
+@pycc.compile
+def return_cross(
+    ax: float, ay: float, az: float, bx: float, by: float, bz: float
+) -> tuple[float, float, float]:
+    return ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
+
+
+@pycc.compile
+def return_ordered(x: float, y: float) -> tuple[float, float, float]:
+    if x < y:
+        return x, y, 1.0
+    return y, x, -1.0
+
+
+@pycc.compile
+def return_gaussian(x: float, mu: float, sigma: float) -> float:
+    z = (x - mu) / sigma
+    return math.exp(-0.5 * z * z) / (sigma * math.sqrt(6.283185307179586))
+
+
+@pycc.compile
+def return_polar(r: float, t: float) -> tuple[float, float, float]:
+    x = r * math.cos(t)
+    y = r * math.sin(t)
+    return x, y, math.atan2(y, x)
+
+
+@pycc.compile
+def return_libm_branches(x: float, y: float) -> float:
+    a = math.pow(x, y)
+    b = math.log(x) + math.sqrt(y)
+    if a < b:
+        return math.hypot(a, b) + x
+    return a - b * y
+
+
+@pycc.compile
+def return_poly10(
+    x: float,
+    c0: float,
+    c1: float,
+    c2: float,
+    c3: float,
+    c4: float,
+    c5: float,
+    c6: float,
+    c7: float,
+    c8: float,
+    c9: float,
+) -> float:
+    return c0 + x * (c1 + x * (c2 + x * (c3 + x * (c4 + x * (c5 + x * (c6 + x * (c7 + x * (c8 + x * c9))))))))
+
+
+@pycc.compile
+def return_wide_calls(
+    a: float, b: float, c: float, d: float, e: float, f: float, g: float, h: float, i: float, j: float
+) -> tuple[float, float, float]:
+    s = math.exp(i) + j
+    if s < a:
+        return j, i, math.sin(j) * h
+    return s * b, i - a, 2.0
+
+
+def fast_poly(x: float, d: float) -> float:
+    p = 1.0 + x * (0.5 + x * (0.25 + x * (0.125 + x * (0.0625 + x * 0.03125))))
+    return (p + x + d + p * x) / d + x / 3.0
+
+
+def powers(x: float, y: float) -> tuple[float, float, float, float, float]:
+    return x**2, x**0.5, x**-1, x**0, (y * y + 1.0) ** x
+
+
+def fast_powers(x: float) -> tuple[float, float, float]:
+    return x**3, x**-15, math.pow(x, -0.5)
+
+
+def single_product(x: ctypes.c_float, k: ctypes.c_float) -> ctypes.c_float:
+    return x * k
+
+
+def single_mixed(x: ctypes.c_float, y: float) -> float:
+    return x * y + 0.1
+
+
+def single_hypot(x: ctypes.c_float, y: ctypes.c_float) -> ctypes.c_float:
+    return math.sqrt(x * x + y * y)
+
+
+def single_const() -> ctypes.c_float:
+    return 0.1
+
+
+def single_stack(
+    a: ctypes.c_float,
+    b: ctypes.c_float,
+    c: ctypes.c_float,
+    d: ctypes.c_float,
+    e: ctypes.c_float,
+    f: ctypes.c_float,
+    g: ctypes.c_float,
+    h: ctypes.c_float,
+    i: ctypes.c_float,
+    j: ctypes.c_float,
+) -> ctypes.c_float:
+    return i + j * a
+
+
+def int_argument(n: int, x: float) -> float:
+    return n + x
+
+
+def int_result(n: int) -> int:
+    return n
+
+
+def int_pair(n: int) -> tuple[float, int]:
+    return n, n
+
+
+def slopes(x1: float, x2: float, y1: float, y2: float, z1: float, z2: float) -> float:
+    return (y2 - y1) / (x2 - x1) + (z2 - z1) / (x2 - x1)
+
+
+def wide_ratios(a: float, b: float, c: float, d: float) -> tuple[float, float]:
+    return (a * 1.5 + 2.0) / (b * 0.5 + 1.0), (c * 2.5 + 3.0) / (d * 1.5 + 2.0)
+
+
+def same_double(a: float, b: float) -> bool:
+    if math.isnan(a) or math.isnan(b):
+        return math.isnan(a) and math.isnan(b)
+    return a == b and math.copysign(1.0, a) == math.copysign(1.0, b)
+
+
+# Conditionals are compared against their python functions
+CONDITIONALS = {func: pycc.compile(func) for func in (clamp, safe_div, piecewise, long_arms)}
+CONDITIONAL_VALUES = [-1.5, -0.0, 0.0, 0.5, 1.0, 2.0, math.inf, -math.inf, math.nan]
+
+
 def test_return_const():
     assert return_const() == 10.0
 
@@ -78,8 +272,178 @@ def test_normalize():
     assert return_normalized(-1, 1, 0.0) == 0.5
 
 
+def test_return_slope_sum():
+    assert return_slope_sum(1.0, 3.0, 2.0, 6.0) == 2.0 + 8.0
+
+
+def test_return_signed_zero():
+    assert math.copysign(1.0, return_signed_zero(-0.0)) == -1.0
+    assert return_signed_zero(3.0) == 1.5
+
+
+def test_return_tuples():
+    assert return_square_and_derivative(3.0) == (9.0, 6.0)
+    assert return_swapped(1.0, 2.0) == (2.0, 1.0)
+    assert return_cross(1.0, 0.0, 0.0, 0.0, 1.0, 0.0) == (0.0, 0.0, 1.0)
+    assert return_cross(1.0, 2.0, 3.0, 4.0, 5.0, 6.0) == (-3.0, 6.0, -3.0)
+    assert return_ordered(2.0, 1.0) == (1.0, 2.0, -1.0)
+    assert return_ordered(1.0, 2.0) == (1.0, 2.0, 1.0)
+
+
+def test_libm_calls():
+    gaussian = return_gaussian.py_func
+    for x in (-2.0, 0.0, 0.5, 3.0):
+        assert return_gaussian(x, 0.5, 2.0) == gaussian(x, 0.5, 2.0)
+    assert return_polar(2.0, 0.3) == return_polar.py_func(2.0, 0.3)
+    for x, y in ((2.0, 3.0), (0.5, 0.2), (3.0, 0.1)):
+        assert return_libm_branches(x, y) == return_libm_branches.py_func(x, y)
+
+    # libm returns nan where python raises
+    assert math.isnan(return_libm_branches(-1.0, 0.5))
+
+
+def test_stack_arguments():
+    coefficients = [float(k) - 4.5 for k in range(10)]
+    for x in (-1.5, 0.0, 0.5, 2.0):
+        assert return_poly10(x, *coefficients) == return_poly10.py_func(x, *coefficients)
+
+    for a in (0.1, -10.0):
+        args = [a, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 0.25, -1.5]
+        assert return_wide_calls(*args) == return_wide_calls.py_func(*args)
+
+
+def test_fast_math():
+    strict = pycc.compile(fast_poly)
+    fast = pycc.compile(fast_poly, fast_math=True)
+    assert pycc.func_map[f"{__name__}.fast_poly"] is strict
+    assert pycc.func_map[f"{__name__}.fast_poly[fast_math]"] is fast
+    for x in (-1.5, -0.25, 0.0, 0.5, 3.0):
+        for d in (0.1, 1.0, -7.0):
+            assert same_double(strict(x, d), fast_poly(x, d))
+            assert math.isclose(fast(x, d), fast_poly(x, d), rel_tol=1e-13)
+
+
+def test_powers():
+    strict = pycc.compile(powers)
+    fast = pycc.compile(fast_powers, fast_math=True)
+    for x in (-math.inf, -2.0, -0.0, 0.0, 0.25, 1.5, 3.0, math.inf, math.nan):
+        native = strict(x, 0.5)
+        if x == 0.0:
+            # python raises on zero to a negative power, as on division
+            assert native == (0.0, 0.0, math.copysign(math.inf, x), 1.0, 1.0)
+        elif x == -2.0:
+            # python returns a complex square root of negative numbers
+            assert math.isnan(native[1])
+            assert native[2] == -0.5
+        else:
+            assert all(map(same_double, native, powers(x, 0.5)))
+
+    for x in (0.25, 1.5, 3.0, 1e10):
+        for native, expected in zip(fast(x), fast_powers(x)):
+            assert math.isclose(native, expected, rel_tol=1e-14)
+
+
+def test_single_precision():
+    functions = [single_product, single_mixed, single_hypot, single_const]
+    values = [-2.5, -0.0, 0.1, 1.7, 3e38, math.inf, math.nan]
+    for func in functions:
+        native = pycc.compile(func)
+        n_args = len(inspect.signature(func).parameters)
+        for args in itertools.product(values, repeat=n_args):
+            # Arguments and results are rounded to single precision by ctypes
+            args = tuple(ctypes.c_float(arg).value for arg in args)
+            expected = func(*args)
+            if func.__annotations__["return"] is ctypes.c_float:
+                expected = ctypes.c_float(expected).value
+            assert same_double(native(*args), expected)
+
+    # The ninth and tenth arguments are passed on the stack
+    native = pycc.compile(single_stack)
+    assert native(*(1.0,) * 8, 2.0, 6.0) == 8.0
+    for first, ninth, tenth in itertools.product(values, repeat=3):
+        args = tuple(ctypes.c_float(arg).value for arg in (first, *values[:7], ninth, tenth))
+        expected = ctypes.c_float(single_stack(*args)).value
+        assert same_double(native(*args), expected)
+
+
+def test_packed_operations():
+    values = [-2.5, -0.0, 0.1, 1.7, 1e300, math.inf, math.nan]
+    for func in (slopes, wide_ratios):
+        native = pycc.compile(func)
+        n_args = len(inspect.signature(func).parameters)
+        for args in itertools.product(values, repeat=n_args):
+            try:
+                expected = func(*args)
+            except ZeroDivisionError:
+                continue
+            results = native(*args)
+            if isinstance(expected, tuple):
+                assert all(map(same_double, results, expected))
+            else:
+                assert same_double(results, expected)
+
+
+def test_clamp():
+    native = CONDITIONALS[clamp]
+    assert native(-3.0, -1.0, 1.0) == -1.0
+    assert native(3.0, -1.0, 1.0) == 1.0
+    assert native(0.25, -1.0, 1.0) == 0.25
+    assert math.isnan(native(math.nan, -1.0, 1.0))
+
+
+def test_conditionals_match_python():
+    for func, native in CONDITIONALS.items():
+        n_args = func.__code__.co_argcount
+        for args in itertools.product(CONDITIONAL_VALUES, repeat=n_args):
+            try:
+                expected = func(*args)
+            except ZeroDivisionError:
+                continue
+            assert same_double(native(*args), expected), (func.__name__, args)
+
+
+def test_small_conditionals_are_branchless():
+    for func, mnemonics in ((clamp, ["minsd"]), (piecewise, ["andnpd", "orpd"])):
+        ir = IROptimizer(
+            Py2IR("<test>").visit(ast.parse(inspect.getsource(func)))
+        ).ir
+        ir_assembler = IRAssemblerX64(ir)
+        ir_assembler.assemble()
+        instructions = [instr[0] for instr in ir_assembler.asmx64.instrs]
+        assert not any(instruction.startswith("j") for instruction in instructions)
+        for mnemonic in mnemonics:
+            assert mnemonic in instructions
+
+    ir_assembler = IRAssemblerX64(
+        IROptimizer(Py2IR("<test>").visit(ast.parse(inspect.getsource(piecewise)))).ir,
+        cpu="skylake",
+    )
+    ir_assembler.assemble()
+    assert "vblendvpd" in [instr[0] for instr in ir_assembler.asmx64.instrs]
+
+
+def test_integers_are_widened():
+    compiled = pycc.compile(int_argument)
+    assert compiled.cdef.argtypes == [ctypes.c_double, ctypes.c_double]
+    assert compiled(2, 0.5) == 2.5
+    # Integers beyond 2**53 are rounded to the nearest double
+    assert compiled(2**53 + 1, 0.0) == float(2**53)
+
+    for func in (int_result, int_pair):
+        with pytest.raises(CompilerException):
+            pycc.compile(func)
+
+
 if __name__ == "__main__":
     test_return_const()
     test_return_var()
     test_return_mult()
     test_normalize()
+    test_return_slope_sum()
+    test_return_signed_zero()
+    test_return_tuples()
+    test_libm_calls()
+    test_stack_arguments()
+    test_clamp()
+    test_conditionals_match_python()
+    test_small_conditionals_are_branchless()
@@ -0,0 +1,89 @@
+from pycc import pycc
+from pycc.reduction import reduce_python
+import array
+import math
+import random
+import pytest
+
+
+def square(x: float) -> float:
+    return x * x
+
+
+def weighted(x: float, w: float) -> float:
+    return x * w + 0.5
+
+
+def clamp(x: float) -> float:
+    if x < 0.0:
+        return 0.0
+    return x * 2.0
+
+
+def polymorphic_product(x, w):
+    return x * w
+
+
+def same_double(a: float, b: float) -> bool:
+    return a == b and math.copysign(1.0, a) == math.copysign(1.0, b) or a != a and b != b
+
+
+random.seed(37)
+DATA = array.array("d", (random.uniform(-10.0, 10.0) for _ in range(1003)))
+WEIGHTS = array.array("d", (random.uniform(0.0, 1.0) for _ in range(1003)))
+
+
+def test_sum_of_squares():
+    reduction = pycc.reduce(square)
+    assert reduction.packed
+    assert reduction.accumulators == 4
+    expected = math.fsum(x * x for x in DATA)
+    assert math.isclose(reduction(DATA), expected, rel_tol=1e-12)
+
+    # Lengths that do not fill an unrolled pass exercise the scalar tail
+    for n in range(0, 20):
+        assert math.isclose(
+            reduction(DATA[:n], init=1.5), 1.5 + math.fsum(x * x for x in DATA[:n])
+        )
+
+
+@pytest.mark.parametrize("op", ["+", "*", "min", "max"])
+@pytest.mark.parametrize("kernel,buffers", [(weighted, (DATA, WEIGHTS)), (clamp, (DATA,))])
+def test_deterministic_matches_python(op, kernel, buffers):
+    reduction = pycc.reduce(kernel, 1.0, op=op, deterministic=True)
+    for n in (0, 1, 7, 8, 9, 1003):
+        sliced = [buffer[:n] for buffer in buffers]
+        assert same_double(reduction(*sliced), reduce_python(kernel, op, 1.0, *sliced))
+
+
+@pytest.mark.parametrize("op", ["min", "max"])
+def test_min_max(op):
+    reduction = pycc.reduce(clamp, math.nan if op == "min" else 0.0, op=op, accumulators=8)
+    assert not reduction.packed
+    assert reduction.accumulators == 8
+    expected = reduce_python(clamp, op, 0.0, DATA)
+    assert reduction(DATA, init=0.0) == expected
+    # A nan init is kept, like the builtins keep their first value
+    assert math.isnan(reduction(DATA, init=math.nan))
+
+
+def test_reduce_compiled_function():
+    compiled = pycc.compile(weighted)
+    reduction = pycc.reduce(compiled, accumulators=1)
+    assert reduction.accumulators == 1
+    assert math.isclose(
+        reduction(DATA, WEIGHTS), reduce_python(weighted, "+", 0.0, DATA, WEIGHTS)
+    )
+
+    with pytest.raises(ValueError):
+        reduction(DATA, WEIGHTS[:10])
+    with pytest.raises(TypeError):
+        reduction(DATA)
+
+
+def test_reduce_polymorphic_kernel():
+    # Unannotated kernels are reduced over doubles
+    reduction = pycc.reduce(polymorphic_product, deterministic=True)
+    assert reduction(DATA, WEIGHTS) == reduce_python(
+        polymorphic_product, "+", 0.0, DATA, WEIGHTS
+    )
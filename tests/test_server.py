@@ -0,0 +1,128 @@
+from pycc import pycc
+from pycc import server
+from pycc.server import CompileServer
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+import inspect
+import os
+import socket
+import textwrap
+import threading
+import pytest
+
+
+def remote_lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+
+def remote_unsupported(x: float) -> float:
+    return [x][0]
+
+
+def remote_text(x: str) -> float:
+    return 1.0
+
+
+@pytest.fixture
+def compile_server(tmp_path):
+    running = CompileServer(tmp_path / "compile.sock", jobs=2, idle_timeout=60.0)
+    assert running.bind()
+    thread = threading.Thread(target=running.serve_forever, daemon=True)
+    thread.start()
+    pycc.enable_compile_server(running.socket_path, spawn=False)
+    yield running
+    pycc.disable_compile_server()
+    running.shutdown()
+    thread.join(timeout=30)
+
+
+def test_compile_through_server(compile_server):
+    compiled = pycc.compile(remote_lerp)
+    assert compiled(0.0, 2.0, 0.25) == 0.5
+    assert compiled.name == "remote_lerp"
+    assert compile_server.stats()["compiled"] == 1
+
+    # A second lock on the socket is refused
+    assert not CompileServer(compile_server.socket_path).bind()
+
+
+def test_identical_requests_compile_once(compile_server):
+    source = textwrap.dedent(inspect.getsource(remote_lerp))
+    file_name = inspect.getfile(remote_lerp)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda _: server.request_build(
+                    compile_server.socket_path, source, file_name, "remote_lerp", spawn=False
+                ),
+                range(8),
+            )
+        )
+
+    codes = {code for code, _, _ in results}
+    assert len(codes) == 1
+    assert all(cdef.restype is ctypes.c_double for _, cdef, _ in results)
+    assert compile_server.stats() == {"requests": 8, "compiled": 1, "deduplicated": 7}
+
+    # Requests differing in their options are compiled separately
+    server.request_build(
+        compile_server.socket_path, source, file_name, "remote_lerp", fast_math=True, spawn=False
+    )
+    assert compile_server.stats()["compiled"] == 2
+
+
+def test_errors_are_raised_in_process(compile_server):
+    with pytest.raises(Exception):
+        pycc.compile(remote_unsupported)
+
+
+def test_falls_back_without_server(tmp_path):
+    assert (
+        server.request_build(tmp_path / "missing.sock", "", "", "missing", spawn=False) is None
+    )
+
+    pycc.enable_compile_server(tmp_path / "missing.sock", spawn=False)
+    try:
+        compiled = pycc.compile(remote_lerp)
+    finally:
+        pycc.disable_compile_server()
+    assert compiled(1.0, 3.0, 0.5) == 2.0
+
+
+def test_compiler_errors_are_answered():
+    # CompilerException is not an Exception, the worker answers it all the same
+    answer = server.build_request(
+        {
+            "source": textwrap.dedent(inspect.getsource(remote_text)),
+            "file_name": inspect.getfile(remote_text),
+            "qualname": "remote_text",
+            "signature": None,
+            "fast_math": False,
+            "bound": None,
+        }
+    )
+    assert answer["error"].startswith("CompilerException")
+
+
+def test_socket_directory_must_be_private(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o700)
+    os.chmod(shared, 0o755)
+    with pytest.raises(PermissionError):
+        CompileServer(shared / "compile.sock").bind()
+    assert server.request_build(shared / "compile.sock", "", "", "shared", spawn=False) is None
+
+    private = tmp_path / "private"
+    private.mkdir(mode=0o700)
+    (tmp_path / "link").symlink_to(private)
+    with pytest.raises(PermissionError):
+        server.private_directory(tmp_path / "link")
+
+    created = server.private_directory(tmp_path / "created")
+    assert os.stat(created).st_mode & 0o777 == 0o700
+
+
+def test_peer_credentials():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    with left, right:
+        server.check_peer(left)
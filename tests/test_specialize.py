@@ -0,0 +1,71 @@
+from pycc import pycc
+from pycc.dispatch import PyObject_Dispatcher
+import ctypes
+import inspect
+import pytest
+
+
+def return_normalized(low: float, high: float, z: float) -> float:
+    m = 2.0 / (high - low)
+    b = -(high + low) / (high - low)
+    return m * z + b
+
+
+def scaled(a, x):
+    return a * x + a / 4.0
+
+
+def narrow(scale: ctypes.c_float, x: float) -> float:
+    return scale * x
+
+
+def test_bound_arguments_are_folded():
+    normalize = pycc.specialize(return_normalized, low=-1.0, high=1.0)
+    assert normalize.cdef.argtypes == [ctypes.c_double]
+    assert normalize.c_signature == "double return_normalized(double z);"
+    for z in (-1.0, 0.25, 0.5, 3.0):
+        assert normalize(z) == return_normalized(-1.0, 1.0, z)
+
+    # m and b are constants, the function returns its argument
+    artifacts = inspect.getfile(return_normalized).replace("test_specialize.py", "__pycache__")
+    with open(
+        f"{artifacts}/test_specialize-return_normalized-return_normalized-high=1_0-low=-1_0.ir"
+    ) as fp:
+        assert fp.read().split() == ["z#0", ":=", "%xmm0", "ret", "z#0"]
+
+    # Bound values of another type or in another order share the specialization
+    assert pycc.specialize(return_normalized, high=1, low=-1.0) is normalize
+    assert pycc.specialize(return_normalized, low=0.0, high=1.0) is not normalize
+
+
+def test_specialize_compiled_function():
+    compiled = pycc.compile(return_normalized)
+    shifted = pycc.specialize(compiled, low=2.0, high=3.0)
+    assert shifted(2.75) == return_normalized(2.0, 3.0, 2.75)
+    assert shifted.py_func(2.75) == return_normalized(2.0, 3.0, 2.75)
+    assert list(inspect.signature(shifted.py_func).parameters) == ["z"]
+
+    # Arguments after the bound ones stay in their order
+    partial = pycc.specialize(return_normalized, high=2.0)
+    assert partial(-2.0, 1.0) == return_normalized(-2.0, 2.0, 1.0)
+
+
+def test_bound_values_are_rounded_to_the_argument():
+    double = pycc.specialize(narrow, scale=0.1)
+    assert double(3.0) == narrow(ctypes.c_float(0.1).value, 3.0)
+
+
+def test_specialize_polymorphic():
+    quarter = pycc.specialize(scaled, a=3)
+    assert isinstance(quarter, PyObject_Dispatcher)
+    assert quarter(2.0) == scaled(3.0, 2.0)
+    assert quarter(2) == scaled(3.0, 2.0)
+
+
+def test_specialize_errors():
+    with pytest.raises(TypeError):
+        pycc.specialize(return_normalized, width=1.0)
+    with pytest.raises(TypeError):
+        pycc.specialize(return_normalized, low="-1")
+    with pytest.raises(TypeError):
+        pycc.specialize(len, low=-1.0)
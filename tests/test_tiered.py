@@ -0,0 +1,60 @@
+from pycc import pycc
+from pycc.tiered import PyObject_Tiered
+from pycc import execmem
+from pycc.py2ir import CompilerException
+
+
+@pycc.compile(tiered=True, threshold=3)
+def tiered_lerp(a: float, b: float, t: float) -> float:
+    return a + (b - a) * t
+
+
+def test_interprets_until_threshold():
+    assert isinstance(tiered_lerp, PyObject_Tiered)
+    assert tiered_lerp.state == "interpreted"
+    assert tiered_lerp(0.0, 2.0, 0.5) == 1.0
+    assert tiered_lerp(0.0, 2.0, 0.25) == 0.5
+    assert tiered_lerp.compiled is None
+
+    # The third call queues the compilation and still runs interpreted
+    assert tiered_lerp(0.0, 4.0, 0.5) == 2.0
+    assert tiered_lerp.state in ("queued", "compiled")
+
+    compiled = tiered_lerp.wait(timeout=60)
+    assert isinstance(compiled, execmem.PyObject_ExecMem)
+    assert tiered_lerp.state == "compiled"
+    assert tiered_lerp.entry is compiled
+    assert tiered_lerp(0.0, 4.0, 0.5) == 2.0
+
+    # Native calls are not counted by the tier
+    assert tiered_lerp.calls == 3
+    stats = {stat["name"]: stat for stat in pycc.tiering_stats()}
+    assert stats["tiered_lerp"] == {
+        "name": "tiered_lerp",
+        "calls": 3,
+        "threshold": 3,
+        "state": "compiled",
+    }
+
+
+def test_failed_compilation_stays_interpreted():
+    def unsupported(x: float) -> float:
+        return [x][0]
+
+    function = pycc.compile(unsupported, tiered=True, threshold=1)
+    assert function(2.0) == 2.0
+    assert function.wait(timeout=60) is None
+    assert function.state == "failed"
+    assert function.error is not None
+    assert function(3.0) == 3.0
+
+
+def test_compiler_errors_stay_interpreted():
+    def unsupported_annotation(x: str) -> float:
+        return 1.0
+
+    function = pycc.compile(unsupported_annotation, tiered=True, threshold=1)
+    assert function("x") == 1.0
+    assert function.wait(timeout=60) is None
+    assert function.state == "failed"
+    assert isinstance(function.error, CompilerException)